@@ -1,6 +1,8 @@
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-your-secret-key-change-in-production'
@@ -23,6 +25,8 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'store.User'
 
 MIDDLEWARE = [
+    'store.middleware.QueueTimeMiddleware',
+    'store.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -32,6 +36,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'store.middleware.TenantMiddleware',
+    'store.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'ecommerce_platform.urls'
@@ -59,6 +64,45 @@ DATABASES = {
     }
 }
 
+# read replicas: safe API requests read from one of these and writes go to
+# 'default'. DB_REPLICA_FILES takes comma-separated SQLite files for trying it
+# locally; add Postgres replica aliases here in production. Read-your-writes
+# pins live in the default cache, so that has to be shared between workers.
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.environ.get('DB_REPLICA_FILES', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+# tenant shards: databases that can hold whole tenants besides 'default',
+# which also keeps the tenant and shard map tables. DB_SHARD_FILES takes
+# comma-separated SQLite files for trying it locally.
+TENANT_SHARDS = []
+for number, name in enumerate(filter(None, os.environ.get('DB_SHARD_FILES', '').split(',')), start=1):
+    DATABASES[f'shard{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / name.strip(),
+    }
+    TENANT_SHARDS.append(f'shard{number}')
+
+# the test suite moves tenants onto this one; it only joins TENANT_SHARDS inside those tests
+if sys.argv[1:2] == ['test']:
+    DATABASES['test_shard'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.test_shard.sqlite3',
+    }
+
+# seconds a cached tenant -> shard entry is trusted; needs a shared cache with more than one process
+TENANT_SHARD_MAP_TTL = 30
+
+DATABASE_ROUTERS = ['store.routers.TenantShardRouter', 'store.routers.PrimaryReplicaRouter']
+
+# seconds a client reads from the primary after writing, to cover replication lag
+DATABASE_PRIMARY_PIN_SECONDS = 5
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -76,13 +120,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # rest settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'store.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson when it is installed, DRF's stdlib json otherwise
+    'DEFAULT_RENDERER_CLASSES': (
+        'store.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'store.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'store.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_THROTTLE_CLASSES': (
+        'store.throttling.TenantRateThrottle',
+    ),
 }
 
+# fail requests that go over a view's query_budgets (turned on in CI)
+QUERY_BUDGET_ENFORCE = os.environ.get('QUERY_BUDGET_ENFORCE') == '1'
+
 # jwt settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
@@ -94,4 +156,69 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# how long a user's is_active/role/tenant state is trusted before it is re-checked
+JWT_USER_STATE_TTL = 30
+
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
+# locmem is per process; point 'default' at a shared backend (redis, memcached)
+# in production so invalidations reach every worker
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce-platform',
+    }
+}
+
+# per-tenant product list/detail/categories response cache
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300
+
+# tenant resolution cache (per process)
+TENANT_CACHE_MAX_SIZE = 1024
+TENANT_CACHE_TTL = 300
+TENANT_CACHE_NEGATIVE_TTL = 30
+
+# order side effects, delivered by `manage.py run_outbox`; handlers per topic, '*' for all
+OUTBOX_HANDLERS = {
+    '*': ['store.outbox.log_event'],
+}
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_RETRY_BASE_SECONDS = 5
+OUTBOX_RETRY_MAX_SECONDS = 3600
+
+# how long stock reservations hold stock, in seconds; release_reservations frees expired ones
+STOCK_RESERVATION_TTL = 900
+
+# Idempotency-Key on POST /orders/: how long responses are kept, and when an
+# unfinished first request is presumed dead
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_CLAIM_TIMEOUT = 60
+
+# token buckets per route class, for each client (user or IP) and each tenant;
+# THROTTLE_DISABLED=1 turns them off, e.g. for load tests
+THROTTLE_RATES = {
+    'read': {'client': '1200/min', 'tenant': '12000/min'},
+    'write': {'client': '300/min', 'tenant': '3000/min'},
+    'search': {'client': '120/min', 'tenant': '1200/min'},
+    'export': {'client': '10/min', 'tenant': '30/min'},
+    'analytics': {'client': '60/min', 'tenant': '300/min'},
+    'register': {'client': '5/min', 'tenant': '100/min'},
+    'auth': {'client': '20/min', 'tenant': '1000/min'},
+}
+if os.environ.get('THROTTLE_DISABLED') == '1':
+    THROTTLE_RATES = {}
+# set to share buckets between processes (needs a shared cache backend)
+THROTTLE_CACHE_ALIAS = None
+# shed these scopes with 503s while the average X-Request-Start queue time is above the threshold
+THROTTLE_SHED_SCOPES = ['search', 'register', 'export', 'analytics']
+THROTTLE_SHED_QUEUE_MS = 200
+
+# request metrics at /metrics (Prometheus); send the token as "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_SLOW_QUERY_MS = 200
+# "X-Profile: <token>" runs that request under cProfile
+METRICS_PROFILE_TOKEN = os.environ.get('METRICS_PROFILE_TOKEN')
+METRICS_PROFILE_DIR = os.environ.get('METRICS_PROFILE_DIR')
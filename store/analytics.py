@@ -0,0 +1,251 @@
+"""
+Per-tenant sales analytics served from daily rollup tables.
+
+Placing an order or changing its status adds its deltas to ``DailySales``,
+``DailyStatusCount`` and ``DailyProductSales`` in the same transaction, so
+reports read a few rows per day however many orders a store has. Cancelled
+orders count towards their status but not towards sales. ``backfill``
+rebuilds a tenant's rollups from its orders.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem, DailySales, DailyStatusCount, DailyProductSales
+from . import sharding
+
+CANCELLED = 'cancelled'
+
+# longest range the analytics endpoint reports on, in days
+MAX_RANGE_DAYS = 366
+
+
+def add(model, rows, keys, using, latest=()):
+    """
+    Add each row's counters to the ``model`` row with the same ``keys``,
+    creating it if missing, in a single INSERT ... ON CONFLICT DO UPDATE
+    (SQLite and PostgreSQL both speak it). Fields in ``latest`` take the new
+    value instead of being summed. Rows must not repeat a key.
+    """
+    if not rows:
+        return
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    names = list(rows[0])
+    fields = [model._meta.get_field(name) for name in names]
+
+    updates = []
+    for name, field in zip(names, fields):
+        column = quote(field.column)
+        if name in keys:
+            continue
+        if name in latest:
+            updates.append(f'{column} = EXCLUDED.{column}')
+        else:
+            updates.append(f'{column} = {table}.{column} + EXCLUDED.{column}')
+
+    row = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    sql = (
+        f"INSERT INTO {table} ({', '.join(quote(field.column) for field in fields)}) "
+        f"VALUES {', '.join([row] * len(rows))} "
+        f"ON CONFLICT ({', '.join(quote(model._meta.get_field(name).column) for name in keys)}) "
+        f"DO UPDATE SET {', '.join(updates)}"
+    )
+    params = [field.get_db_prep_save(values[name], connection) for values in rows for name, field in zip(names, fields)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def order_date(order):
+    return timezone.localdate(order.created_at)
+
+
+def add_sales(changes, using):
+    """
+    Add or remove orders' sales. ``changes`` are ``(order, lines, sign)``
+    with ``sign`` 1 to add and -1 to remove, and ``lines`` the order's
+    ``(product_id, product_name, quantity, subtotal)`` tuples.
+    """
+    days = {}
+    products = {}
+    for order, lines, sign in changes:
+        key = (order.tenant_id, order_date(order))
+        day = days.setdefault(key, {
+            'tenant_id': key[0], 'date': key[1], 'orders': 0, 'items': 0, 'revenue': Decimal('0'),
+        })
+        day['orders'] += sign
+        day['revenue'] += sign * order.total_amount
+        for product_id, product_name, quantity, subtotal in lines:
+            row = products.setdefault(key + (product_id,), {
+                'tenant_id': key[0], 'date': key[1], 'product_id': product_id,
+                'product_name': product_name, 'quantity': 0, 'revenue': Decimal('0'),
+            })
+            row['quantity'] += sign * quantity
+            row['revenue'] += sign * subtotal
+            day['items'] += sign * quantity
+
+    add(DailySales, list(days.values()), ['tenant_id', 'date'], using)
+    add(DailyProductSales, list(products.values()), ['tenant_id', 'date', 'product_id'], using, latest=['product_name'])
+
+
+def record_order(order, lines, using):
+    """Count a just-placed order; call it in the transaction that created it"""
+    add(DailyStatusCount, [{
+        'tenant_id': order.tenant_id, 'date': order_date(order), 'status': order.status, 'count': 1,
+    }], ['tenant_id', 'date', 'status'], using)
+    if order.status != CANCELLED:
+        add_sales([(order, lines, 1)], using)
+
+
+def record_order_deleted(order, using):
+    """Take a deleted order out of the rollups; call it before deleting, in the same transaction"""
+    add(DailyStatusCount, [{
+        'tenant_id': order.tenant_id, 'date': order_date(order), 'status': order.status, 'count': -1,
+    }], ['tenant_id', 'date', 'status'], using)
+    if order.status != CANCELLED:
+        lines = OrderItem.objects.using(using).filter(order_id=order.pk).values_list(
+            'product_id', 'product__name', 'quantity', 'subtotal'
+        )
+        add_sales([(order, list(lines), -1)], using)
+
+
+def record_status_changes(changes, using):
+    """
+    Move orders between statuses in the rollups. ``changes`` are
+    ``(order, old_status)`` pairs, with the order already in its new status.
+    """
+    counts = defaultdict(int)
+    for order, old_status in changes:
+        day = order_date(order)
+        counts[(order.tenant_id, day, old_status)] -= 1
+        counts[(order.tenant_id, day, order.status)] += 1
+    add(DailyStatusCount, [
+        {'tenant_id': tenant_id, 'date': day, 'status': status, 'count': count}
+        for (tenant_id, day, status), count in counts.items() if count
+    ], ['tenant_id', 'date', 'status'], using)
+
+    # only cancelling or un-cancelling changes the sales figures
+    signs = {
+        order.pk: -1 if order.status == CANCELLED else 1
+        for order, old_status in changes
+        if (old_status == CANCELLED) != (order.status == CANCELLED)
+    }
+    if not signs:
+        return
+
+    lines = defaultdict(list)
+    items = OrderItem.objects.using(using).filter(order_id__in=signs).values_list(
+        'order_id', 'product_id', 'product__name', 'quantity', 'subtotal'
+    )
+    for order_id, *line in items:
+        lines[order_id].append(line)
+    add_sales([(order, lines[order.pk], signs[order.pk]) for order, _ in changes if order.pk in signs], using)
+
+
+def record_status_change(order, old_status, using):
+    """Move an order from ``old_status`` to its current status in the rollups"""
+    record_status_changes([(order, old_status)], using)
+
+
+def backfill(tenant_id, batch_size=1000):
+    """
+    Rebuild a tenant's rollups from its orders and return how many orders
+    were counted. Orders placed while it runs can be missed or counted
+    twice, so run it when the store is quiet.
+    """
+    database = sharding.database_for(tenant_id)
+    with sharding.tenant_context(tenant_id), transaction.atomic(using=database):
+        for model in (DailySales, DailyStatusCount, DailyProductSales):
+            model.objects.filter(tenant_id=tenant_id).delete()
+
+        orders = Order.objects.filter(tenant_id=tenant_id).annotate(day=TruncDate('created_at')).order_by()
+        statuses = orders.values('day', 'status').annotate(count=Count('id'))
+        DailyStatusCount.objects.bulk_create([
+            DailyStatusCount(tenant_id=tenant_id, date=row['day'], status=row['status'], count=row['count'])
+            for row in statuses
+        ], batch_size=batch_size)
+
+        items = OrderItem.objects.filter(
+            order__tenant_id=tenant_id
+        ).exclude(order__status=CANCELLED).annotate(day=TruncDate('order__created_at')).order_by()
+        items_by_day = dict(items.values('day').annotate(items=Sum('quantity')).values_list('day', 'items'))
+
+        sales = orders.exclude(status=CANCELLED).values('day').annotate(orders=Count('id'), revenue=Sum('total_amount'))
+        DailySales.objects.bulk_create([
+            DailySales(
+                tenant_id=tenant_id, date=row['day'], orders=row['orders'],
+                items=items_by_day.get(row['day']) or 0, revenue=row['revenue'],
+            )
+            for row in sales
+        ], batch_size=batch_size)
+
+        products = items.values('day', 'product_id').annotate(
+            quantity=Sum('quantity'), revenue=Sum('subtotal'), product_name=Max('product__name'),
+        )
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(
+                tenant_id=tenant_id, date=row['day'], product_id=row['product_id'],
+                product_name=row['product_name'], quantity=row['quantity'], revenue=row['revenue'],
+            )
+            for row in products
+        ], batch_size=batch_size)
+
+        return sum(row['count'] for row in statuses)
+
+
+def money(value):
+    return str((value or Decimal('0')).quantize(Decimal('0.01')))
+
+
+def summary(tenant_id, start, end, top=10):
+    """Sales per day, order counts per status and the top products from ``start`` to ``end`` inclusive"""
+    in_range = {'tenant_id': tenant_id, 'date__range': (start, end)}
+
+    sales = {
+        row['date']: row
+        for row in DailySales.objects.filter(**in_range).values('date', 'orders', 'items', 'revenue')
+    }
+    days = []
+    day = start
+    while day <= end:
+        row = sales.get(day, {})
+        days.append({
+            'date': day.isoformat(),
+            'orders': row.get('orders', 0),
+            'items': row.get('items', 0),
+            'revenue': money(row.get('revenue')),
+        })
+        day += timedelta(days=1)
+
+    statuses = DailyStatusCount.objects.filter(**in_range).values('status').annotate(total=Sum('count')).order_by()
+    products = DailyProductSales.objects.filter(**in_range).values('product_id').annotate(
+        name=Max('product_name'), units=Sum('quantity'), sales=Sum('revenue'),
+    ).order_by('-sales', 'product_id')[:top]
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'totals': {
+            'orders': sum(row['orders'] for row in sales.values()),
+            'items': sum(row['items'] for row in sales.values()),
+            'revenue': money(sum((row['revenue'] for row in sales.values()), Decimal('0'))),
+        },
+        'status_counts': {row['status']: row['total'] for row in statuses if row['total']},
+        'days': days,
+        'top_products': [
+            {
+                'product_id': row['product_id'],
+                'name': row['name'],
+                'quantity': row['units'],
+                'revenue': money(row['sales']),
+            }
+            for row in products
+        ],
+    }
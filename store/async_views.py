@@ -0,0 +1,205 @@
+"""
+Async versions of the hot read endpoints, for ASGI deployments.
+
+These are plain Django async views rather than DRF viewsets, which only run
+synchronously. They authenticate, check the tenant, filter, paginate and
+serialize the same way as the sync views, using the async ORM throughout, so
+a slow client or query holds a coroutine instead of a worker thread. Every
+relation a serializer reads is loaded up front, because a lazy load would
+raise ``SynchronousOnlyOperation`` here.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from .authentication import ClaimsJWTAuthentication
+from .models import Product, Order
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .search import search_products
+from .serializers import ProductSerializer, OrderSerializer, OrderListSerializer
+from .throttling import TenantRateThrottle
+from .views import filter_products, product_fields, product_values, scope_orders, trim_products
+from . import catalog_cache, conditional, throttling
+
+
+def json_response(data, status=200):
+    response = HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+    # kept for the catalog cache, like a DRF Response
+    response.data = data
+    return response
+
+
+def async_api_view(view):
+    """
+    Run an async view behind the same checks as the DRF read views
+    (JWT authentication, IsAuthenticated, IsTenantUser) and hand it a DRF
+    ``Request`` so pagination, serializers and conditional helpers work
+    unchanged.
+    """
+    @functools.wraps(view)
+    async def wrapper(django_request, *args, **kwargs):
+        if django_request.method not in ('GET', 'HEAD'):
+            return json_response({'detail': f'Method "{django_request.method}" not allowed.'}, status=405)
+
+        authenticator = ClaimsJWTAuthentication()
+        try:
+            result = await authenticator.aauthenticate(django_request)
+        except exceptions.AuthenticationFailed as exc:
+            result, detail = None, exc.detail
+        else:
+            detail = 'Authentication credentials were not provided.'
+
+        if result is None:
+            # token errors already carry a {'detail': ...} body
+            response = json_response(detail if isinstance(detail, dict) else {'detail': detail}, status=401)
+            response['WWW-Authenticate'] = authenticator.authenticate_header(django_request)
+            return response
+
+        user, token = result
+        tenant = await django_request.atenant()
+        if tenant is not None and tenant.id != user.tenant_id:
+            return json_response({'detail': 'You do not have permission to perform this action.'}, status=403)
+
+        request = Request(django_request)
+        request.user = user
+        request.auth = token
+
+        scope = 'search' if request.query_params.get('search') else 'read'
+        try:
+            throttling.check(request, scope, TenantRateThrottle().get_ident(request))
+            return await view(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            # shaped like DRF's exception handler
+            detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            response = json_response(detail, status=exc.status_code)
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = str(exc.wait)
+            return response
+
+    return wrapper
+
+
+def not_found(model):
+    return json_response({'detail': f'No {model._meta.object_name} matches the given query.'}, status=404)
+
+
+def lazy_products(request):
+    """Coroutine function returning the filtered products, searching at most once"""
+    queryset = None
+
+    async def get_queryset():
+        nonlocal queryset
+        if queryset is None:
+            tenant_id = request.user.tenant_id
+            search = request.query_params.get('search', None)
+            # the search index speaks raw SQL, which has no async API
+            search_ids = await sync_to_async(search_products)(tenant_id, search) if search else None
+            queryset = filter_products(tenant_id, request.query_params, search_ids)
+        return queryset
+
+    return get_queryset
+
+
+@async_api_view
+async def product_list(request):
+    tenant_id = request.user.tenant_id
+    get_queryset = lazy_products(request)
+
+    async def validators():
+        return await conditional.alist_validators(
+            await get_queryset(), 'product-list', tenant_id, conditional.request_params(request),
+        )
+
+    async def render():
+        fields = product_fields(request.query_params)
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(product_values(await get_queryset(), fields), request)
+        data = ProductSerializer(fields=fields, context={'request': request}).represent_values(page)
+        return json_response(paginator.get_paginated_response(data).data)
+
+    # cached apart from the sync list, whose page links point at other urls
+    return await catalog_cache.acached_response(
+        request, 'product-list-async', render, validators=validators, respond=json_response,
+    )
+
+
+@async_api_view
+async def product_detail(request, pk):
+    tenant_id = request.user.tenant_id
+    get_queryset = lazy_products(request)
+    # the sync view sees the pk as a url string; matching it shares cache entries and etags
+    pk = str(pk)
+
+    async def validators():
+        return await conditional.aobject_validators(await get_queryset(), pk, 'product-detail', tenant_id)
+
+    async def render():
+        fields = product_fields(request.query_params)
+        product = await trim_products(await get_queryset(), fields).filter(pk=pk).afirst()
+        if product is None:
+            return not_found(Product)
+        return json_response(ProductSerializer(product, fields=fields, context={'request': request}).data)
+
+    return await catalog_cache.acached_response(
+        request, 'product-detail', render, validators=validators, respond=json_response, pk=pk,
+    )
+
+
+@async_api_view
+async def product_categories(request):
+    async def render():
+        categories = Product.objects.filter(
+            tenant_id=request.user.tenant_id
+        ).values_list('category', flat=True).distinct()
+        return json_response({'categories': [category async for category in categories]})
+
+    return await catalog_cache.acached_response(request, 'product-categories', render, respond=json_response)
+
+
+@async_api_view
+async def my_orders(request):
+    queryset = Order.objects.filter(
+        tenant_id=request.user.tenant_id,
+        customer_id=request.user.id
+    )
+
+    etag, last_modified = await conditional.alist_validators(
+        queryset, 'my-orders', request.user.id, conditional.request_params(request),
+    )
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    queryset = queryset.select_related('customer').annotate(items_count=Count('items'))
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    data = OrderListSerializer(page, many=True).data
+    return conditional.set_validators(
+        json_response(paginator.get_paginated_response(data).data), etag, last_modified
+    )
+
+
+@async_api_view
+async def order_detail(request, pk):
+    # the scoped queryset already limits reads to what CanManageOrder allows
+    queryset = scope_orders(request.user, request.query_params)
+    pk = str(pk)
+
+    etag, last_modified = await conditional.aobject_validators(queryset, pk, 'order-detail', request.user.id)
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    order = await queryset.select_related(
+        'customer', 'assigned_staff'
+    ).prefetch_related('items__product').filter(pk=pk).afirst()
+    if order is None:
+        return not_found(Order)
+
+    data = OrderSerializer(order, context={'request': request}).data
+    return conditional.set_validators(json_response(data), etag, last_modified)
@@ -0,0 +1,190 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .tenancy import tenant_cache
+from . import sharding
+
+USER_STATE_TTL = getattr(settings, 'JWT_USER_STATE_TTL', 30)
+
+
+def user_state_cache_key(user_id):
+    return f'auth:user-state:{user_id}'
+
+
+def get_user_state(user_id):
+    """Return ``(is_active, role, tenant_id, is_superuser)`` for a user, or None if it is gone"""
+    key = user_state_cache_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = User.objects.filter(pk=user_id).values_list(
+            'is_active', 'role', 'tenant_id', 'is_superuser'
+        ).first()
+        # deleted users are cached as an empty tuple so they stay rejected
+        state = tuple(row) if row else ()
+        cache.set(key, state, USER_STATE_TTL)
+    return state or None
+
+
+async def aget_user_state(user_id):
+    """Async ``get_user_state()``; only the database read awaits, see ``catalog_cache.acached_response``"""
+    key = user_state_cache_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = await User.objects.filter(pk=user_id).values_list(
+            'is_active', 'role', 'tenant_id', 'is_superuser'
+        ).afirst()
+        state = tuple(row) if row else ()
+        cache.set(key, state, USER_STATE_TTL)
+    return state or None
+
+
+class ClaimsUser:
+    """
+    Request user built from verified JWT claims.
+
+    ``id``, ``username``, ``role`` and ``tenant_id`` come from the token and
+    ``tenant`` from the tenant cache. Any other attribute loads the ``User``
+    row on first access, so views that stay on the claims never query it.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token, state):
+        self.token = token
+        self.is_active, _, _, self.is_superuser = state
+
+    def _claim(self, name):
+        if name in self.token:
+            return self.token[name]
+        # tokens issued before the claim existed
+        return getattr(self._user, name)
+
+    @cached_property
+    def id(self):
+        # simplejwt may serialize the id claim as a string
+        return User._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def username(self):
+        return self._claim('username')
+
+    @cached_property
+    def role(self):
+        return self._claim('role')
+
+    @cached_property
+    def tenant_id(self):
+        return self._claim('tenant_id')
+
+    @cached_property
+    def tenant(self):
+        return tenant_cache.get_by_id(self.tenant_id)
+
+    @cached_property
+    def _user(self):
+        return User.objects.get(pk=self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._user, name)
+
+    def __eq__(self, other):
+        if isinstance(other, (ClaimsUser, User)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return self.username
+
+
+def request_token(request):
+    """
+    The request's validated bearer token, or None without one; raises
+    ``AuthenticationFailed`` for a bad one. Replica routing needs the user
+    before DRF authenticates, so the result is kept on the request and the
+    token is only checked once.
+    """
+    request = getattr(request, '_request', request)
+    if not hasattr(request, '_validated_token'):
+        authentication = ClaimsJWTAuthentication()
+        header = authentication.get_header(request)
+        try:
+            raw_token = authentication.get_raw_token(header) if header is not None else None
+            request._validated_token = None if raw_token is None else authentication.get_validated_token(raw_token)
+        except AuthenticationFailed as exc:
+            request._validated_token = exc
+
+    if isinstance(request._validated_token, AuthenticationFailed):
+        raise request._validated_token
+    return request._validated_token
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the token claims instead of loading the user.
+
+    Deactivated, deleted or re-roled users are still rejected, through a
+    short-lived cached state check rather than a query per request.
+    """
+
+    def authenticate(self, request):
+        validated_token = request_token(request)
+        if validated_token is None:
+            return None
+        sharding.activate(validated_token.get('tenant_id'))
+        return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        return self.user_from_state(validated_token, get_user_state(user_id))
+
+    async def aauthenticate(self, request):
+        """Async ``authenticate()`` for plain Django async views"""
+        # signature checks are CPU only; just the state lookup awaits
+        validated_token = request_token(request)
+        if validated_token is None:
+            return None
+        sharding.activate(validated_token.get('tenant_id'))
+        user_id = self.get_user_id(validated_token)
+        user = self.user_from_state(validated_token, await aget_user_state(user_id))
+        return user, validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise AuthenticationFailed('Token contained no recognizable user identification', code='token_not_valid')
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        # the user row lives on the token's tenant's shard
+        sharding.activate(validated_token.get('tenant_id'))
+        return validated_token
+
+    def user_from_state(self, validated_token, state):
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+
+        is_active, role, tenant_id, _ = state
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        # role or tenant changed since the token was issued
+        if validated_token.get('role', role) != role or validated_token.get('tenant_id', tenant_id) != tenant_id:
+            raise AuthenticationFailed('Token is no longer valid for this user', code='token_not_valid')
+
+        return ClaimsUser(validated_token, state)
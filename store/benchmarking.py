@@ -0,0 +1,75 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'be', 'da', 'fu', 'go', 'hi', 'ja', 'pe', 'zu']
+
+# 4096 made-up words; fake_words draws them with a Zipf-like skew like real catalog text
+VOCABULARY = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+
+def fake_word(rng, rank=None):
+    if rank is None:
+        rank = int(rng.paretovariate(1.0)) - 1
+    return VOCABULARY[min(rank, len(VOCABULARY) - 1)]
+
+
+def fake_words(rng, count):
+    return ' '.join(fake_word(rng) for _ in range(count))
+
+
+# tenants made by seed_benchmark, which run_benchmark drives
+SEED_SUBDOMAIN_PREFIX = 'bench-seed-'
+SEED_PASSWORD = 'Bench!pass-123'
+
+
+def skewed_index(rng, count):
+    """0 about half the time, 1 a sixth, ... like real popularity"""
+    return min(int(rng.paretovariate(1.0)) - 1, count - 1)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples, elapsed=None):
+    """Summarize per-call durations (seconds) as milliseconds and calls per second"""
+    elapsed = elapsed if elapsed is not None else sum(samples)
+    return {
+        'calls': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'per_second': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back"""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
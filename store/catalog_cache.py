@@ -0,0 +1,171 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from . import conditional, routers, sharding
+
+CATALOG_CACHE_ALIAS = getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+class CacheStats:
+    """Hit/miss counters for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[CATALOG_CACHE_ALIAS]
+
+
+def version_key(tenant_id):
+    return f'catalog:version:{tenant_id}'
+
+
+def get_version(tenant_id):
+    cache = get_cache()
+    version = cache.get(version_key(tenant_id))
+    if version is None:
+        # seeded from the clock so an evicted version never comes back to a
+        # number that older entries were stored under
+        cache.add(version_key(tenant_id), time.time_ns(), None)
+        version = cache.get(version_key(tenant_id))
+    return version
+
+
+def bump_version(tenant_id):
+    # a timestamp rather than incr(), so the version also says when the
+    # catalog last changed (see may_store)
+    get_cache().set(version_key(tenant_id), time.time_ns(), None)
+
+
+def invalidate_tenant(tenant_id):
+    """
+    Invalidate every cached catalog response for a tenant once the current
+    transaction commits, so no reader can cache pre-commit rows under the
+    new version.
+    """
+    transaction.on_commit(lambda: bump_version(tenant_id), using=sharding.database_for(tenant_id))
+
+
+def response_key(tenant_id, version, name, request, **parts):
+    params = sorted(request.query_params.lists())
+    raw = repr((request.get_host(), params, sorted(parts.items())))
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'catalog:{tenant_id}:{version}:{name}:{digest}'
+
+
+def may_store(version):
+    """
+    Whether a response rendered now may be cached under ``version``. A
+    replica can lag just after a change, so replica reads aren't cached until
+    the primary pin window since the last change has passed.
+    """
+    if routers.current_replica() is None:
+        return True
+    return time.time_ns() - version > routers.PRIMARY_PIN_SECONDS * 1_000_000_000
+
+
+def cached_response(request, name, render, validators=None, **parts):
+    """
+    Serve a tenant's catalog response from the cache, or call ``render`` and
+    cache its data if it succeeded. Permissions must already be checked.
+
+    ``validators`` returns ``(etag, last_modified)`` for conditional GETs. It
+    is only called on a miss; hits reuse the stored pair, so a cached
+    response can be answered with a 304 without touching the database.
+    """
+    cache = get_cache()
+    version = get_version(request.user.tenant_id)
+    key = response_key(request.user.tenant_id, version, name, request, **parts)
+
+    entry = cache.get(key)
+    if entry is not None:
+        stats.hit()
+        etag, last_modified, data = entry
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            response = conditional.set_validators(Response(data), etag, last_modified)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    stats.miss()
+    etag, last_modified = validators() if validators else (None, None)
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    response = render()
+    if response.status_code == 200:
+        if may_store(version):
+            cache.set(key, (etag, last_modified, response.data), CATALOG_CACHE_TIMEOUT)
+        conditional.set_validators(response, etag, last_modified)
+        response['X-Cache'] = 'MISS'
+    return response
+
+
+async def acached_response(request, name, render, validators=None, respond=None, **parts):
+    """
+    Async ``cached_response()``. ``render`` and ``validators`` are coroutine
+    functions, ``render`` returning a response with a ``data`` attribute, and
+    ``respond`` builds a response from cached data.
+
+    Cache calls stay synchronous: Django's backends have no native async API
+    and their ``a*`` methods only move the call to a thread, which costs more
+    than the lookup itself.
+    """
+    cache = get_cache()
+    version = get_version(request.user.tenant_id)
+    key = response_key(request.user.tenant_id, version, name, request, **parts)
+
+    entry = cache.get(key)
+    if entry is not None:
+        stats.hit()
+        etag, last_modified, data = entry
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            response = conditional.set_validators(respond(data), etag, last_modified)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    stats.miss()
+    etag, last_modified = await validators() if validators else (None, None)
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+
+    response = await render()
+    if response.status_code == 200:
+        if may_store(version):
+            cache.set(key, (etag, last_modified, response.data), CATALOG_CACHE_TIMEOUT)
+        conditional.set_validators(response, etag, last_modified)
+        response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,342 @@
+import uuid
+
+from django.db import connections, transaction
+from django.db.models import Case, F, Prefetch, Q, Subquery, When, prefetch_related_objects
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Order, OrderItem, Product
+from . import analytics, catalog_cache, outbox, sharding
+
+
+# most orders one staff member can claim per request
+MAX_CLAIM = 20
+
+# most orders a bulk status change or staff assignment can touch per request
+MAX_BULK_ORDERS = 500
+
+# what bulk actions load, enough for the rollups and outbox payloads
+BULK_FIELDS = (
+    'id', 'tenant_id', 'order_number', 'status', 'customer_id',
+    'assigned_staff_id', 'total_amount', 'created_at',
+)
+
+
+def generate_order_number():
+    return f"ORD-{uuid.uuid4().hex[:8].upper()}"
+
+
+def merge_quantities(items):
+    """Collapse order lines into ``{product_id: quantity}``, keeping first-seen order"""
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return quantities
+
+
+def take_stock(tenant_id, quantities, products, reserved=False):
+    """
+    Decrement stock for every product in one conditional UPDATE.
+
+    Each row is only touched while its available stock (``stock -
+    reserved``) covers the quantity, so if a concurrent checkout got there
+    first fewer rows are updated and the caller's transaction is rolled back
+    instead of overselling. With ``reserved`` the quantities are held by a
+    reservation being converted, and come out of ``reserved`` as well.
+    """
+    guard = Q()
+    for product_id, quantity in quantities.items():
+        if reserved:
+            guard |= Q(pk=product_id, stock__gte=quantity)
+        else:
+            guard |= Q(pk=product_id, stock__gte=F('reserved') + quantity)
+
+    changes = {
+        'stock': Case(*[
+            When(pk=product_id, then=F('stock') - quantity)
+            for product_id, quantity in quantities.items()
+        ]),
+        # update() skips auto_now
+        'updated_at': timezone.now(),
+    }
+    if reserved:
+        changes['reserved'] = Case(*[
+            When(pk=product_id, then=F('reserved') - quantity)
+            for product_id, quantity in quantities.items()
+        ])
+    updated = Product.objects.filter(guard, tenant_id=tenant_id).update(**changes)
+
+    if updated != len(quantities):
+        current = {
+            pk: stock if reserved else stock - held
+            for pk, stock, held in Product.objects.filter(pk__in=quantities).values_list('pk', 'stock', 'reserved')
+        }
+        for product_id, quantity in quantities.items():
+            if current.get(product_id, 0) < quantity:
+                product = products[product_id]
+                raise serializers.ValidationError(
+                    f"Insufficient stock for {product.name}. Available: {max(current.get(product_id, 0), 0)}"
+                )
+        # stock came back between the UPDATE and the re-read, but some rows still weren't taken
+        raise serializers.ValidationError("Stock changed while placing the order. Please try again.")
+
+    # stock is part of the cached catalog responses
+    catalog_cache.invalidate_tenant(tenant_id)
+
+
+def place_order(*, tenant_id, customer_id, items, reserved=False, **order_fields):
+    """
+    Create an order and take its stock in a fixed number of queries.
+
+    One SELECT of the products, one guarded stock UPDATE, one INSERT for the
+    order, one bulk INSERT for the items, three upserts into the sales
+    rollups and one outbox INSERT, however many lines the order has. The order comes back with
+    its items and their products prefetched. ``reserved`` means the items
+    are held by a reservation the caller has just taken.
+    """
+    quantities = merge_quantities(items)
+    if not quantities:
+        raise serializers.ValidationError({'items': "At least one item is required."})
+    database = sharding.database_for(tenant_id)
+
+    with sharding.tenant_context(tenant_id), transaction.atomic(using=database):
+        products = Product.objects.filter(
+            tenant_id=tenant_id, pk__in=quantities
+        ).only('id', 'name', 'price', 'stock', 'reserved')
+        products = {product.pk: product for product in products}
+
+        total = 0
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if product is None:
+                raise serializers.ValidationError({'items': f"Product {product_id} not found."})
+
+            # stock check; units other customers have reserved aren't for sale
+            available = product.stock if reserved else max(product.stock - product.reserved, 0)
+            if available < quantity:
+                raise serializers.ValidationError(
+                    f"Insufficient stock for {product.name}. Available: {available}"
+                )
+            total += product.price * quantity
+
+        take_stock(tenant_id, quantities, products, reserved=reserved)
+
+        order = Order.objects.create(
+            tenant_id=tenant_id,
+            customer_id=customer_id,
+            order_number=generate_order_number(),
+            total_amount=total,
+            **order_fields,
+        )
+
+        # bulk_create skips OrderItem.save, so the subtotal is computed here
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=item['product_id'],
+                quantity=item['quantity'],
+                price=products[item['product_id']].price,
+                subtotal=products[item['product_id']].price * item['quantity'],
+            )
+            for item in items
+        ])
+
+        analytics.record_order(order, [
+            (product_id, products[product_id].name, quantity, products[product_id].price * quantity)
+            for product_id, quantity in quantities.items()
+        ], using=database)
+        outbox.publish(tenant_id, 'order.created', outbox.order_payload(order))
+
+    prefetch_related_objects([order], Prefetch('items', queryset=OrderItem.objects.select_related('product')))
+    return order
+
+
+def change_status(order, new_status):
+    """
+    Move ``order`` to ``new_status`` and update the sales rollups with it.
+
+    The UPDATE only matches while the order still has the status we read,
+    so two concurrent changes can't both move it out of the same status.
+    """
+    database = sharding.database_for(order.tenant_id)
+    now = timezone.now()
+
+    with transaction.atomic(using=database):
+        while order.status != new_status:
+            old_status = order.status
+            changed = Order.objects.filter(pk=order.pk, status=old_status).update(status=new_status, updated_at=now)
+            if changed:
+                order.status, order.updated_at = new_status, now
+                analytics.record_status_change(order, old_status, using=database)
+                outbox.publish(order.tenant_id, 'order.status_changed', outbox.order_payload(order, old_status=old_status))
+                break
+            # lost a race; start again from the status that won
+            order.status = Order.objects.filter(pk=order.pk).values_list('status', flat=True).get()
+
+    return order
+
+
+def delete_order(order):
+    """
+    Delete ``order`` and take it out of the sales rollups. The row is locked
+    first, so a concurrent status change can't move it between the rollup
+    update and the delete.
+    """
+    database = sharding.database_for(order.tenant_id)
+    with transaction.atomic(using=database):
+        order = Order.objects.select_for_update().filter(pk=order.pk).first()
+        if order is None:
+            return
+        analytics.record_order_deleted(order, using=database)
+        outbox.publish(order.tenant_id, 'order.deleted', outbox.order_payload(order))
+        order.delete()
+
+
+def assign_staff(order, staff):
+    """Assign ``staff`` to ``order`` and queue the side effects with it"""
+    with transaction.atomic(using=sharding.database_for(order.tenant_id)):
+        order.assigned_staff = staff
+        order.save()
+        outbox.publish(order.tenant_id, 'order.staff_assigned', outbox.order_payload(order))
+    return order
+
+
+def update_returning(queryset, values, using, annotations=None):
+    """
+    ``queryset.update(**values)`` that returns the updated rows as model
+    instances, read back by the UPDATE itself with RETURNING (SQLite 3.35+,
+    PostgreSQL). ``annotations`` maps names to expressions that are returned
+    with each row and set on the instances, as ``annotate()`` would.
+    """
+    model = queryset.model
+    fields = model._meta.concrete_fields
+    annotations = annotations or {}
+
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    compiler = query.get_compiler(using)
+    sql, params = compiler.as_sql()
+
+    expressions = [field.get_col(model._meta.db_table) for field in fields]
+    expressions += [expression.resolve_expression(query) for expression in annotations.values()]
+    columns, params = [], list(params)
+    for expression in expressions:
+        column, column_params = compiler.compile(expression)
+        columns.append(column)
+        params.extend(column_params)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {", ".join(columns)}', params)
+        rows = cursor.fetchall()
+
+    converters = compiler.get_converters(expressions)
+    if converters:
+        rows = compiler.apply_converters(rows, converters)
+
+    instances = []
+    for row in rows:
+        instance = model.from_db(using, [field.attname for field in fields], row[:len(fields)])
+        for name, value in zip(annotations, row[len(fields):]):
+            setattr(instance, name, value)
+        instances.append(instance)
+    return instances
+
+
+def claim_orders(staff, count, annotations=None):
+    """
+    Assign up to ``count`` of the oldest unassigned pending orders to
+    ``staff`` and return them, oldest first.
+
+    It is a single UPDATE whose subquery picks the orders with FOR UPDATE
+    SKIP LOCKED, so concurrent claimers take different orders instead of
+    queueing on the same rows. The UPDATE re-checks that each order is
+    still unassigned, so none is claimed twice even without row locks, and
+    RETURNING gives back exactly the rows it changed, with ``annotations``
+    (see ``update_returning``), so nothing is read again.
+    """
+    database = sharding.database_for(staff.tenant_id)
+    unclaimed = Order.objects.filter(tenant_id=staff.tenant_id, status='pending', assigned_staff__isnull=True)
+    now = timezone.now()
+
+    with transaction.atomic(using=database):
+        oldest = unclaimed.select_for_update(skip_locked=True).order_by('created_at', 'id').values('pk')[:count]
+        orders = update_returning(
+            unclaimed.filter(pk__in=Subquery(oldest)), {'assigned_staff_id': staff.id, 'updated_at': now},
+            database, annotations,
+        )
+        if not orders:
+            return []
+
+        orders.sort(key=lambda order: (order.created_at, order.pk))
+        outbox.publish_many(staff.tenant_id, 'order.staff_assigned', [outbox.order_payload(order) for order in orders])
+
+    return orders
+
+
+def writable_orders(user, order_ids):
+    """
+    The orders in ``order_ids`` that ``user`` may change, locked for the
+    rest of the transaction. Same rules as ``CanManageOrder`` for writes:
+    owners change any order of their store, staff only the ones assigned to them.
+    """
+    queryset = Order.objects.filter(tenant_id=user.tenant_id, pk__in=order_ids)
+    if user.role == 'staff':
+        queryset = queryset.filter(assigned_staff_id=user.id)
+    elif user.role != 'store_owner':
+        return {}
+    return {order.pk: order for order in queryset.select_for_update().only(*BULK_FIELDS)}
+
+
+def bulk_results(order_ids, orders, changed):
+    """One ``{'id', 'result'}`` per requested order, result 'updated', 'unchanged' or 'not_found'"""
+    return [
+        {
+            'id': order_id,
+            'result': 'updated' if order_id in changed else 'unchanged' if order_id in orders else 'not_found',
+        }
+        for order_id in order_ids
+    ]
+
+
+def bulk_change_status(user, order_ids, new_status):
+    """
+    ``change_status`` for a batch: one locking SELECT to scope the orders,
+    one UPDATE, and a fixed number of rollup and outbox queries. Orders the
+    user can't change come back as 'not_found'.
+    """
+    database = sharding.database_for(user.tenant_id)
+    now = timezone.now()
+
+    with transaction.atomic(using=database):
+        orders = writable_orders(user, order_ids)
+        changes = [(order, order.status) for order in orders.values() if order.status != new_status]
+        if changes:
+            Order.objects.filter(pk__in=[order.pk for order, _ in changes]).update(status=new_status, updated_at=now)
+            for order, _ in changes:
+                order.status, order.updated_at = new_status, now
+
+            analytics.record_status_changes(changes, using=database)
+            outbox.publish_many(user.tenant_id, 'order.status_changed', [
+                outbox.order_payload(order, old_status=old_status) for order, old_status in changes
+            ])
+
+    return bulk_results(order_ids, orders, {order.pk for order, _ in changes})
+
+
+def bulk_assign_staff(user, order_ids, staff):
+    """``assign_staff`` for a batch, in one locking SELECT and one UPDATE"""
+    database = sharding.database_for(user.tenant_id)
+    now = timezone.now()
+
+    with transaction.atomic(using=database):
+        orders = writable_orders(user, order_ids)
+        changed = [order for order in orders.values() if order.assigned_staff_id != staff.id]
+        if changed:
+            Order.objects.filter(pk__in=[order.pk for order in changed]).update(assigned_staff_id=staff.id, updated_at=now)
+            for order in changed:
+                order.assigned_staff_id, order.updated_at = staff.id, now
+
+            outbox.publish_many(user.tenant_id, 'order.staff_assigned', [outbox.order_payload(order) for order in changed])
+
+    return bulk_results(order_ids, orders, {order.pk for order in changed})
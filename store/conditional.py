@@ -0,0 +1,83 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def request_params(request):
+    return sorted(request.query_params.lists())
+
+
+def list_validators(queryset, *parts):
+    """
+    ETag for a list response, from one aggregate over the filtered rows:
+    newest ``updated_at`` plus the row count, so edits, inserts and deletes
+    all change the tag.
+
+    Lists get no Last-Modified. Deleting a row other than the newest leaves
+    the newest ``updated_at`` as it was, so If-Modified-Since would answer
+    304 for a list that has changed.
+    """
+    stats = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    return make_etag(*parts, stats['count'], stats['last_modified']), None
+
+
+async def alist_validators(queryset, *parts):
+    stats = await queryset.order_by().aaggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    return make_etag(*parts, stats['count'], stats['last_modified']), None
+
+
+def object_validators(queryset, pk, *parts):
+    """ETag and Last-Modified for one row of ``queryset``, or ``(None, None)`` if it isn't there"""
+    try:
+        updated_at = queryset.order_by().filter(pk=pk).values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError, ValidationError):
+        updated_at = None
+
+    if updated_at is None:
+        return None, None
+    return make_etag(*parts, pk, updated_at), updated_at
+
+
+async def aobject_validators(queryset, pk, *parts):
+    try:
+        updated_at = await queryset.order_by().filter(pk=pk).values_list('updated_at', flat=True).afirst()
+    except (TypeError, ValueError, ValidationError):
+        updated_at = None
+
+    if updated_at is None:
+        return None, None
+    return make_etag(*parts, pk, updated_at), updated_at
+
+
+def not_modified(request, etag, last_modified):
+    """Return a 304 (or 412) response if the request's preconditions say so, else None"""
+    if etag is None:
+        return None
+
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    if etag is None:
+        return response
+
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # clients may keep the body but must revalidate before using it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
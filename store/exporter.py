@@ -0,0 +1,125 @@
+import csv
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import OrderItem
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 2000)
+
+ORDER_FIELDS = [
+    'id', 'order_number', 'created_at', 'status', 'customer_id', 'customer__username',
+    'total_amount', 'shipping_address', 'notes',
+]
+ITEM_FIELDS = ['product_id', 'product__name', 'quantity', 'price', 'subtotal']
+
+# what both formats write for an order and for each of its items
+EXPORT_ORDER_FIELDS = [
+    'id', 'order_number', 'created_at', 'status', 'customer_id', 'customer', 'total_amount',
+    'shipping_address', 'notes',
+]
+EXPORT_ITEM_FIELDS = ['product_id', 'product_name', 'quantity', 'price', 'subtotal']
+
+CSV_HEADER = EXPORT_ORDER_FIELDS + EXPORT_ITEM_FIELDS
+
+
+class Echo:
+    """csv.writer target that hands back each row instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def iter_orders(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield orders as dicts with an ``items`` list.
+
+    Orders stream from the database in chunks and each chunk's items are
+    fetched with one query, so memory stays bounded by ``chunk_size``
+    however many orders there are.
+    """
+    batch = []
+    for order in queryset.values(*ORDER_FIELDS).iterator(chunk_size=chunk_size):
+        batch.append(order)
+        if len(batch) >= chunk_size:
+            yield from attach_items(batch, queryset.db)
+            batch = []
+    if batch:
+        yield from attach_items(batch, queryset.db)
+
+
+def attach_items(orders, using):
+    items = defaultdict(list)
+    rows = OrderItem.objects.using(using).filter(order_id__in=[order['id'] for order in orders]).order_by('id')
+    for item in rows.values('order_id', *ITEM_FIELDS):
+        items[item.pop('order_id')].append(item)
+
+    for order in orders:
+        order['items'] = items.get(order['id'], [])
+        yield order
+
+
+def format_datetime(value):
+    """ISO 8601 with microseconds and UTC as Z, like the API's own datetimes"""
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def export_rows(queryset, chunk_size):
+    """Orders with the export field names and formatting, shared by both formats"""
+    for order in iter_orders(queryset, chunk_size):
+        order['customer'] = order.pop('customer__username')
+        order['created_at'] = format_datetime(order['created_at'])
+        for item in order['items']:
+            item['product_name'] = item.pop('product__name')
+        yield order
+
+
+def buffered(lines, size):
+    """
+    Join lines into chunks of ``size``. The first line goes out on its own so
+    the client gets bytes before the first batch is read.
+    """
+    buffer = []
+    first = True
+    for line in lines:
+        buffer.append(line)
+        if first or len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer = []
+            first = False
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_lines(queryset, chunk_size):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+
+    for order in export_rows(queryset, chunk_size):
+        head = [order[field] for field in EXPORT_ORDER_FIELDS]
+        for item in order['items'] or [dict.fromkeys(EXPORT_ITEM_FIELDS, '')]:
+            yield writer.writerow(head + [item[field] for field in EXPORT_ITEM_FIELDS])
+
+
+def ndjson_lines(queryset, chunk_size):
+    for order in export_rows(queryset, chunk_size):
+        yield json.dumps(order, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """One line per order item; orders without items get a single line"""
+    return buffered(csv_lines(queryset, chunk_size), chunk_size)
+
+
+def export_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """One JSON object per order, items nested"""
+    return buffered(ndjson_lines(queryset, chunk_size), chunk_size)
+
+
+EXPORTERS = {
+    'csv': (export_csv, 'text/csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+}
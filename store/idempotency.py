@@ -0,0 +1,161 @@
+"""
+``Idempotency-Key`` support for unsafe endpoints such as ``POST /orders/``.
+
+The first request with a key claims it by inserting an ``IdempotencyKey``
+row, in its own short transaction, so a concurrent duplicate sees the
+claim straight away and gets a 409. The view then runs in a transaction
+that also stores its response on the row, so an order is never committed
+without its stored response. Later requests with the key replay that
+response without running the view. Keys are per tenant and user and last
+``IDEMPOTENCY_KEY_TTL`` seconds.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from . import sharding
+
+HEADER = 'Idempotency-Key'
+
+# how long a key and its stored response are kept
+KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+# after this long an unfinished claim is taken to belong to a crashed request
+CLAIM_TIMEOUT = getattr(settings, 'IDEMPOTENCY_CLAIM_TIMEOUT', 60)
+
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field('key').max_length
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode('utf-8')).hexdigest()
+
+
+def claim(user, key, request_fingerprint):
+    """
+    Insert the key's row, or return the existing one. A row whose claim
+    went stale, or that has expired, is taken over.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=KEY_TTL)
+    for _ in range(2):
+        try:
+            with transaction.atomic(using=sharding.database_for(user.tenant_id)):
+                return IdempotencyKey.objects.create(
+                    tenant_id=user.tenant_id,
+                    user_id=user.id,
+                    key=key,
+                    fingerprint=request_fingerprint,
+                    expires_at=expires_at,
+                ), True
+        except IntegrityError:
+            pass
+
+        existing = IdempotencyKey.objects.filter(tenant_id=user.tenant_id, user_id=user.id, key=key).first()
+        if existing is None:
+            continue
+        stale = existing.status_code is None and existing.created_at <= now - timedelta(seconds=CLAIM_TIMEOUT)
+        if existing.expires_at > now and not stale:
+            return existing, False
+        # only one retrier gets to take it over; an UPDATE rather than a delete and insert
+        changes = {
+            'fingerprint': request_fingerprint, 'status_code': None, 'response_body': None,
+            'created_at': now, 'expires_at': expires_at,
+        }
+        if IdempotencyKey.objects.filter(pk=existing.pk, created_at=existing.created_at).update(**changes):
+            for name, value in changes.items():
+                setattr(existing, name, value)
+            return existing, True
+
+    # lost the race to reclaim it twice; someone else is running it now
+    return None, False
+
+
+def store(record, response):
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status_code=response.status_code,
+        response_body=response.data,
+    )
+
+
+def idempotent(method):
+    """
+    Make a viewset create/action method honour the ``Idempotency-Key``
+    header. Requests without one run as before. Responses below 500 are
+    stored and replayed, including the 4xx of an ``APIException`` the view
+    raised (its changes are rolled back first); a 5xx or any other
+    exception frees the key for a retry.
+    """
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return method(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        request_fingerprint = fingerprint(request)
+        record, claimed = claim(request.user, key, request_fingerprint)
+
+        if not claimed:
+            if record is not None and record.fingerprint != request_fingerprint:
+                return Response(
+                    {'error': f'This {HEADER} was already used with a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if record is None or record.status_code is None:
+                return Response(
+                    {'error': f'A request with this {HEADER} is still being processed'},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={'Retry-After': '1'}
+                )
+            return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+        database = sharding.database_for(request.user.tenant_id)
+        try:
+            with transaction.atomic(using=database):
+                response = method(view, request, *args, **kwargs)
+                if response.status_code < 500:
+                    store(record, response)
+        except APIException as exc:
+            if exc.status_code >= 500:
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+                raise
+            # e.g. is_valid(raise_exception=True): the same body gets the same 400 next time
+            response = view.handle_exception(exc)
+            store(record, response)
+        except Exception:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+
+        if response.status_code >= 500:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return response
+
+    return wrapper
+
+
+def purge_expired(using=DEFAULT_DB_ALIAS, batch_size=1000):
+    """Delete expired keys on ``using`` in batches; returns how many were deleted"""
+    deleted = 0
+    while True:
+        expired = list(
+            IdempotencyKey.objects.using(using)
+            .filter(expires_at__lte=timezone.now())
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not expired:
+            return deleted
+        deleted += IdempotencyKey.objects.using(using).filter(pk__in=expired).delete()[0]
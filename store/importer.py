@@ -0,0 +1,152 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Product
+from .search import index_products
+from . import catalog_cache, sharding
+
+IMPORT_CHUNK_SIZE = getattr(settings, 'PRODUCT_IMPORT_CHUNK_SIZE', 1000)
+
+# the error report stops growing here so a bad file can't exhaust memory
+IMPORT_MAX_ERRORS = getattr(settings, 'PRODUCT_IMPORT_MAX_ERRORS', 1000)
+
+UPDATE_FIELDS = ['name', 'description', 'price', 'stock', 'category', 'updated_at']
+
+# columns a file may leave out; existing products keep their values for them
+OPTIONAL_FIELDS = ['image_url', 'is_active']
+
+
+class ProductImportRowSerializer(serializers.ModelSerializer):
+    """Validates one import row; the SKU is required because it is the upsert key"""
+    sku = serializers.CharField(max_length=64)
+
+    class Meta:
+        model = Product
+        fields = ['sku', 'name', 'description', 'price', 'stock', 'category', 'image_url', 'is_active']
+
+
+def decode_lines(source):
+    """Decode an iterable of byte lines, dropping a UTF-8 BOM"""
+    return codecs.iterdecode(source, 'utf-8-sig')
+
+
+def read_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        # header is line 1
+        yield reader.line_num, row
+
+
+def read_ndjson(lines):
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        if not isinstance(row, dict):
+            yield line_number, {'__invalid__': 'Line is not a JSON object.'}
+        else:
+            yield line_number, row
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def import_products(tenant_id, lines, file_format='csv', user_id=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Upsert products from CSV or NDJSON text lines, keyed by ``(tenant, sku)``.
+
+    Rows are read, validated and written one chunk at a time, each chunk in
+    its own transaction with a single ``bulk_create(update_conflicts=True)``.
+    Memory stays flat however long the input is. Returns an
+    ``ImportReport`` with per-row validation errors.
+    """
+    rows = READERS[file_format](lines)
+    validator = ProductImportRowSerializer()
+    report = ImportReport()
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+
+        # later rows win when a SKU repeats within a chunk
+        valid = {}
+        for line_number, row in chunk:
+            if '__invalid__' in row:
+                report.add_error(line_number, {'non_field_errors': [row['__invalid__']]})
+                continue
+            try:
+                data = validator.run_validation(row)
+            except serializers.ValidationError as exc:
+                report.add_error(line_number, exc.detail)
+                continue
+            valid[data['sku']] = data
+
+        if valid:
+            write_chunk(tenant_id, valid, user_id, report)
+
+    return report
+
+
+def write_chunk(tenant_id, valid, user_id, report):
+    now = timezone.now()
+    # one upsert per set of optional columns present, usually just one
+    groups = {}
+    for data in valid.values():
+        present = tuple(field for field in OPTIONAL_FIELDS if field in data)
+        groups.setdefault(present, []).append(
+            Product(tenant_id=tenant_id, created_by_id=user_id, updated_at=now, **data)
+        )
+
+    with sharding.tenant_context(tenant_id), transaction.atomic(using=sharding.database_for(tenant_id)):
+        existing = Product.objects.filter(tenant_id=tenant_id, sku__in=valid).count()
+        for present, products in groups.items():
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['tenant', 'sku'],
+                update_fields=[*UPDATE_FIELDS, *present],
+            )
+        # bulk_create skips post_save, so keep the search index and catalog cache in step here
+        index_products(
+            Product.objects.filter(tenant_id=tenant_id, sku__in=valid).only('id', 'tenant_id', 'name', 'description')
+        )
+        catalog_cache.invalidate_tenant(tenant_id)
+
+    report.created += len(valid) - existing
+    report.updated += existing
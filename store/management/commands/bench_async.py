@@ -0,0 +1,67 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.benchmarking import summarize
+
+DEFAULT_PATHS = ['products/', 'products/categories/', 'orders/my_orders/']
+
+
+def fetch(url, token):
+    request = urllib.request.Request(url, headers={'Authorization': f'Bearer {token}'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def load(url, token, requests, concurrency, no_cache):
+    """Fire ``requests`` GETs at ``url`` from ``concurrency`` threads"""
+    separator = '&' if '?' in url else '?'
+    urls = [f'{url}{separator}bench={number}' if no_cache else url for number in range(requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda target: fetch(target, token), urls))
+    elapsed = time.perf_counter() - start
+
+    report = summarize([duration for duration, ok in results if ok], elapsed)
+    report['errors'] = sum(1 for _, ok in results if not ok)
+    return report
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the sync read endpoints on a WSGI server against their async '
+        'versions (/api/async/...) on an ASGI server: requests/sec and p99 latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--token', required=True, help='access token of a user with orders')
+        parser.add_argument('--sync-url', default='http://127.0.0.1:8000', help='WSGI server, e.g. gunicorn')
+        parser.add_argument('--async-url', default='http://127.0.0.1:8001', help='ASGI server, e.g. uvicorn')
+        parser.add_argument('--path', action='append', dest='paths', help=f'path under /api/ (default {DEFAULT_PATHS})')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--no-cache', action='store_true', help='vary the query string so catalog reads miss the cache')
+
+    def handle(self, *args, **options):
+        for path in options['paths'] or DEFAULT_PATHS:
+            path = path.lstrip('/')
+            targets = [
+                ('wsgi', f"{options['sync_url'].rstrip('/')}/api/{path}"),
+                ('asgi', f"{options['async_url'].rstrip('/')}/api/async/{path}"),
+            ]
+            for label, url in targets:
+                report = load(url, options['token'], options['requests'], options['concurrency'], options['no_cache'])
+                self.stdout.write(
+                    f"{path:<28} {label}: {report['per_second']:>8} req/s  "
+                    f"p50 {report['p50_ms']:>8} ms  p99 {report['p99_ms']:>8} ms  errors {report['errors']}"
+                )
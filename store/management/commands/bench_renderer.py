@@ -0,0 +1,81 @@
+import io
+import random
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from store.benchmarking import fake_words, summarize, timed
+from store.models import Product
+from store.renderers import FastJSONParser, FastJSONRenderer, orjson
+from store.serializers import ProductSerializer
+
+
+def peak_allocated(func):
+    """Most memory allocated at once while ``func`` runs, in bytes"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF's JSONRenderer/JSONParser with the orjson ones on a product list payload: "
+        'time per call and peak allocations'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed, so the fast classes fall back to the stdlib')
+
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        products = [
+            Product(
+                id=number, tenant_id=1, sku=f'SKU-{number:06d}', name=fake_words(rng, 3),
+                description=fake_words(rng, 20), price=Decimal(rng.randint(100, 20000)) / 100,
+                stock=rng.randint(0, 500), category='bench', is_active=True,
+                created_at=now - timedelta(seconds=number), updated_at=now,
+            )
+            for number in range(options['products'])
+        ]
+        payloads = {
+            # what the views render: serializer output, decimals and dates already strings
+            'serialized': {'results': ProductSerializer(products, many=True).data},
+            # raw Decimal and datetime values, as from .values()
+            'raw values': {'results': [
+                {
+                    'id': product.id, 'name': product.name, 'price': product.price,
+                    'stock': product.stock, 'created_at': product.created_at,
+                }
+                for product in products
+            ]},
+        }
+
+        for label, payload in payloads.items():
+            self.stdout.write(f"{label} payload, {options['products']} products:")
+            body = JSONRenderer().render(payload)
+            for name, renderer in (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+                self.report(name, lambda: renderer.render(payload), options['iterations'], len(body))
+            for name, parser in (('JSONParser', JSONParser()), ('FastJSONParser', FastJSONParser())):
+                self.report(name, lambda: parser.parse(io.BytesIO(body)), options['iterations'])
+
+    def report(self, name, func, iterations, size=None):
+        stats = summarize(timed(func, iterations))
+        peak = peak_allocated(func)
+        self.stdout.write(
+            f"  {name:<18} p50 {stats['p50_ms']:>9} ms  p99 {stats['p99_ms']:>9} ms  "
+            f"peak {peak / 1024 / 1024:>7.1f} MiB" + (f'  body {size / 1024 / 1024:.1f} MiB' if size else '')
+        )
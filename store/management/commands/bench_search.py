@@ -0,0 +1,59 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from store.benchmarking import VOCABULARY, fake_words, rolled_back, summarize, timed
+from store.models import Product, Tenant
+from store.search import SEARCH_MAX_RESULTS, rebuild_index, search_products
+
+
+class Command(BaseCommand):
+    help = 'Compare indexed product search with the icontains scan on a synthetic catalog (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # a very common word, progressively rarer ones, a prefix and a two-word query
+        queries = [
+            VOCABULARY[0], VOCABULARY[20], VOCABULARY[300],
+            VOCABULARY[40][:4], f'{VOCABULARY[5]} {VOCABULARY[60]}',
+        ]
+
+        with rolled_back():
+            tenant = Tenant.objects.create(
+                name='bench-search', store_name='Bench', contact_email='bench@example.com',
+                contact_phone='0', subdomain='bench-search',
+            )
+            Product.objects.bulk_create([
+                Product(
+                    tenant=tenant, name=fake_words(rng, 3), description=fake_words(rng, 25),
+                    price='9.99', stock=10, category='bench',
+                )
+                for _ in range(options['products'])
+            ], batch_size=2000)
+
+            if rebuild_index(tenant_id=tenant.id) is None:
+                raise CommandError('This database has no product search index')
+
+            base = Product.objects.filter(tenant=tenant)
+
+            for query in queries:
+                def scan():
+                    list(base.filter(Q(name__icontains=query) | Q(description__icontains=query))
+                         .values_list('id', flat=True)[:SEARCH_MAX_RESULTS])
+
+                def indexed():
+                    ids = search_products(tenant.id, query)
+                    list(base.filter(pk__in=ids).values_list('id', flat=True))
+
+                scan_stats = summarize(timed(scan, options['iterations']))
+                index_stats = summarize(timed(indexed, options['iterations']))
+                self.stdout.write(
+                    f"{query!r:28} icontains p50={scan_stats['p50_ms']}ms p99={scan_stats['p99_ms']}ms | "
+                    f"index p50={index_stats['p50_ms']}ms p99={index_stats['p99_ms']}ms"
+                )
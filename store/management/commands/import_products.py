@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importer import IMPORT_CHUNK_SIZE, decode_lines, import_products
+from store.models import Tenant
+
+
+class Command(BaseCommand):
+    help = 'Upsert products for a tenant from a CSV or NDJSON file, keyed by SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--tenant', type=int, required=True)
+        parser.add_argument('--user', type=int, help='User recorded as creator of new products')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if not Tenant.objects.filter(id=options['tenant']).exists():
+            raise CommandError(f"Tenant {options['tenant']} does not exist")
+
+        path = options['path']
+        file_format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+        with open(path, 'rb') as source:
+            report = import_products(
+                options['tenant'],
+                decode_lines(source),
+                file_format=file_format,
+                user_id=options['user'],
+                chunk_size=options['chunk_size'],
+            )
+
+        result = report.as_dict()
+        self.stdout.write(json.dumps(result, indent=2, default=str))
+        if result['failed']:
+            self.stderr.write(f"{result['failed']} rows failed validation")
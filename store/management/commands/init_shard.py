@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.sharding import ShardMoveError, init_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Start a shard's id sequences at --id-start so its ids never clash with "
+        "other shards' when tenants move. Run after migrate --database <alias>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('database')
+        parser.add_argument('--id-start', type=int, required=True, help='e.g. 1000000000000 for shard1')
+
+    def handle(self, *args, **options):
+        try:
+            init_shard(options['database'], options['id_start'])
+        except ShardMoveError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f"{options['database']} ids now start at {options['id_start']}")
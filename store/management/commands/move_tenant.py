@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import Tenant
+from store.sharding import MOVE_BATCH_SIZE, SHARD_MAP_TTL, ShardMoveError, move_tenant
+
+
+class Command(BaseCommand):
+    help = "Move a tenant's rows to another shard while it stays online (writes pause briefly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('tenant', type=int)
+        parser.add_argument('database', help="target database alias, e.g. shard1 or default")
+        parser.add_argument('--batch-size', type=int, default=MOVE_BATCH_SIZE)
+        parser.add_argument(
+            '--settle', type=float, default=SHARD_MAP_TTL,
+            help='seconds to wait for every process to see a shard map change',
+        )
+
+    def handle(self, *args, **options):
+        if not Tenant.objects.filter(id=options['tenant']).exists():
+            raise CommandError(f"Tenant {options['tenant']} does not exist")
+
+        try:
+            move_tenant(
+                options['tenant'],
+                options['database'],
+                batch_size=options['batch_size'],
+                settle=options['settle'],
+                log=self.stdout.write,
+            )
+        except ShardMoveError as exc:
+            raise CommandError(str(exc))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from store import idempotency, sharding
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records and their stored responses; run it daily'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='only this database (repeatable; default: default and every shard)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for database in options['databases'] or [DEFAULT_DB_ALIAS, *sharding.SHARDS]:
+            deleted = idempotency.purge_expired(database, options['batch_size'])
+            self.stdout.write(f'{database}: deleted {deleted} expired keys')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from store import sharding, sync
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete product tombstones older than CATALOG_TOMBSTONE_RETENTION_DAYS from the change feed; '
+        'run it daily'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='only this database (repeatable; default: default and every shard)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for database in options['databases'] or [DEFAULT_DB_ALIAS, *sharding.SHARDS]:
+            deleted = sync.purge_tombstones(database, options['batch_size'])
+            self.stdout.write(f'{database}: deleted {deleted} tombstones')
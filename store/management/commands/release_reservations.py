@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from store import reservations, sharding
+
+
+class Command(BaseCommand):
+    help = 'Give the stock of expired reservations back; run it every minute or so (cron, systemd timer)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='only this database (repeatable; default: default and every shard)',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--recount', action='store_true',
+            help="also recompute every product's reserved count from its reservations",
+        )
+
+    def handle(self, *args, **options):
+        for database in options['databases'] or [DEFAULT_DB_ALIAS, *sharding.SHARDS]:
+            released = 0
+            while True:
+                count = reservations.release_expired(database, options['batch_size'])
+                released += count
+                if count < options['batch_size']:
+                    break
+            self.stdout.write(f'{database}: released {released} reservations')
+
+            if options['recount']:
+                self.stdout.write(f'{database}: recounted {reservations.recount(database)} products')
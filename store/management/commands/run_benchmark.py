@@ -0,0 +1,195 @@
+import json
+import random
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+
+from store import metrics, throttling
+from store.benchmarking import SEED_PASSWORD, SEED_SUBDOMAIN_PREFIX, VOCABULARY, skewed_index, summarize
+from store.models import Order, Product, Tenant
+
+SCENARIOS = ['login', 'product_list', 'product_search', 'categories', 'order_create', 'order_list', 'update_status']
+
+
+class Store:
+    """One seeded tenant: logged-in clients and ids to request"""
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.owner = f'{tenant.subdomain}-owner'
+        self.customer = f'{tenant.subdomain}-customer0'
+        self.anonymous = Client(HTTP_X_TENANT_ID=str(tenant.id))
+        self.owner_client = self.login(self.owner)
+        self.customer_client = self.login(self.customer)
+        self.product_ids = list(Product.objects.filter(tenant=tenant).values_list('id', flat=True)[:500])
+        self.order_ids = list(Order.objects.filter(tenant=tenant).values_list('id', flat=True)[:500])
+
+    def login(self, username):
+        response = self.anonymous.post(
+            '/api/auth/login/', {'username': username, 'password': SEED_PASSWORD}, content_type='application/json',
+        )
+        if response.status_code != 200:
+            raise CommandError(f'Could not log in as {username}: {response.status_code} {response.content[:200]!r}')
+        return Client(HTTP_X_TENANT_ID=str(self.tenant.id), HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+
+
+def login(store, rng, number, options):
+    return store.anonymous.post(
+        '/api/auth/login/', {'username': store.customer, 'password': SEED_PASSWORD}, content_type='application/json',
+    ), 200
+
+
+def product_list(store, rng, number, options):
+    # a changing query string makes every request miss the catalog cache
+    params = {'bench': number} if options['no_cache'] else {}
+    return store.customer_client.get('/api/products/', params), 200
+
+
+def product_search(store, rng, number, options):
+    return store.customer_client.get('/api/products/', {'search': VOCABULARY[skewed_index(rng, 500)]}), 200
+
+
+def categories(store, rng, number, options):
+    params = {'bench': number} if options['no_cache'] else {}
+    return store.customer_client.get('/api/products/categories/', params), 200
+
+
+def order_create(store, rng, number, options):
+    items = [{'product': rng.choice(store.product_ids), 'quantity': 1} for _ in range(rng.randint(1, 3))]
+    return store.customer_client.post(
+        '/api/orders/', {'shipping_address': '1 Benchmark Road', 'items': items}, content_type='application/json',
+    ), 201
+
+
+def order_list(store, rng, number, options):
+    return store.owner_client.get('/api/orders/'), 200
+
+
+def update_status(store, rng, number, options):
+    # alternating keeps every call a real change
+    status = 'processing' if number % 2 else 'confirmed'
+    return store.owner_client.post(
+        f'/api/orders/{rng.choice(store.order_ids)}/update_status/', {'status': status},
+        content_type='application/json',
+    ), 200
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the API in-process against the seed_benchmark tenants and report throughput, '
+        'p50/p99 latency and queries per request, optionally saved as JSON to compare runs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help='run only this scenario (repeatable; default: all)')
+        parser.add_argument('--iterations', type=int, default=200, help='requests per scenario')
+        parser.add_argument('--login-iterations', type=int, default=20, help='logins are slow by design (password hashing)')
+        parser.add_argument('--warmup', type=int, default=10, help='untimed requests before each scenario')
+        parser.add_argument('--tenants', type=int, help='only use the first N benchmark tenants')
+        parser.add_argument('--no-cache', action='store_true', help='vary catalog reads so they miss the cache')
+        parser.add_argument('--throttle', action='store_true', help='keep rate limits on')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--compare', help='earlier results (JSON) to show changes against')
+
+    def handle(self, *args, **options):
+        tenants = list(Tenant.objects.filter(subdomain__startswith=SEED_SUBDOMAIN_PREFIX).annotate(
+            order_count=Count('orders'),
+        ).order_by('id'))[:options['tenants']]
+        if not tenants:
+            raise CommandError('No benchmark tenants; run manage.py seed_benchmark first')
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on, which records every query and slows requests down')
+        if not options['throttle']:
+            # the benchmark is one client making thousands of requests
+            throttling.RATES = {}
+
+        rng = random.Random(options['seed'])
+        stores = [Store(tenant) for tenant in tenants]
+        # busier tenants get more of the traffic
+        weights = [max(tenant.order_count, 1) for tenant in tenants]
+
+        results = {}
+        for name in options['scenarios'] or SCENARIOS:
+            scenario = globals()[name]
+            iterations = options['login_iterations'] if name == 'login' else options['iterations']
+            for number in range(options['warmup']):
+                scenario(rng.choices(stores, weights)[0], rng, number, options)
+
+            metrics.registry.clear()
+            samples, errors = [], 0
+            start = time.perf_counter()
+            for number in range(iterations):
+                store = rng.choices(stores, weights)[0]
+                request_start = time.perf_counter()
+                response, expected = scenario(store, rng, number, options)
+                samples.append(time.perf_counter() - request_start)
+                if response.status_code != expected:
+                    errors += 1
+            elapsed = time.perf_counter() - start
+
+            results[name] = {**summarize(samples, elapsed), 'errors': errors, **self.query_stats()}
+            self.stdout.write(self.format_result(name, results[name]))
+
+        report = {
+            'commit': current_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'tenants': len(stores),
+            'options': {key: options[key] for key in ('iterations', 'login_iterations', 'warmup', 'no_cache', 'throttle', 'seed')},
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"results written to {options['output']}")
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def query_stats(self):
+        """Queries and DB time per request, as recorded by MetricsMiddleware"""
+        series = [totals for _, _, totals in metrics.registry.snapshot()]
+        count = sum(totals['count'] for totals in series)
+        if not count:
+            return {'queries_per_request': None, 'db_ms_per_request': None}
+        return {
+            'queries_per_request': round(sum(totals['queries'] for totals in series) / count, 2),
+            'db_ms_per_request': round(sum(totals['db_seconds'] for totals in series) * 1000 / count, 3),
+        }
+
+    def format_result(self, name, result):
+        return (
+            f"{name:<15} {result['per_second']:>8} req/s  p50 {result['p50_ms']:>8} ms  "
+            f"p99 {result['p99_ms']:>8} ms  queries {result['queries_per_request']}  errors {result['errors']}"
+        )
+
+    def compare(self, path, results):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)
+        self.stdout.write(f"compared with {path} (commit {previous.get('commit')}):")
+        for name, result in results.items():
+            before = previous['scenarios'].get(name)
+            if before is None:
+                continue
+            changes = []
+            for key in ('per_second', 'p50_ms', 'p99_ms', 'queries_per_request'):
+                if before.get(key) and result.get(key) is not None:
+                    changes.append(f'{key} {(result[key] - before[key]) / before[key]:+.1%}')
+            self.stdout.write(f"{name:<15} {'  '.join(changes)}")
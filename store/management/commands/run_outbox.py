@@ -0,0 +1,50 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from store import outbox, sharding
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued order side effects from the outbox table, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='only drain this database (repeatable; default: default and every shard)',
+        )
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=1.0, help='seconds to wait when there is nothing to do')
+        parser.add_argument('--once', action='store_true', help='drain what is due now, then exit')
+
+    def handle(self, *args, **options):
+        databases = options['databases'] or [DEFAULT_DB_ALIAS, *sharding.SHARDS]
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        # finish the batch in hand before exiting
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        handled_total = failed_total = 0
+        while not stopping:
+            busy = False
+            for database in databases:
+                handled, failed = outbox.process_batch(database, options['batch_size'])
+                handled_total += handled
+                failed_total += failed
+                if handled or failed:
+                    busy = True
+                    self.stdout.write(f'{database}: {handled} handled, {failed} failed')
+
+            if not busy:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'{handled_total} events handled, {failed_total} failures'))
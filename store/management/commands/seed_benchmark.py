@@ -0,0 +1,131 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store import analytics, sharding
+from store.benchmarking import SEED_PASSWORD, SEED_SUBDOMAIN_PREFIX, VOCABULARY, fake_words, skewed_index
+from store.models import Order, OrderItem, Product, Tenant, User
+from store.search import rebuild_index
+
+CATEGORIES = [f'category-{VOCABULARY[number]}' for number in range(20)]
+
+# pending orders make up the biggest share, like a busy store's queue
+STATUSES = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'cancelled']
+STATUS_WEIGHTS = [30, 10, 10, 15, 30, 5]
+
+
+class Command(BaseCommand):
+    help = (
+        'Create synthetic tenants for run_benchmark. Tenant sizes fall off with rank '
+        '(the first tenant is the largest), like a real marketplace'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', type=int, default=5)
+        parser.add_argument('--products', type=int, default=5000, help='products of the largest tenant')
+        parser.add_argument('--customers', type=int, default=1000, help='customers of the largest tenant')
+        parser.add_argument('--orders', type=int, default=20000, help='orders of the largest tenant')
+        parser.add_argument('--max-items', type=int, default=5, help='most lines per order')
+        parser.add_argument('--skew', type=float, default=1.0, help='tenant n gets 1/n**skew of the largest sizes')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--flush', action='store_true', help='delete earlier benchmark tenants first')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        if options['flush']:
+            _, deleted = Tenant.objects.filter(subdomain__startswith=SEED_SUBDOMAIN_PREFIX).delete()
+            self.stdout.write(f'deleted {deleted.get(Tenant._meta.label, 0)} benchmark tenants')
+
+        # hashing is deliberately slow, so every seeded user shares one hash
+        password = make_password(SEED_PASSWORD)
+        first = Tenant.objects.filter(subdomain__startswith=SEED_SUBDOMAIN_PREFIX).count()
+
+        for rank in range(1, options['tenants'] + 1):
+            scale = 1 / rank ** options['skew']
+            sizes = {
+                name: max(1, round(options[name] * scale))
+                for name in ('products', 'customers', 'orders')
+            }
+            tenant = self.seed_tenant(rng, first + rank, sizes, password, options)
+            self.stdout.write(
+                f"{tenant.subdomain}: {sizes['products']} products, {sizes['customers']} customers, "
+                f"{sizes['orders']} orders"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'log in as <subdomain>-owner / {SEED_PASSWORD}'))
+
+    def seed_tenant(self, rng, number, sizes, password, options):
+        subdomain = f'{SEED_SUBDOMAIN_PREFIX}{number}'
+        tenant = Tenant.objects.create(
+            name=subdomain, store_name=f'Benchmark store {number}', contact_email=f'{subdomain}@example.com',
+            contact_phone='0', subdomain=subdomain,
+        )
+        batch_size = options['batch_size']
+
+        with sharding.tenant_context(tenant.id), transaction.atomic(using=sharding.database_for(tenant.id)):
+            staff_count = max(1, sizes['customers'] // 50)
+            users = [User(username=f'{subdomain}-owner', role='store_owner')]
+            users += [User(username=f'{subdomain}-staff{n}', role='staff') for n in range(staff_count)]
+            users += [User(username=f'{subdomain}-customer{n}', role='customer') for n in range(sizes['customers'])]
+            for user in users:
+                user.tenant = tenant
+                user.password = password
+                user.first_name = user.username
+            User.objects.bulk_create(users, batch_size=batch_size)
+
+            users = list(User.objects.filter(tenant=tenant).order_by('id').values_list('id', 'role'))
+            owner_id = users[0][0]
+            staff_ids = [pk for pk, role in users if role == 'staff']
+            customer_ids = [pk for pk, role in users if role == 'customer']
+
+            Product.objects.bulk_create([
+                Product(
+                    tenant=tenant, sku=f'SKU-{n:06d}', name=fake_words(rng, 3), description=fake_words(rng, 20),
+                    price=Decimal(rng.randint(100, 20000)) / 100, stock=1_000_000,
+                    category=CATEGORIES[skewed_index(rng, len(CATEGORIES))], created_by_id=owner_id,
+                )
+                for n in range(sizes['products'])
+            ], batch_size=batch_size)
+            products = list(Product.objects.filter(tenant=tenant).order_by('id').values_list('id', 'price'))
+
+            for start in range(0, sizes['orders'], batch_size):
+                self.seed_orders(
+                    rng, tenant, range(start, min(start + batch_size, sizes['orders'])),
+                    customer_ids, staff_ids, products, options['max_items'],
+                )
+
+        rebuild_index(tenant_id=tenant.id)
+        analytics.backfill(tenant.id)
+        return tenant
+
+    def seed_orders(self, rng, tenant, numbers, customer_ids, staff_ids, products, max_items):
+        orders, lines = [], []
+        for n in numbers:
+            status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+            items = {}
+            for _ in range(rng.randint(1, max_items)):
+                product_id, price = products[skewed_index(rng, len(products))]
+                quantity, _ = items.get(product_id, (0, price))
+                items[product_id] = (quantity + rng.randint(1, 3), price)
+            orders.append(Order(
+                tenant=tenant,
+                customer_id=customer_ids[skewed_index(rng, len(customer_ids))],
+                order_number=f'BENCH-{tenant.id}-{n:07d}',
+                status=status,
+                total_amount=sum(quantity * price for quantity, price in items.values()),
+                shipping_address='1 Benchmark Road',
+                assigned_staff_id=None if status == 'pending' else rng.choice(staff_ids),
+            ))
+            lines.append(items)
+
+        Order.objects.bulk_create(orders)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=quantity, price=price, subtotal=quantity * price)
+            for order, items in zip(orders, lines)
+            for product_id, (quantity, price) in items.items()
+        ])
@@ -0,0 +1,301 @@
+"""
+Per-request performance metrics, served to Prometheus from ``GET /metrics``.
+
+``MetricsMiddleware`` times every request and adds it to the series for its
+route (the URL name), method, status and tenant. Each series has a latency
+histogram and running totals for database queries, database time,
+serializer time and response bytes. Queries are counted by an execute
+wrapper installed on every database connection. The wrapper finds the
+request through a context variable, so queries run by async views through
+``sync_to_async`` are counted too. Queries slower than
+``METRICS_SLOW_QUERY_MS`` are logged with the line of our own code that ran
+them.
+
+Everything is kept in this process's memory, so the cost is a few counter
+updates per request. Each worker process serves its own numbers; Prometheus
+adds them up across scrape targets.
+
+Send ``X-Profile: <METRICS_PROFILE_TOKEN>`` to run one request under
+cProfile. The stats are written to ``METRICS_PROFILE_DIR`` and the slowest
+calls are logged.
+"""
+import bisect
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import LazyObject, empty
+
+from . import catalog_cache, throttling
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = tuple(getattr(
+    settings, 'METRICS_LATENCY_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+))
+
+# queries at least this slow are logged with where they came from; None turns it off
+SLOW_QUERY_MS = getattr(settings, 'METRICS_SLOW_QUERY_MS', 200)
+
+# one series per tenant per route; turn off if there are too many tenants to scrape
+TENANT_LABEL = getattr(settings, 'METRICS_TENANT_LABEL', True)
+
+# bearer token for /metrics; without one it is only served with DEBUG on
+TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+
+# X-Profile value that profiles a request; None turns profiling off
+PROFILE_TOKEN = getattr(settings, 'METRICS_PROFILE_TOKEN', None)
+PROFILE_DIR = getattr(settings, 'METRICS_PROFILE_DIR', None) or tempfile.gettempdir()
+PROFILE_HEADER = 'X-Profile'
+
+PROJECT_DIR = str(settings.BASE_DIR)
+
+
+class RequestStats:
+    """What one request spent, filled in while it runs"""
+
+    __slots__ = ('queries', 'db_seconds', 'slow_queries', 'serializer_seconds', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+
+current = contextvars.ContextVar('request_stats', default=None)
+
+
+def query_origin():
+    """``file:line in function`` of the innermost frame of our own code"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and 'site-packages' not in filename and filename != __file__:
+            return f'{os.path.relpath(filename, PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper: adds the query to the current request's stats"""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        stats = current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += duration
+        if SLOW_QUERY_MS is not None and duration * 1000 >= SLOW_QUERY_MS:
+            if stats is not None:
+                stats.slow_queries += 1
+            logger.warning(
+                'slow query (%.1f ms on %s) at %s: %s',
+                duration * 1000, context['connection'].alias, query_origin(), sql,
+            )
+
+
+def install(connection):
+    """Put ``record_query`` on a connection; called for each new connection"""
+    if record_query not in connection.execute_wrappers:
+        # first, so a surrounding ``with connection.execute_wrapper(...)`` still pops its own
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def serializing():
+    """Adds the block's time to the request's serializer time"""
+    stats = current.get()
+    # nested serializers are already inside the outer one's time
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_seconds += time.perf_counter() - start
+        stats.serializing = False
+
+
+class TimedSerializerMixin:
+    """Adds the time spent rendering this serializer to the request's stats"""
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
+
+
+class Series:
+    __slots__ = ('buckets', 'count', 'seconds', 'queries', 'db_seconds', 'slow_queries', 'serializer_seconds', 'bytes')
+
+    def __init__(self):
+        # one past the last bound for +Inf
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+        self.serializer_seconds = 0.0
+        self.bytes = 0
+
+
+class Registry:
+    """Request series for this process, keyed by (route, method, status, tenant)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, labels, seconds, stats, size):
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = Series()
+            series.buckets[index] += 1
+            series.count += 1
+            series.seconds += seconds
+            series.queries += stats.queries
+            series.db_seconds += stats.db_seconds
+            series.slow_queries += stats.slow_queries
+            series.serializer_seconds += stats.serializer_seconds
+            series.bytes += size
+
+    def snapshot(self):
+        with self.lock:
+            return [(labels, series.buckets[:], {
+                name: getattr(series, name) for name in Series.__slots__ if name != 'buckets'
+            }) for labels, series in self.series.items()]
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+registry = Registry()
+
+LABEL_NAMES = ('route', 'method', 'status', 'tenant')
+
+COUNTERS = [
+    ('http_request_db_queries_total', 'queries', 'Database queries run by requests.'),
+    ('http_request_db_seconds_total', 'db_seconds', 'Time requests spent in database queries.'),
+    ('http_request_slow_queries_total', 'slow_queries', 'Queries slower than METRICS_SLOW_QUERY_MS.'),
+    ('http_request_serializer_seconds_total', 'serializer_seconds', 'Time requests spent serializing responses.'),
+    ('http_response_bytes_total', 'bytes', 'Response body bytes, streamed responses excluded.'),
+]
+
+
+def route_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def resolved(value):
+    # don't make a lazy user or tenant run its lookup just to label a metric
+    return None if isinstance(value, LazyObject) and value._wrapped is empty else value
+
+
+def tenant_label(request):
+    if not TENANT_LABEL:
+        return ''
+    tenant_id = getattr(resolved(getattr(request, 'user', None)), 'tenant_id', None)
+    if tenant_id is None:
+        tenant_id = getattr(resolved(getattr(request, 'tenant', None)), 'id', None)
+    return '' if tenant_id is None else str(tenant_id)
+
+
+def record(request, response, seconds, stats):
+    size = 0 if response.streaming else len(response.content)
+    labels = (route_label(request), request.method, str(response.status_code), tenant_label(request))
+    registry.observe(labels, seconds, stats, size)
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=''):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(LABEL_NAMES, labels)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}'
+
+
+def render():
+    """This process's metrics in the Prometheus text format"""
+    series = sorted(registry.snapshot())
+    lines = [
+        '# HELP http_request_duration_seconds Time to respond to requests.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for labels, buckets, totals in series:
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, '+Inf'), buckets):
+            cumulative += count
+            le = format_labels(labels, f'le="{bound}"')
+            lines.append(f'http_request_duration_seconds_bucket{le} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{format_labels(labels)} {totals["seconds"]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{format_labels(labels)} {totals["count"]}')
+
+    for name, field, help_text in COUNTERS:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, _, totals in series:
+            lines.append(f'{name}{format_labels(labels)} {totals[field]}')
+
+    cache_stats = catalog_cache.stats.snapshot()
+    lines += [
+        '# HELP catalog_cache_requests_total Catalog cache lookups.',
+        '# TYPE catalog_cache_requests_total counter',
+        f'catalog_cache_requests_total{{result="hit"}} {cache_stats["hits"]}',
+        f'catalog_cache_requests_total{{result="miss"}} {cache_stats["misses"]}',
+        '# HELP request_queue_milliseconds Average time requests waited for a worker.',
+        '# TYPE request_queue_milliseconds gauge',
+        f'request_queue_milliseconds {throttling.queue_latency.average_ms:.3f}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    if TOKEN is None:
+        if not settings.DEBUG:
+            return HttpResponseNotFound()
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {TOKEN}'):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def profiler_for(request):
+    """A profiler if this request asked for one with the right token"""
+    if PROFILE_TOKEN is None:
+        return None
+    if not constant_time_compare(request.headers.get(PROFILE_HEADER, ''), PROFILE_TOKEN):
+        return None
+    return cProfile.Profile()
+
+
+def save_profile(profiler, request, response):
+    path = os.path.join(PROFILE_DIR, f'request-{uuid.uuid4().hex}.prof')
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+    logger.info('profiled %s %s, saved to %s\n%s', request.method, request.path, path, out.getvalue())
+    response['X-Profile-File'] = os.path.basename(path)
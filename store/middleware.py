@@ -1,27 +1,166 @@
-from django.utils.deprecation import MiddlewareMixin
-from .models import Tenant
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+from .tenancy import resolve_tenant, aresolve_tenant
+from .routers import reading_from, replica_for, pin_to_primary
+from . import metrics, sharding, throttling
+
+
+async def atenant(request):
+    if not hasattr(request, '_atenant'):
+        request._atenant = await aresolve_tenant(request)
+    return request._atenant
+
+
+class TenantMiddleware:
+    """
+    Attaches the request's tenant. Runs natively under both WSGI and ASGI,
+    so async requests don't hop to a thread just to pass through it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self.process_request(request)
+        with self.shard_context(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        with self.shard_context(request):
+            return await self.get_response(request)
+
+    def shard_context(self, request):
+        # sharded queries go to the request's tenant, or the token's once it is authenticated
+        return sharding.tenant_context(resolve=lambda: getattr(request.tenant, 'id', None))
 
-class TenantMiddleware(MiddlewareMixin):
-    
     def process_request(self, request):
-        # fetching tenant from header or subdomain
-        host = request.get_host().split(':')[0]
-        subdomain = host.split('.')[0] if '.' in host else None
-        
-        # fetching tenant from the headers
-        tenant_id = request.META.get('HTTP_X_TENANT_ID')
-        
-        if tenant_id:
-            try:
-                request.tenant = Tenant.objects.get(id=tenant_id, is_active=True)
-            except Tenant.DoesNotExist:
-                request.tenant = None
-        elif subdomain:
-            try:
-                request.tenant = Tenant.objects.get(subdomain=subdomain, is_active=True)
-            except Tenant.DoesNotExist:
-                request.tenant = None
-        else:
-            request.tenant = None
-        
-        return None
+        # tenant comes from the header, custom domain or subdomain and is
+        # resolved on first access, so requests that never read it skip the lookup
+        request.tenant = SimpleLazyObject(lambda: resolve_tenant(request))
+        # async views await request.atenant() instead, like request.auser()
+        request.atenant = lambda: atenant(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serves safe API requests from a read replica and keeps a client on the
+    primary for a few seconds after it writes, so it always reads its own
+    writes (a just-placed order, an edited product).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with reading_from(replica_for(request)):
+            response = self.get_response(request)
+        pin_to_primary(request)
+        return response
+
+    async def __acall__(self, request):
+        with reading_from(replica_for(request)):
+            response = await self.get_response(request)
+        pin_to_primary(request)
+        return response
+
+
+class QueueTimeMiddleware:
+    """
+    Feeds how long each request waited in the proxy's queue (from its
+    ``X-Request-Start`` header) into the load shedder. Goes first, so the
+    measurement includes as little of our own work as possible.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self.record(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.record(request)
+        return await self.get_response(request)
+
+    def record(self, request):
+        header = request.META.get('HTTP_X_REQUEST_START')
+        if not header:
+            return
+        start_ms = throttling.request_start_ms(header)
+        if start_ms is not None:
+            throttling.queue_latency.record(time.time() * 1000 - start_ms)
+
+
+class MetricsMiddleware:
+    """
+    Records each request's latency, queries, serializer time and response
+    size for ``/metrics`` (see store.metrics), and profiles the request when
+    it carries the ``X-Profile`` token.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = metrics.RequestStats()
+        token = metrics.current.set(stats)
+        profiler = metrics.profiler_for(request)
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                response = profiler.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        metrics.record(request, response, time.perf_counter() - start, stats)
+        if profiler is not None:
+            metrics.save_profile(profiler, request, response)
+        return response
+
+    async def __acall__(self, request):
+        # cProfile only sees the event loop thread, so async requests aren't profiled
+        stats = metrics.RequestStats()
+        token = metrics.current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        metrics.record(request, response, time.perf_counter() - start, stats)
+        return response
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['tenant', '-created_at', '-id'], name='orders_tenant__185d37_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['tenant', '-created_at', '-id'], name='products_tenant__0d3cc9_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE product_search USING fts5("
+                    "tenant, name, description, "
+                    "prefix='2 3 4', tokenize='unicode61 remove_diacritics 2')"
+                )
+            except OperationalError:
+                # sqlite built without FTS5, search falls back to icontains
+                return
+            cursor.execute(
+                "INSERT INTO product_search (rowid, tenant, name, description) "
+                "SELECT id, 't' || tenant_id, name, description FROM products"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                "CREATE TABLE product_search ("
+                "product_id bigint PRIMARY KEY REFERENCES products (id) ON DELETE CASCADE, "
+                "tenant_id bigint NOT NULL, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute("CREATE INDEX product_search_document_idx ON product_search USING GIN (document)")
+            cursor.execute("CREATE INDEX product_search_tenant_idx ON product_search (tenant_id)")
+            cursor.execute(
+                "INSERT INTO product_search (product_id, tenant_id, document) "
+                "SELECT id, tenant_id, "
+                "setweight(to_tsvector('simple', name), 'A') || "
+                "setweight(to_tsvector('simple', description), 'B') "
+                "FROM products"
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-17 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_outbox_events'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='orders_tenant__ed6a9d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['tenant', 'status', 'assigned_staff', 'created_at'], name='orders_tenant__b4b61e_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
 
 # tenant model
@@ -22,6 +24,21 @@ class Tenant(models.Model):
         db_table = 'tenants'
         ordering = ['-created_at']
 
+# tenant to database map for sharding; tenants without a row live on 'default'
+
+class TenantShard(models.Model):
+    tenant = models.OneToOneField(Tenant, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    database = models.CharField(max_length=100)
+    # set while the tenant is being moved; its writes are refused until the move finishes
+    read_only = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'tenant_shards'
+
+    def __str__(self):
+        return f"{self.tenant_id} -> {self.database}"
+
 # user model
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -63,6 +80,7 @@ class User(AbstractUser):
 
 class Product(models.Model):
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='products')
+    sku = models.CharField(max_length=64, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
@@ -70,6 +88,8 @@ class Product(models.Model):
     category = models.CharField(max_length=100)
     image_url = models.URLField(blank=True)
     is_active = models.BooleanField(default=True)
+    # units held by stock reservations; available stock is stock - reserved
+    reserved = models.IntegerField(default=0)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_products')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -79,11 +99,37 @@ class Product(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['tenant', 'is_active']),
+            models.Index(fields=['tenant', '-created_at', '-id']),
+            models.Index(fields=['tenant', 'updated_at', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'sku'], name='unique_product_sku_per_tenant'),
         ]
 
     def __str__(self):
         return f"{self.name} - {self.tenant.store_name}"
 
+    @property
+    def available(self):
+        """Stock that reservations don't hold"""
+        return max(self.stock - self.reserved, 0)
+
+# deleted product marker for the catalog change feed
+
+class ProductTombstone(models.Model):
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='product_tombstones')
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'product_tombstones'
+        indexes = [
+            models.Index(fields=['tenant', 'id']),
+        ]
+
+    def __str__(self):
+        return f"Deleted product {self.product_id} - tenant {self.tenant_id}"
+
 # order model
 
 class Order(models.Model):
@@ -111,8 +157,10 @@ class Order(models.Model):
         db_table = 'orders'
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['tenant', 'status']),
+            # staff claim queue; its (tenant, status) prefix serves status filters too
+            models.Index(fields=['tenant', 'status', 'assigned_staff', 'created_at']),
             models.Index(fields=['order_number']),
+            models.Index(fields=['tenant', '-created_at', '-id']),
         ]
 
     def __str__(self):
@@ -134,4 +182,129 @@ class OrderItem(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.product.name} x {self.quantity}"
\ No newline at end of file
+        return f"{self.product.name} x {self.quantity}"
+
+# stock held for a customer's checkout until it expires (store.reservations)
+
+class StockReservation(models.Model):
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='stock_reservations')
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'stock_reservations'
+        indexes = [
+            models.Index(fields=['expires_at']),
+            models.Index(fields=['tenant', 'customer']),
+        ]
+
+    def __str__(self):
+        return f"Reservation {self.pk} - {self.customer_id} until {self.expires_at}"
+
+
+class StockReservationItem(models.Model):
+    reservation = models.ForeignKey(StockReservation, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField(validators=[MinValueValidator(1)])
+
+    class Meta:
+        db_table = 'stock_reservation_items'
+
+
+# daily sales rollups, kept current by store.analytics
+
+class DailySales(models.Model):
+    """Orders, items sold and revenue per tenant per day, cancelled orders excluded"""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    items = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'analytics_daily_sales'
+        verbose_name_plural = 'daily sales'
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'date'], name='unique_daily_sales'),
+        ]
+
+
+class DailyStatusCount(models.Model):
+    """How many of the orders placed on a day are in each status now"""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='daily_status_counts')
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'analytics_daily_status_counts'
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'date', 'status'], name='unique_daily_status_count'),
+        ]
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue per product per day, cancelled orders excluded"""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='daily_product_sales')
+    date = models.DateField()
+    # not a foreign key, so sales history outlives deleted products
+    product_id = models.BigIntegerField()
+    product_name = models.CharField(max_length=255)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'analytics_daily_product_sales'
+        verbose_name_plural = 'daily product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'date', 'product_id'], name='unique_daily_product_sales'),
+        ]
+
+
+# order side effects waiting for the outbox worker (store.outbox)
+
+class OutboxEvent(models.Model):
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='outbox_events')
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # not picked up before this, pushed back after every failed attempt
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # gave up after OUTBOX_MAX_ATTEMPTS; kept for inspection
+    dead = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'outbox_events'
+        indexes = [
+            models.Index(fields=['available_at', 'id'], condition=models.Q(dead=False), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.pk} - tenant {self.tenant_id}"
+
+
+# stored first response for an Idempotency-Key (store.idempotency)
+
+class IdempotencyKey(models.Model):
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name='idempotency_keys')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # hash of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    # null while the first request is still running
+    status_code = models.IntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'user', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
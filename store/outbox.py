@@ -0,0 +1,120 @@
+"""
+Transactional outbox for order side effects (notifications, webhooks, ...).
+
+Order writes ``publish`` an ``OutboxEvent`` in their own transaction, which
+costs the request one INSERT, and the event exists exactly when the change
+committed. ``manage.py run_outbox`` drains the table in batches, claiming
+rows with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several workers can run
+side by side, and retries failed events with exponential backoff.
+
+Handlers are listed per topic in ``OUTBOX_HANDLERS`` ('*' matches every
+topic) and are called with the event. Delivery is at least once, so they
+must tolerate seeing an event twice.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxEvent
+from . import sharding
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = getattr(settings, 'OUTBOX_HANDLERS', {'*': ['store.outbox.log_event']})
+BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 10)
+RETRY_BASE_SECONDS = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 5)
+RETRY_MAX_SECONDS = getattr(settings, 'OUTBOX_RETRY_MAX_SECONDS', 3600)
+
+_handlers = {}
+
+
+def publish(tenant_id, topic, payload):
+    """Queue an event; call it inside the transaction that makes the change"""
+    return OutboxEvent.objects.create(tenant_id=tenant_id, topic=topic, payload=payload)
+
+
+def publish_many(tenant_id, topic, payloads):
+    """Queue one event per payload in a single INSERT"""
+    return OutboxEvent.objects.bulk_create([
+        OutboxEvent(tenant_id=tenant_id, topic=topic, payload=payload) for payload in payloads
+    ])
+
+
+def order_payload(order, **extra):
+    return {
+        'order_id': order.pk,
+        'order_number': order.order_number,
+        'status': order.status,
+        'customer_id': order.customer_id,
+        'assigned_staff_id': order.assigned_staff_id,
+        'total_amount': str(order.total_amount),
+        **extra,
+    }
+
+
+def log_event(event):
+    logger.info('outbox %s tenant=%s %s', event.topic, event.tenant_id, event.payload)
+
+
+def handlers_for(topic):
+    if topic not in _handlers:
+        paths = [*HANDLERS.get('*', []), *HANDLERS.get(topic, [])]
+        _handlers[topic] = [import_string(path) for path in paths]
+    return _handlers[topic]
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, so a failing endpoint isn't hit in lockstep"""
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def handle(event, using):
+    """Run the event's handlers; returns the error, or None once they all succeeded"""
+    try:
+        # a savepoint, so a handler's failed query doesn't break the batch transaction
+        with sharding.tenant_context(event.tenant_id), transaction.atomic(using=using):
+            for handler in handlers_for(event.topic):
+                handler(event)
+    except Exception as exc:
+        logger.warning('outbox event %s (%s) failed: %r', event.pk, event.topic, exc)
+        return exc
+    return None
+
+
+def process_batch(using=DEFAULT_DB_ALIAS, batch_size=BATCH_SIZE):
+    """
+    Claim and handle up to ``batch_size`` due events on ``using``. Handled
+    events are deleted; failed ones are pushed back, or marked dead after
+    ``MAX_ATTEMPTS``. Returns ``(handled, failed)``.
+    """
+    with transaction.atomic(using=using):
+        events = list(
+            OutboxEvent.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(dead=False, available_at__lte=timezone.now())
+            .order_by('available_at', 'id')[:batch_size]
+        )
+
+        done = []
+        for event in events:
+            error = handle(event, using)
+            if error is None:
+                done.append(event.pk)
+                continue
+
+            event.attempts += 1
+            event.last_error = repr(error)[:2000]
+            event.dead = event.attempts >= MAX_ATTEMPTS
+            event.available_at = timezone.now() + retry_delay(event.attempts)
+            event.save(using=using, update_fields=['attempts', 'last_error', 'dead', 'available_at'])
+
+        OutboxEvent.objects.using(using).filter(pk__in=done).delete()
+
+    return len(done), len(events) - len(done)
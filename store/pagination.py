@@ -0,0 +1,169 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on ``(created_at, id)``, newest first.
+
+    Each page seeks past the last row of the previous one instead of using
+    OFFSET, so with a ``(tenant, -created_at, -id)`` index a deep page costs
+    the same as the first. Rows may be model instances or ``.values()`` dicts.
+
+    Querysets annotated with ``search_rank`` are already capped by the search
+    index, so they are paged in rank order with the offset into the ranked
+    hits as the cursor.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async ``paginate_queryset()``, for async views"""
+        queryset = self.page_queryset(queryset, request)
+        return self.set_page([row async for row in queryset])
+
+    def page_queryset(self, queryset, request):
+        """The sliced queryset for the requested page, one row over to detect a next page"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.reverse, self.position = self.decode_cursor(request)
+        self.ranked = 'search_rank' in queryset.query.annotations
+
+        if self.ranked != isinstance(self.position, int):
+            # a cursor from a plain listing on a search, or the other way round
+            if self.position is not None:
+                raise NotFound(self.invalid_cursor_message)
+
+        if self.ranked:
+            self.offset = self.position or 0
+            return queryset[self.offset:self.offset + self.page_size + 1]
+
+        if self.reverse:
+            # walking back towards newer rows
+            queryset = queryset.order_by('created_at', 'id')
+            if self.position:
+                created_at, pk = self.position
+                queryset = queryset.filter(created_at__gte=created_at).filter(
+                    Q(created_at__gt=created_at) | Q(id__gt=pk)
+                )
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+            if self.position:
+                created_at, pk = self.position
+                queryset = queryset.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk)
+                )
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.ranked:
+            self.has_next = has_more
+            self.has_previous = self.offset > 0
+            self.page = rows
+            return rows
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.page = rows
+        return rows
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        if self.ranked:
+            return self.encode_offset(self.offset + len(self.page))
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        if self.ranked:
+            return self.encode_offset(max(self.offset - self.page_size, 0))
+        return self.encode_cursor(True, self.page[0])
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            if raw.startswith('r|'):
+                offset = int(raw[2:])
+                if offset < 0:
+                    raise ValueError(offset)
+                return False, offset
+            reverse, created_at, pk = raw.split('|')
+            return reverse == '1', (datetime.fromisoformat(created_at), int(pk))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, reverse, row):
+        if isinstance(row, dict):
+            created_at, pk = row['created_at'], row['id']
+        else:
+            created_at, pk = row.created_at, row.pk
+
+        return self.cursor_link(f"{int(reverse)}|{created_at.isoformat()}|{pk}")
+
+    def encode_offset(self, offset):
+        """Cursor for search results, ``offset`` hits into the ranking"""
+        return self.cursor_link(f"r|{offset}")
+
+    def cursor_link(self, raw):
+        encoded = base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
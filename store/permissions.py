@@ -8,7 +8,7 @@ class IsTenantUser(permissions.BasePermission):
             return False
         
         if hasattr(request, 'tenant') and request.tenant:
-            return request.user.tenant == request.tenant
+            return request.user.tenant_id == request.tenant.id
         return True
 
 
@@ -43,10 +43,10 @@ class CanManageOrder(permissions.BasePermission):
         
         # staff can manage assigned orders only
         if user.role == 'staff':
-            return obj.assigned_staff == user or request.method in permissions.SAFE_METHODS
+            return obj.assigned_staff_id == user.id or request.method in permissions.SAFE_METHODS
         
         # customers to check about their orders only
         if user.role == 'customer':
-            return obj.customer == user and request.method in permissions.SAFE_METHODS
+            return obj.customer_id == user.id and request.method in permissions.SAFE_METHODS
         
         return False
\ No newline at end of file
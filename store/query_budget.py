@@ -0,0 +1,53 @@
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def assert_max_queries(limit, label='block'):
+    """Fail if the block runs more than ``limit`` queries across all databases"""
+    executed = []
+
+    def record(execute, sql, params, many, context):
+        executed.append(sql)
+        return execute(sql, params, many, context)
+
+    # execute wrappers, unlike CaptureQueriesContext, don't open a connection to every alias
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(record))
+        yield executed
+
+    if len(executed) > limit:
+        raise QueryBudgetExceeded(
+            f"{label} ran {len(executed)} queries, budget is {limit}:\n" + '\n'.join(executed)
+        )
+
+
+class QueryBudgetMixin:
+    """
+    Pins the maximum number of queries per viewset action.
+
+    ``query_budgets`` maps action names to limits and counts everything the
+    request runs, authentication included. It is only checked when
+    ``QUERY_BUDGET_ENFORCE`` is on, as in CI, where going over raises so an
+    N+1 regression fails the build.
+    """
+
+    query_budgets = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        # self.action is only set once dispatch has started, so look it up here
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        budget = self.query_budgets.get(action)
+        if budget is None or not getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+            return super().dispatch(request, *args, **kwargs)
+
+        label = f"{self.__class__.__name__}.{action}"
+        with assert_max_queries(budget, label):
+            return super().dispatch(request, *args, **kwargs)
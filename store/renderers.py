@@ -0,0 +1,100 @@
+"""
+JSON rendering and parsing with orjson, when it is installed.
+
+orjson encodes a page of products or orders several times faster than the
+standard library and makes the bytes directly, without an intermediate
+str. It handles datetime, date, time and UUID natively, and lazy
+translation strings and the like go through DRF's own encoder.
+
+The output must be byte for byte what ``JSONRenderer`` makes, so anything
+orjson writes differently goes to ``JSONRenderer`` instead: floats (orjson
+writes ``1e16`` for ``1e+16`` and NaN as null, where DRF raises), values
+DRF's encoder turns into floats or containers (Decimal, QuerySets), ints
+past 53 bits, non-string keys, and anything else orjson refuses. So do
+indented responses and non-default ``UNICODE_JSON``/``COMPACT_JSON``
+settings. Serializer output holds none of these, so API responses take the
+fast path. Without orjson both classes are DRF's.
+"""
+from decimal import Decimal
+
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # UTC is written as Z like DRF; bigger ints raise, and so go to JSONRenderer
+    OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_STRICT_INTEGER
+    drf_default = JSONEncoder().default
+
+# plain values orjson writes just like json.dumps
+PLAIN_TYPES = frozenset({str, int, bool, type(None)})
+CONTAINER_TYPES = (dict, list, tuple)
+
+
+def default(obj):
+    """DRF's encoder for types orjson doesn't know, when that makes a string"""
+    value = drf_default(obj)
+    if not isinstance(value, str):
+        # a float, or a container that could hold one
+        raise TypeError(f'{type(obj).__name__} is left to JSONRenderer')
+    return value
+
+
+def has_float(data):
+    """Whether ``data`` holds a float anywhere, looking at each container's value types at once"""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            value = value.values()
+        elif not isinstance(value, CONTAINER_TYPES):
+            continue
+        types = set(map(type, value))
+        # DRF writes Decimal as a float too
+        if float in types or Decimal in types:
+            return True
+        types -= PLAIN_TYPES
+        if any(issubclass(kind, CONTAINER_TYPES) for kind in types):
+            stack.extend(item for item in value if isinstance(item, CONTAINER_TYPES))
+    return isinstance(data, (float, Decimal))
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if has_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=default, option=OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # escaped like JSONRenderer, so the JSON stays valid inside a <script>
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        # orjson only reads UTF-8
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,185 @@
+"""
+Stock reservations: hold stock for a customer's checkout for a while.
+
+``Product.reserved`` counts the units held by reservations, so available
+stock is ``stock - reserved`` on the product row itself, and reserving is
+one guarded UPDATE like taking stock at checkout. A reservation is spent by
+whoever deletes it first: ``convert`` turning it into an order, the customer
+releasing it, or ``release_expired`` once it has expired. Only that caller
+gives its units back to ``reserved``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, F, OuterRef, Prefetch, Q, Subquery, Sum, Value, When, prefetch_related_objects
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+
+from .checkout import merge_quantities, place_order
+from .models import Product, StockReservation, StockReservationItem
+from . import catalog_cache, sharding
+
+# how long reserved stock is held
+RESERVATION_TTL = getattr(settings, 'STOCK_RESERVATION_TTL', 900)
+
+
+def change_reserved(quantities, sign, using=None):
+    """
+    Add (``sign`` 1) or give back (-1) reserved units in one UPDATE. It
+    changes what the catalog shows as available, so like ``take_stock`` it
+    bumps ``updated_at``; callers invalidate the tenants' catalog caches.
+    """
+    if not quantities:
+        return
+    Product.objects.using(using).filter(pk__in=quantities).update(reserved=Case(*[
+        When(pk=product_id, then=F('reserved') + sign * quantity)
+        for product_id, quantity in quantities.items()
+    ]), updated_at=timezone.now())
+
+
+def reserve(*, tenant_id, customer_id, items):
+    """
+    Hold ``items`` for ``RESERVATION_TTL`` seconds. Each product row is only
+    touched while ``stock - reserved`` covers the quantity, so concurrent
+    reservations and checkouts can't hold more than there is.
+    """
+    quantities = merge_quantities(items)
+    if not quantities:
+        raise serializers.ValidationError({'items': "At least one item is required."})
+
+    with sharding.tenant_context(tenant_id), transaction.atomic(using=sharding.database_for(tenant_id)):
+        guard = Q()
+        for product_id, quantity in quantities.items():
+            guard |= Q(pk=product_id, stock__gte=F('reserved') + quantity)
+        updated = Product.objects.filter(guard, tenant_id=tenant_id).update(reserved=Case(*[
+            When(pk=product_id, then=F('reserved') + quantity)
+            for product_id, quantity in quantities.items()
+        ]), updated_at=timezone.now())
+
+        if updated != len(quantities):
+            products = {
+                product.pk: product
+                for product in Product.objects.filter(tenant_id=tenant_id, pk__in=quantities).only('name', 'stock', 'reserved')
+            }
+            for product_id, quantity in quantities.items():
+                product = products.get(product_id)
+                if product is None:
+                    raise serializers.ValidationError({'items': f"Product {product_id} not found."})
+                available = max(product.stock - product.reserved, 0)
+                if available < quantity:
+                    raise serializers.ValidationError(
+                        f"Insufficient stock for {product.name}. Available: {available}"
+                    )
+            # stock came back between the UPDATE and the re-read, but some rows still weren't reserved
+            raise serializers.ValidationError("Stock changed while reserving. Please try again.")
+
+        reservation = StockReservation.objects.create(
+            tenant_id=tenant_id,
+            customer_id=customer_id,
+            expires_at=timezone.now() + timedelta(seconds=RESERVATION_TTL),
+        )
+        StockReservationItem.objects.bulk_create([
+            StockReservationItem(reservation=reservation, product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+        ])
+        catalog_cache.invalidate_tenant(tenant_id)
+
+    prefetch_related_objects([reservation], Prefetch('items', queryset=StockReservationItem.objects.select_related('product')))
+    return reservation
+
+
+def reserved_quantities(reservation):
+    quantities = {}
+    for item in reservation.items.all():
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+
+def take(reservation, active_only=True):
+    """Delete ``reservation``; True if this call did, and so owns its units"""
+    queryset = StockReservation.objects.filter(pk=reservation.pk)
+    if active_only:
+        queryset = queryset.filter(expires_at__gt=timezone.now())
+    _, deleted = queryset.delete()
+    return deleted.get(StockReservation._meta.label, 0) == 1
+
+
+def convert(reservation, **order_fields):
+    """Turn an active reservation into an order, taking the stock it holds"""
+    quantities = reserved_quantities(reservation)
+    with transaction.atomic(using=sharding.database_for(reservation.tenant_id)):
+        if not take(reservation):
+            raise serializers.ValidationError({'reservation': 'This reservation has expired.'})
+        return place_order(
+            tenant_id=reservation.tenant_id,
+            customer_id=reservation.customer_id,
+            items=[{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()],
+            reserved=True,
+            **order_fields,
+        )
+
+
+def release(reservation):
+    """Give a reservation's stock back before it expires; False if it was already spent"""
+    quantities = reserved_quantities(reservation)
+    with transaction.atomic(using=sharding.database_for(reservation.tenant_id)):
+        if not take(reservation, active_only=False):
+            return False
+        change_reserved(quantities, -1)
+        catalog_cache.invalidate_tenant(reservation.tenant_id)
+    return True
+
+
+def release_expired(using=DEFAULT_DB_ALIAS, batch_size=500):
+    """
+    Release up to ``batch_size`` expired reservations on database
+    ``using`` and return how many were released. Rows another sweeper has
+    locked are skipped.
+    """
+    with transaction.atomic(using=using):
+        expired = dict(
+            StockReservation.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(expires_at__lte=timezone.now())
+            .order_by('expires_at')
+            .values_list('pk', 'tenant_id')[:batch_size]
+        )
+        if not expired:
+            return 0
+
+        quantities = dict(
+            StockReservationItem.objects.using(using)
+            .filter(reservation_id__in=expired)
+            .values('product_id')
+            .annotate(total=Sum('quantity'))
+            .values_list('product_id', 'total')
+        )
+        StockReservation.objects.using(using).filter(pk__in=expired).delete()
+        change_reserved(quantities, -1, using=using)
+        for tenant_id in set(expired.values()):
+            catalog_cache.invalidate_tenant(tenant_id)
+
+    return len(expired)
+
+
+def recount(using=DEFAULT_DB_ALIAS, tenant_id=None):
+    """
+    Recompute ``Product.reserved`` from the reservations on ``using``, e.g.
+    after a tenant moved shards while reservations were being made. Returns
+    the number of products whose count was wrong.
+    """
+    held = StockReservationItem.objects.using(using).filter(
+        product_id=OuterRef('pk')
+    ).values('product_id').annotate(total=Sum('quantity')).values('total')
+    recounted = Coalesce(Subquery(held), Value(0))
+
+    products = Product.objects.using(using).all()
+    if tenant_id is not None:
+        products = products.filter(tenant_id=tenant_id)
+    with transaction.atomic(using=using):
+        wrong = products.exclude(reserved=recounted)
+        for tenant_id in set(wrong.values_list('tenant_id', flat=True)):
+            catalog_cache.invalidate_tenant(tenant_id)
+        return wrong.update(reserved=recounted, updated_at=timezone.now())
@@ -0,0 +1,155 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import request_token
+from . import sharding
+
+# replica aliases from DATABASES; empty means everything stays on the primary
+REPLICAS = list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+# how long a client's reads stay on the primary after it writes, to cover replication lag
+PRIMARY_PIN_SECONDS = getattr(settings, 'DATABASE_PRIMARY_PIN_SECONDS', 5)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica = ContextVar('replica', default=None)
+
+
+@contextmanager
+def reading_from(alias):
+    """Route reads in the block to ``alias`` (None for the primary)"""
+    token = _replica.set(alias)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def current_replica():
+    """The replica reads are going to right now, or None for the primary"""
+    return _replica.get()
+
+
+def token_user_id(request):
+    """The user id in the request's bearer token, or None without a valid one"""
+    try:
+        validated_token = request_token(request)
+    except AuthenticationFailed:
+        return None
+    return None if validated_token is None else validated_token.get(api_settings.USER_ID_CLAIM)
+
+
+def pin_key(request):
+    """
+    Key identifying the client for read-your-writes, or None.
+
+    The key is the token's user, so refreshing the token keeps the pin.
+    Only bearer-token API clients are routed to replicas; session traffic
+    such as the admin always reads from the primary. Pins live in the
+    default cache, which has to be shared by every worker for a read to
+    see the writes another worker served.
+    """
+    if not hasattr(request, '_pin_key'):
+        user_id = token_user_id(request)
+        request._pin_key = None if user_id is None else f'db:pin:{user_id}'
+    return request._pin_key
+
+
+def pin_to_primary(request):
+    """After a write, keep the client's reads on the primary for ``PRIMARY_PIN_SECONDS``"""
+    if not REPLICAS or request.method in SAFE_METHODS:
+        return
+
+    key = pin_key(request)
+    if key is not None:
+        cache.set(key, True, PRIMARY_PIN_SECONDS)
+
+
+def replica_for(request):
+    """The replica to serve this request's reads from, or None for the primary"""
+    if not REPLICAS or request.method not in SAFE_METHODS:
+        return None
+
+    key = pin_key(request)
+    if key is None or cache.get(key):
+        return None
+    return random.choice(REPLICAS)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads to the replica chosen for the current request and every
+    write to the primary. Outside a routed request (shell, management
+    commands, writes) all queries go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        if db in REPLICAS:
+            return False
+        return None
+
+
+class TenantShardRouter:
+    """
+    Sends tenant-owned models to their tenant's shard. Saves follow the
+    instance's tenant, queries the tenant of the current request or
+    ``sharding.tenant_context``. Everything else, and tenants on 'default',
+    fall through to the next router.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not sharding.is_sharded(model):
+            return None
+
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # related objects live next to the row they hang off
+            return instance._state.db
+        database = sharding.current_database()
+        return database if database != DEFAULT_DB_ALIAS else None
+
+    def db_for_write(self, model, **hints):
+        if not sharding.is_sharded(model):
+            return None
+
+        instance = hints.get('instance')
+        tenant_id = None
+        if isinstance(instance, model):
+            tenant_id = sharding.instance_tenant_id(model, instance)
+        if tenant_id is None:
+            tenant_id = sharding.current_tenant_id()
+
+        database, read_only = sharding.get_shard(tenant_id)
+        if read_only:
+            raise sharding.TenantMoving()
+        return database if database != DEFAULT_DB_ALIAS else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # tenant rows stay on 'default' and are copied to shards, so rows on
+        # any of our databases may point at each other
+        if not sharding.SHARDS:
+            return None
+        pool = {DEFAULT_DB_ALIAS, *sharding.SHARDS, *REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
@@ -0,0 +1,231 @@
+import re
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import Product
+
+SEARCH_MAX_RESULTS = getattr(settings, 'PRODUCT_SEARCH_MAX_RESULTS', 100)
+
+# at most this many words of a query are used
+MAX_TERMS = 8
+
+TERM_RE = re.compile(r'\w+')
+
+# saves that don't touch these leave the index as it is
+INDEXED_FIELDS = frozenset({'tenant', 'tenant_id', 'name', 'description'})
+
+
+def search_terms(query):
+    return TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class SearchBackend:
+    """
+    Product search index for one database vendor.
+
+    The base class has no index: ``search`` returns None and callers fall
+    back to ``icontains`` filtering.
+    """
+
+    def is_available(self, connection):
+        return False
+
+    def search(self, connection, tenant_id, terms, limit):
+        return None
+
+    def index(self, connection, rows):
+        pass
+
+    def remove(self, connection, product_ids):
+        pass
+
+    def rebuild(self, connection, tenant_id=None):
+        return 0
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5 table ``product_search`` with the product id as rowid.
+
+    The tenant is stored as an indexed ``t<id>`` token so each query only
+    walks that tenant's postings. Results are ranked by bm25, with name
+    matches weighted above description matches.
+    """
+
+    def is_available(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'"
+            )
+            return cursor.fetchone() is not None
+
+    def search(self, connection, tenant_id, terms, limit):
+        # the words are only matched against name and description, or "t5" would find tenant 5's products
+        words = ' AND '.join(f'"{term}"*' for term in terms)
+        match = f'tenant:t{int(tenant_id)} AND {{name description}}: ({words})'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid FROM product_search WHERE product_search MATCH %s "
+                "ORDER BY bm25(product_search, 0.0, 10.0, 1.0) LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, connection, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO product_search (rowid, tenant, name, description) "
+                "VALUES (%s, %s, %s, %s)",
+                [(pk, f't{tenant_id}', name, description) for pk, tenant_id, name, description in rows],
+            )
+
+    def remove(self, connection, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "DELETE FROM product_search WHERE rowid = %s",
+                [(pk,) for pk in product_ids],
+            )
+
+    def rebuild(self, connection, tenant_id=None):
+        with connection.cursor() as cursor:
+            if tenant_id is None:
+                cursor.execute("DELETE FROM product_search")
+                cursor.execute(
+                    "INSERT INTO product_search (rowid, tenant, name, description) "
+                    "SELECT id, 't' || tenant_id, name, description FROM products"
+                )
+            else:
+                cursor.execute(
+                    "DELETE FROM product_search WHERE rowid IN "
+                    "(SELECT rowid FROM product_search WHERE product_search MATCH %s)",
+                    [f'tenant:t{int(tenant_id)}'],
+                )
+                cursor.execute(
+                    "INSERT INTO product_search (rowid, tenant, name, description) "
+                    "SELECT id, 't' || tenant_id, name, description FROM products WHERE tenant_id = %s",
+                    [tenant_id],
+                )
+            return cursor.rowcount
+
+
+# name is weighted above description; the 'simple' config keeps SKUs and brand names intact
+PG_DOCUMENT = "setweight(to_tsvector('simple', {name}), 'A') || setweight(to_tsvector('simple', {description}), 'B')"
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    ``product_search`` table holding a weighted tsvector per product, with a
+    GIN index on the document and a btree index on the tenant.
+    """
+
+    def is_available(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('product_search') IS NOT NULL")
+            return cursor.fetchone()[0]
+
+    def search(self, connection, tenant_id, terms, limit):
+        tsquery = ' & '.join(f"'{term}':*" for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT product_id FROM product_search, to_tsquery('simple', %s) q "
+                "WHERE tenant_id = %s AND document @@ q "
+                "ORDER BY ts_rank(document, q) DESC, product_id DESC LIMIT %s",
+                [tsquery, tenant_id, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, connection, rows):
+        document = PG_DOCUMENT.format(name='%s', description='%s')
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO product_search (product_id, tenant_id, document) "
+                f"VALUES (%s, %s, {document}) "
+                "ON CONFLICT (product_id) DO UPDATE "
+                "SET tenant_id = EXCLUDED.tenant_id, document = EXCLUDED.document",
+                list(rows),
+            )
+
+    def remove(self, connection, product_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM product_search WHERE product_id = ANY(%s)",
+                [list(product_ids)],
+            )
+
+    def rebuild(self, connection, tenant_id=None):
+        document = PG_DOCUMENT.format(name='name', description='description')
+        with connection.cursor() as cursor:
+            if tenant_id is None:
+                cursor.execute("DELETE FROM product_search")
+                cursor.execute(
+                    "INSERT INTO product_search (product_id, tenant_id, document) "
+                    f"SELECT id, tenant_id, {document} FROM products"
+                )
+            else:
+                cursor.execute("DELETE FROM product_search WHERE tenant_id = %s", [tenant_id])
+                cursor.execute(
+                    "INSERT INTO product_search (product_id, tenant_id, document) "
+                    f"SELECT id, tenant_id, {document} FROM products WHERE tenant_id = %s",
+                    [tenant_id],
+                )
+            return cursor.rowcount
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+_available = {}
+
+
+def get_backend(connection):
+    """Return the search backend for ``connection``, or None if it has no index"""
+    if connection.alias not in _available:
+        backend = BACKENDS.get(connection.vendor, SearchBackend())
+        _available[connection.alias] = backend if backend.is_available(connection) else None
+    return _available[connection.alias]
+
+
+def search_products(tenant_id, query, limit=SEARCH_MAX_RESULTS, using=None):
+    """
+    Return ids of the tenant's products matching every word of ``query`` as a
+    prefix, best match first. Returns None when the database has no search
+    index, in which case callers should fall back to ``icontains``.
+    """
+    connection = connections[using or router.db_for_read(Product)]
+    backend = get_backend(connection)
+    if backend is None:
+        return None
+
+    terms = search_terms(query)
+    if not terms:
+        return []
+    return backend.search(connection, tenant_id, terms, limit)
+
+
+def index_products(products, using=None):
+    connection = connections[using or router.db_for_write(Product)]
+    backend = get_backend(connection)
+    if backend is not None:
+        backend.index(connection, [
+            (product.pk, product.tenant_id, product.name, product.description)
+            for product in products
+        ])
+
+
+def remove_products(product_ids, using=None):
+    connection = connections[using or router.db_for_write(Product)]
+    backend = get_backend(connection)
+    if backend is not None:
+        backend.remove(connection, product_ids)
+
+
+def rebuild_index(tenant_id=None, using=None):
+    """Rebuild the index for one tenant, or all of them, from the products table"""
+    connection = connections[using or router.db_for_write(Product)]
+    backend = get_backend(connection)
+    if backend is None:
+        return None
+    return backend.rebuild(connection, tenant_id)
@@ -1,10 +1,12 @@
 from rest_framework import serializers
-from .models import Tenant, User, Product, Order, OrderItem
+from .models import Tenant, User, Product, Order, OrderItem, StockReservation, StockReservationItem
 from django.contrib.auth.password_validation import validate_password
-from django.db import transaction
-import uuid
+from .checkout import place_order
+from .metrics import TimedSerializerMixin, serializing
+from .reservations import reserve
+from . import sharding
 
-class TenantSerializer(serializers.ModelSerializer):
+class TenantSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tenant
         fields = ['id', 'name', 'store_name', 'contact_email', 'contact_phone', 
@@ -21,6 +23,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         model = User
         fields = ['username', 'email', 'password', 'password2', 'first_name', 
                   'last_name', 'phone', 'address', 'role', 'tenant_id']
+        # checked in validate() on the tenant's shard, not the request's
+        extra_kwargs = {'username': {'validators': [User.username_validator]}}
 
     def validate(self, attrs):
         if attrs['password'] != attrs['password2']:
@@ -30,6 +34,10 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             tenant = Tenant.objects.get(id=attrs['tenant_id'])
         except Tenant.DoesNotExist:
             raise serializers.ValidationError({"tenant_id": "Invalid tenant ID."})
+
+        database = sharding.database_for(tenant.id)
+        if User.objects.using(database).filter(username=attrs['username']).exists():
+            raise serializers.ValidationError({"username": "A user with that username already exists."})
         
         attrs['tenant'] = tenant
         return attrs
@@ -43,7 +51,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     tenant_name = serializers.CharField(source='tenant.store_name', read_only=True)
     
     class Meta:
@@ -53,24 +61,101 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'tenant']
 
 
-class ProductSerializer(serializers.ModelSerializer):
-    created_by_username = serializers.CharField(source='created_by.username', read_only=True)
+class SparseFieldsMixin:
+    """
+    ``fields=[...]`` keeps only those fields. ``columns`` maps the fields
+    that aren't a model column of the same name to the ``.values()`` lookup
+    they read, so views can select just what is shown.
+    """
+
+    columns = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def parse_fields(cls, value):
+        """``?fields=a,b`` as field names, or None for every field"""
+        names = list(dict.fromkeys(name.strip() for name in (value or '').split(',') if name.strip()))
+        if not names:
+            return None
+        unknown = [name for name in names if name not in cls.Meta.fields]
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}"})
+        return names
+
+    @classmethod
+    def column_for(cls, name):
+        return cls.columns.get(name, name)
+
+    def represent_values(self, rows):
+        """``to_representation`` for ``.values()`` rows, without building model instances"""
+        readers = []
+        for field in self._readable_fields:
+            column = self.column_for(field.field_name)
+            # relations come back from .values() already as the id or column shown
+            convert = None if isinstance(field, serializers.RelatedField) or '__' in column else field.to_representation
+            readers.append((field.field_name, column, convert))
+
+        data = []
+        with serializing():
+            for row in rows:
+                item = {}
+                for name, column, convert in readers:
+                    value = row[column]
+                    item[name] = value if value is None or convert is None else convert(value)
+                data.append(item)
+        return data
+
+
+class ProductSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    # null rather than missing without a creator, as .values() rows give it
+    created_by_username = serializers.CharField(source='created_by.username', read_only=True, allow_null=True)
+    # stock - reserved; .values() rows get it from product_values()
+    available = serializers.IntegerField(read_only=True)
+
+    columns = {'created_by_username': 'created_by__username'}
     
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'stock', 'category', 
+        fields = ['id', 'sku', 'name', 'description', 'price', 'stock', 'available', 'category', 
                   'image_url', 'is_active', 'created_by', 'created_by_username', 
                   'created_at', 'updated_at']
         read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
 
+    def validate_sku(self, value):
+        if not value:
+            return None
+
+        request = self.context.get('request')
+        queryset = Product.objects.filter(tenant_id=request.user.tenant_id, sku=value)
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError("A product with this SKU already exists.")
+        return value
+
     def create(self, validated_data):
         request = self.context.get('request')
-        validated_data['tenant'] = request.user.tenant
-        validated_data['created_by'] = request.user
+        validated_data['tenant_id'] = request.user.tenant_id
+        validated_data['created_by_id'] = request.user.id
         return super().create(validated_data)
 
+    def update(self, instance, validated_data):
+        # only write the fields sent, so reserved units counted meanwhile aren't overwritten
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    # a plain id, so validating an order doesn't fetch its products one by one;
+    # place_order checks they exist for the tenant in a single query
+    product = serializers.IntegerField(source='product_id')
     product_name = serializers.CharField(source='product.name', read_only=True)
     
     class Meta:
@@ -79,7 +164,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'price', 'subtotal']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
     customer_name = serializers.CharField(source='customer.get_full_name', read_only=True)
     assigned_staff_name = serializers.CharField(source='assigned_staff.get_full_name', read_only=True)
@@ -89,48 +174,37 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'order_number', 'customer', 'customer_name', 'status', 
                   'total_amount', 'shipping_address', 'notes', 'assigned_staff', 
                   'assigned_staff_name', 'items', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'order_number', 'customer', 'total_amount', 'created_at', 'updated_at']
+        # status and staff change through their actions, which keep the rollups and outbox in step
+        read_only_fields = [
+            'id', 'order_number', 'customer', 'status', 'total_amount', 'assigned_staff', 'created_at', 'updated_at',
+        ]
+
+    def validate_items(self, value):
+        if not value:
+            raise serializers.ValidationError("At least one item is required.")
+        return value
+
+    def validate(self, attrs):
+        # read-only fields are otherwise dropped silently, and these used to be writable
+        if self.instance is not None:
+            errors = {
+                field: f"Use POST /orders/{self.instance.pk}/{action}/ to change this."
+                for field, action in (('status', 'update_status'), ('assigned_staff', 'assign_staff'))
+                if field in self.initial_data
+            }
+            if errors:
+                raise serializers.ValidationError(errors)
+        return attrs
 
-    @transaction.atomic
     def create(self, validated_data):
-        items_data = validated_data.pop('items')
         request = self.context.get('request')
-        
-        # Set tenant and customer automatically
-        validated_data['tenant'] = request.user.tenant
-        validated_data['customer'] = request.user
-        
-        validated_data['order_number'] = f"ORD-{uuid.uuid4().hex[:8].upper()}"
-        
-        # calculating total
-        total = 0
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = item_data['quantity']
-            
-            # stock check
-            if product.stock < quantity:
-                raise serializers.ValidationError(
-                    f"Insufficient stock for {product.name}. Available: {product.stock}"
-                )
-            
-            item_data['price'] = product.price
-            total += product.price * quantity
-        
-        validated_data['total_amount'] = total
-        
-        order = Order.objects.create(**validated_data)
-        
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = item_data['quantity']
-            
-            OrderItem.objects.create(order=order, **item_data)
-            
-            product.stock -= quantity
-            product.save()
-        
-        return order
+
+        # tenant and customer come from the authenticated user
+        return place_order(
+            tenant_id=request.user.tenant_id,
+            customer_id=request.user.id,
+            **validated_data,
+        )
 
     def update(self, instance, validated_data):
         validated_data.pop('items', None)
@@ -138,12 +212,57 @@ class OrderSerializer(serializers.ModelSerializer):
         
         return super().update(instance, validated_data)
 
-class OrderListSerializer(serializers.ModelSerializer):
+class StockReservationItemSerializer(serializers.ModelSerializer):
+    product = serializers.IntegerField(source='product_id')
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = StockReservationItem
+        fields = ['product', 'product_name', 'quantity']
+
+
+class StockReservationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    items = StockReservationItemSerializer(many=True)
+
+    class Meta:
+        model = StockReservation
+        fields = ['id', 'items', 'expires_at', 'created_at']
+        read_only_fields = ['id', 'expires_at', 'created_at']
+
+    def validate_items(self, value):
+        if not value:
+            raise serializers.ValidationError("At least one item is required.")
+        return value
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        return reserve(
+            tenant_id=request.user.tenant_id,
+            customer_id=request.user.id,
+            items=validated_data['items'],
+        )
+
+
+class ReservationCheckoutSerializer(serializers.ModelSerializer):
+    """Order details given when a reservation is turned into an order"""
+
+    class Meta:
+        model = Order
+        fields = ['shipping_address', 'notes']
+
+
+class OrderListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Simplified serializer for order listing"""
     customer_name = serializers.CharField(source='customer.get_full_name', read_only=True)
-    items_count = serializers.IntegerField(source='items.count', read_only=True)
+    # annotated by the queryset with Count('items')
+    items_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Order
         fields = ['id', 'order_number', 'customer_name', 'status', 'total_amount', 
                   'items_count', 'created_at']
+
+
+class ClaimedOrderSerializer(OrderListSerializer):
+    """``OrderListSerializer`` for the orders ``claim_orders`` returns, with customer_name annotated by the UPDATE"""
+    customer_name = serializers.CharField(read_only=True)
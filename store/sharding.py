@@ -0,0 +1,358 @@
+"""
+Tenant sharding: each tenant's rows live in one database, its shard.
+
+``TenantShard`` rows on the default database map tenants to database
+aliases; tenants without one live on ``default``. ``TenantShardRouter``
+sends the models in ``SHARDED_MODELS`` to the current tenant's shard, and
+``move_tenant`` moves a tenant between shards while it stays online.
+
+With ``TENANT_SHARDS`` empty (the default) none of this does anything.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.constants import OnConflict
+from rest_framework.exceptions import APIException
+
+from .models import (
+    Tenant, TenantShard, User, Product, ProductTombstone, Order, OrderItem,
+    DailySales, DailyStatusCount, DailyProductSales, OutboxEvent,
+    StockReservation, StockReservationItem, IdempotencyKey,
+)
+
+# database aliases that can hold tenants besides 'default'
+SHARDS = list(getattr(settings, 'TENANT_SHARDS', []))
+
+# how long processes trust a cached shard map entry; moves wait this long
+# after changing it so every process has seen the change
+SHARD_MAP_TTL = getattr(settings, 'TENANT_SHARD_MAP_TTL', 30)
+
+MOVE_BATCH_SIZE = getattr(settings, 'TENANT_MOVE_BATCH_SIZE', 1000)
+
+# tenant-owned models, parents before children, with the lookup to their tenant
+SHARDED_MODELS = [
+    (User, 'tenant_id'),
+    (Product, 'tenant_id'),
+    (Order, 'tenant_id'),
+    (OrderItem, 'order__tenant_id'),
+    (ProductTombstone, 'tenant_id'),
+    (StockReservation, 'tenant_id'),
+    (StockReservationItem, 'reservation__tenant_id'),
+    (DailySales, 'tenant_id'),
+    (DailyStatusCount, 'tenant_id'),
+    (DailyProductSales, 'tenant_id'),
+    (OutboxEvent, 'tenant_id'),
+    (IdempotencyKey, 'tenant_id'),
+]
+
+# rows never change once written, so a move only has to copy new ones
+APPEND_ONLY = {OrderItem, ProductTombstone, StockReservationItem}
+
+_sharded = {model for model, _ in SHARDED_MODELS}
+
+
+class TenantMoving(APIException):
+    status_code = 503
+    default_detail = 'This store is being moved. Please retry in a few seconds.'
+    default_code = 'tenant_moving'
+
+
+class ShardMoveError(Exception):
+    pass
+
+
+def is_sharded(model):
+    return bool(SHARDS) and model in _sharded
+
+
+def shard_map_key(tenant_id):
+    return f'tenant-shard:{tenant_id}'
+
+
+def get_shard(tenant_id):
+    """Return ``(database, read_only)`` for a tenant, from the cached shard map"""
+    if not SHARDS or tenant_id is None:
+        return DEFAULT_DB_ALIAS, False
+
+    key = shard_map_key(tenant_id)
+    entry = cache.get(key)
+    if entry is None:
+        row = TenantShard.objects.using(DEFAULT_DB_ALIAS).filter(
+            tenant_id=tenant_id
+        ).values_list('database', 'read_only').first()
+        entry = tuple(row) if row else (DEFAULT_DB_ALIAS, False)
+        cache.set(key, entry, SHARD_MAP_TTL)
+    return entry
+
+
+def database_for(tenant_id):
+    return get_shard(tenant_id)[0]
+
+
+def set_shard(tenant_id, database, read_only=False):
+    TenantShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        tenant_id=tenant_id, defaults={'database': database, 'read_only': read_only},
+    )
+    cache.delete(shard_map_key(tenant_id))
+
+
+class ShardContext:
+    """
+    The tenant whose shard queries go to. The tenant can be resolved lazily,
+    so requests that never touch a sharded model never look it up.
+    """
+
+    def __init__(self, tenant_id=None, resolve=None):
+        self._tenant_id = tenant_id
+        self._resolve = resolve
+        self._database = None
+
+    @property
+    def tenant_id(self):
+        if self._resolve is not None:
+            self._tenant_id = self._resolve()
+            self._resolve = None
+        return self._tenant_id
+
+    @property
+    def database(self):
+        if self._database is None:
+            self._database = database_for(self.tenant_id)
+        return self._database
+
+    def activate(self, tenant_id):
+        self._tenant_id = tenant_id
+        self._resolve = None
+        self._database = None
+
+
+_context = ContextVar('shard_context', default=None)
+
+
+@contextmanager
+def tenant_context(tenant_id=None, resolve=None):
+    """Send sharded queries in the block to ``tenant_id``'s shard (or the one ``resolve()`` returns)"""
+    token = _context.set(ShardContext(tenant_id, resolve))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def activate(tenant_id):
+    """Pin the current tenant context, e.g. once a token names the tenant"""
+    context = _context.get()
+    if context is not None and tenant_id is not None:
+        context.activate(tenant_id)
+
+
+def current_tenant_id():
+    context = _context.get()
+    return context.tenant_id if context is not None else None
+
+
+def current_database():
+    context = _context.get()
+    return context.database if context is not None else DEFAULT_DB_ALIAS
+
+
+def instance_tenant_id(model, instance):
+    path = dict(SHARDED_MODELS)[model]
+    value = instance
+    for part in path.split('__'):
+        value = getattr(value, part, None)
+        if value is None:
+            return None
+    return value
+
+
+def move_tenant(tenant_id, target, batch_size=MOVE_BATCH_SIZE, settle=SHARD_MAP_TTL, log=print):
+    """
+    Move a tenant's rows to the ``target`` database while it stays online.
+
+    1. Copy every row that exists now, in batches, while the tenant keeps
+       reading and writing its old shard.
+    2. Freeze the tenant (writes get a 503), wait ``settle`` seconds for
+       every process to see it, then copy what changed in one transaction.
+    3. Point the shard map at ``target`` and unfreeze.
+    4. Wait ``settle`` seconds again and delete the rows from the old shard.
+
+    Row ids are kept, so ``target`` must not have used them for another
+    tenant: give each shard its own id range (``init_shard --id-start``).
+    Group and permission memberships of the tenant's users are not moved.
+    """
+    from .search import rebuild_index, remove_products
+    from . import catalog_cache
+
+    if target != DEFAULT_DB_ALIAS and target not in SHARDS:
+        raise ShardMoveError(f'{target} is not in TENANT_SHARDS')
+    source, read_only = get_shard(tenant_id)
+    if read_only:
+        raise ShardMoveError(f'Tenant {tenant_id} is already being moved')
+    if source == target:
+        raise ShardMoveError(f'Tenant {tenant_id} is already on {target}')
+
+    tenant = Tenant.objects.using(DEFAULT_DB_ALIAS).get(pk=tenant_id)
+    if target != DEFAULT_DB_ALIAS:
+        # a copy of the tenant row, for the foreign keys; 'default' stays authoritative
+        upsert(Tenant, [tenant], target)
+
+    # rows past these ids were written after the copy started and wait for the delta
+    high_water = {
+        model: max_pk(model, path, tenant_id, source) for model, path in SHARDED_MODELS
+    }
+    for model, path in SHARDED_MODELS:
+        copied = copy_rows(model, path, tenant_id, source, target, high_water[model], batch_size)
+        log(f'copied {copied} {model._meta.verbose_name_plural}')
+
+    set_shard(tenant_id, source, read_only=True)
+    log(f'frozen; waiting {settle}s for in-flight writes')
+    time.sleep(settle)
+
+    try:
+        with transaction.atomic(using=target):
+            for model, path in reversed(SHARDED_MODELS):
+                deleted = delete_missing(model, path, tenant_id, source, target, batch_size)
+                if deleted:
+                    log(f'delta: removed {deleted} {model._meta.verbose_name_plural}')
+            for model, path in SHARDED_MODELS:
+                changed = copy_changes(model, path, tenant_id, source, target, batch_size)
+                if changed:
+                    log(f'delta: copied {changed} {model._meta.verbose_name_plural}')
+    except Exception:
+        set_shard(tenant_id, source)
+        raise
+
+    rebuild_index(tenant_id, using=target)
+    set_shard(tenant_id, target)
+    catalog_cache.bump_version(tenant_id)
+    log(f'tenant {tenant_id} now on {target}; waiting {settle}s before cleaning up {source}')
+    time.sleep(settle)
+
+    remove_products(list(tenant_pks(Product, 'tenant_id', tenant_id, source)), using=source)
+    for through in (User.groups.through, User.user_permissions.through):
+        raw_delete(through, source, tenant_pks(through, 'user__tenant_id', tenant_id, source), batch_size)
+    for model, path in reversed(SHARDED_MODELS):
+        raw_delete(model, source, tenant_pks(model, path, tenant_id, source), batch_size)
+    if source != DEFAULT_DB_ALIAS:
+        raw_delete(Tenant, source, [tenant_id], batch_size)
+    log(f'removed tenant {tenant_id} from {source}')
+
+
+def max_pk(model, path, tenant_id, using):
+    return model.objects.using(using).filter(**{path: tenant_id}).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def upsert(model, rows, using):
+    """
+    Insert ``rows`` or overwrite them by id. A raw insert like loaddata's, so
+    ``auto_now`` timestamps are copied rather than reset to now.
+    """
+    fields = model._meta.concrete_fields
+    model._base_manager.using(using)._insert(
+        rows,
+        fields=fields,
+        raw=True,
+        on_conflict=OnConflict.UPDATE,
+        update_fields=[field for field in fields if not field.primary_key],
+        unique_fields=[model._meta.pk],
+    )
+
+
+def copy_batch(model, path, tenant_id, target, rows):
+    taken = model.objects.using(target).filter(pk__in=[row.pk for row in rows]).exclude(**{path: tenant_id})
+    if taken.exists():
+        raise ShardMoveError(
+            f'{model._meta.db_table} ids on {target} are already used by another tenant; '
+            f'give each shard its own id range with init_shard --id-start'
+        )
+    upsert(model, rows, target)
+
+
+def copy_rows(model, path, tenant_id, source, target, up_to, batch_size):
+    """Copy the tenant's rows with ids up to ``up_to``, in id order, one batch per query"""
+    copied, last = 0, 0
+    queryset = model.objects.using(source).filter(**{path: tenant_id}, pk__lte=up_to).order_by('pk')
+    while True:
+        rows = list(queryset.filter(pk__gt=last)[:batch_size])
+        if not rows:
+            return copied
+        copy_batch(model, path, tenant_id, target, rows)
+        copied += len(rows)
+        last = rows[-1].pk
+
+
+def is_versioned(model):
+    return any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+
+
+def versions(model, path, tenant_id, using):
+    """``{pk: updated_at}``, or ``{pk: None}`` for models without one"""
+    queryset = model.objects.using(using).filter(**{path: tenant_id})
+    if is_versioned(model):
+        return dict(queryset.values_list('pk', 'updated_at'))
+    return dict.fromkeys(queryset.values_list('pk', flat=True))
+
+
+def delete_missing(model, path, tenant_id, source, target, batch_size):
+    gone = versions(model, path, tenant_id, target).keys() - versions(model, path, tenant_id, source).keys()
+    return raw_delete(model, target, gone, batch_size)
+
+
+def copy_changes(model, path, tenant_id, source, target, batch_size):
+    """Copy rows that are new or changed since the bulk copy"""
+    current = versions(model, path, tenant_id, source)
+    copied = versions(model, path, tenant_id, target)
+    if model in APPEND_ONLY:
+        changed = current.keys() - copied.keys()
+    elif is_versioned(model):
+        changed = [pk for pk, version in current.items() if copied.get(pk, 0) != version]
+    else:
+        # nothing to compare on, so copy them all again
+        changed = list(current)
+
+    changed = sorted(changed)
+    for start in range(0, len(changed), batch_size):
+        rows = list(model.objects.using(source).filter(pk__in=changed[start:start + batch_size]))
+        copy_batch(model, path, tenant_id, target, rows)
+    return len(changed)
+
+
+def raw_delete(model, using, pks, batch_size):
+    """Delete rows by id without signals or cascades; callers delete children first"""
+    pks = sorted(pks)
+    deleted = 0
+    for start in range(0, len(pks), batch_size):
+        queryset = model._base_manager.using(using).filter(pk__in=pks[start:start + batch_size])
+        deleted += queryset._raw_delete(using)
+    return deleted
+
+
+def tenant_pks(model, path, tenant_id, using):
+    return model._base_manager.using(using).filter(**{path: tenant_id}).values_list('pk', flat=True)
+
+
+def init_shard(using, id_start):
+    """
+    Start the id sequences of a new shard at ``id_start``, so its ids never
+    clash with other shards'. Copied rows keep their ids and leave PostgreSQL
+    sequences alone; SQLite moves its counter past the largest id, so there
+    only move tenants to shards with higher ranges.
+    """
+    connection = connections[using]
+    tables = [model._meta.db_table for model, _ in SHARDED_MODELS]
+    with connection.cursor() as cursor:
+        for table in tables:
+            if connection.vendor == 'sqlite':
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s', [table])
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, id_start - 1])
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)", [table, id_start]
+                )
+            else:
+                raise ShardMoveError(f'Setting id ranges is not supported on {connection.vendor}')
@@ -0,0 +1,45 @@
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .authentication import user_state_cache_key
+from .models import Tenant, User, Product, ProductTombstone
+from .search import INDEXED_FIELDS, index_products, remove_products
+from . import catalog_cache, metrics
+from .tenancy import tenant_cache
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    metrics.install(connection)
+
+
+@receiver([post_save, post_delete], sender=Tenant)
+def invalidate_tenant_cache(sender, instance, **kwargs):
+    tenant_cache.invalidate(instance)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_state(sender, instance, **kwargs):
+    cache.delete(user_state_cache_key(instance.pk))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is None or not update_fields.isdisjoint(INDEXED_FIELDS):
+        index_products([instance], using=using)
+    catalog_cache.invalidate_tenant(instance.tenant_id)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    remove_products([instance.pk], using=using)
+    catalog_cache.invalidate_tenant(instance.tenant_id)
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, using, origin=None, **kwargs):
+    # a deleted tenant, or queryset of them, takes its tombstones with it
+    if isinstance(origin, Tenant) or getattr(origin, 'model', None) is Tenant:
+        return
+    ProductTombstone.objects.using(using).create(tenant_id=instance.tenant_id, product_id=instance.pk)
@@ -0,0 +1,123 @@
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Product, ProductTombstone
+
+SYNC_PAGE_SIZE = getattr(settings, 'CATALOG_SYNC_PAGE_SIZE', 200)
+SYNC_MAX_PAGE_SIZE = getattr(settings, 'CATALOG_SYNC_MAX_PAGE_SIZE', 1000)
+
+# rows newer than this are held back until transactions that stamped an
+# earlier updated_at have had time to commit, so the feed never skips them
+SYNC_SETTLE_SECONDS = getattr(settings, 'CATALOG_SYNC_SETTLE_SECONDS', 5)
+
+# tombstones older than this are purged; clients that haven't synced for
+# longer have to start again from an empty cursor
+TOMBSTONE_RETENTION_DAYS = getattr(settings, 'CATALOG_TOMBSTONE_RETENTION_DAYS', 90)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class ExpiredCursor(InvalidCursor):
+    """The cursor is older than the tombstones kept, so deletes may have been missed"""
+
+
+def encode_cursor(updated_at, product_id, tombstone_id, deletes_seen_until):
+    raw = (
+        f"{updated_at.isoformat() if updated_at else ''}|{product_id}|{tombstone_id}"
+        f"|{deletes_seen_until.isoformat()}"
+    )
+    return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """
+    Return ``(updated_at, product_id, tombstone_id)``; an empty cursor starts
+    from the beginning. Raises ``ExpiredCursor`` when tombstones the client
+    hasn't seen may already have been purged.
+    """
+    if not encoded:
+        return None, 0, 0
+
+    try:
+        raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+        parts = raw.split('|')
+        if len(parts) == 3:
+            # from before cursors said how far deletes were seen
+            raise ExpiredCursor(encoded)
+        updated_at, product_id, tombstone_id, deletes_seen_until = parts
+        cursor = (
+            datetime.fromisoformat(updated_at) if updated_at else None,
+            int(product_id),
+            int(tombstone_id),
+        )
+        deletes_seen_until = datetime.fromisoformat(deletes_seen_until)
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor(encoded)
+
+    if deletes_seen_until < timezone.now() - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+        raise ExpiredCursor(encoded)
+    return cursor
+
+
+def changes_since(tenant_id, cursor, limit=SYNC_PAGE_SIZE, queryset=None):
+    """
+    Return one page of a tenant's catalog changes after ``cursor``.
+
+    Products are walked in ``(updated_at, id)`` order off the
+    ``(tenant, updated_at, id)`` index, and deletes come from tombstones in
+    id order. The result is ``(products, deleted_ids, next_cursor, has_more)``,
+    and the work done is proportional to the number of changes, not the size
+    of the catalog.
+    """
+    updated_at, product_id, tombstone_id = decode_cursor(cursor)
+    settled = timezone.now() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+
+    products = queryset if queryset is not None else Product.objects.all()
+    products = products.filter(tenant_id=tenant_id, updated_at__lte=settled)
+    if updated_at is not None:
+        products = products.filter(updated_at__gte=updated_at).filter(
+            Q(updated_at__gt=updated_at) | Q(id__gt=product_id)
+        )
+    products = list(products.order_by('updated_at', 'id')[:limit + 1])
+
+    tombstones = list(
+        ProductTombstone.objects.filter(
+            tenant_id=tenant_id, id__gt=tombstone_id, deleted_at__lte=settled,
+        ).order_by('id').values_list('id', 'product_id', 'deleted_at')[:limit + 1]
+    )
+
+    has_more = len(products) > limit or len(tombstones) > limit
+    # every delete up to here is in this page or an earlier one
+    deletes_seen_until = tombstones[limit - 1][2] if len(tombstones) > limit else settled
+    products = products[:limit]
+    tombstones = tombstones[:limit]
+
+    if products:
+        updated_at, product_id = products[-1].updated_at, products[-1].pk
+    if tombstones:
+        tombstone_id = tombstones[-1][0]
+
+    next_cursor = encode_cursor(updated_at, product_id, tombstone_id, deletes_seen_until)
+    return products, [deleted for _, deleted, _ in tombstones], next_cursor, has_more
+
+
+def purge_tombstones(using=DEFAULT_DB_ALIAS, batch_size=1000):
+    """Delete tombstones past the retention period on ``using`` in batches; returns how many were deleted"""
+    cutoff = timezone.now() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        expired = list(
+            ProductTombstone.objects.using(using)
+            .filter(deleted_at__lt=cutoff)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not expired:
+            return deleted
+        deleted += ProductTombstone.objects.using(using).filter(pk__in=expired).delete()[0]
@@ -0,0 +1,142 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Tenant
+
+
+class TenantCache:
+    """
+    Bounded, in-process LRU cache of tenant lookups.
+
+    Entries are keyed by the lookup field and value (``id``, ``subdomain`` or
+    ``domain``) and expire after ``ttl`` seconds. Lookups that match no tenant
+    are cached as ``None`` for ``negative_ttl`` seconds so unknown hosts don't
+    hit the database on every request.
+    """
+
+    def __init__(self, max_size=1024, ttl=300, negative_ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, field, value):
+        key = (field, str(value))
+        found, tenant = self._lookup(key)
+        if not found:
+            try:
+                tenant = Tenant.objects.get(**{field: value})
+            except Tenant.DoesNotExist:
+                tenant = None
+            self._store(key, tenant)
+
+        return copy.copy(tenant) if tenant is not None else None
+
+    async def aget(self, field, value):
+        """Async ``get()``; the lock is never held across the database await"""
+        key = (field, str(value))
+        found, tenant = self._lookup(key)
+        if not found:
+            try:
+                tenant = await Tenant.objects.aget(**{field: value})
+            except Tenant.DoesNotExist:
+                tenant = None
+            self._store(key, tenant)
+
+        return copy.copy(tenant) if tenant is not None else None
+
+    def get_by_id(self, tenant_id):
+        # header values are user input, so don't let a bad id reach the ORM
+        if not str(tenant_id).isdigit():
+            return None
+        return self.get('id', int(tenant_id))
+
+    async def aget_by_id(self, tenant_id):
+        if not str(tenant_id).isdigit():
+            return None
+        return await self.aget('id', int(tenant_id))
+
+    def _lookup(self, key):
+        """Return ``(found, tenant)`` for a live entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, tenant = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return True, tenant
+                del self._entries[key]
+        return False, None
+
+    def _store(self, key, tenant):
+        ttl = self.ttl if tenant is not None else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, tenant)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tenant):
+        """Drop every entry for ``tenant`` plus all negative entries"""
+        with self._lock:
+            stale = [
+                key for key, (_, cached) in self._entries.items()
+                if cached is None or cached.pk == tenant.pk
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+tenant_cache = TenantCache(
+    max_size=getattr(settings, 'TENANT_CACHE_MAX_SIZE', 1024),
+    ttl=getattr(settings, 'TENANT_CACHE_TTL', 300),
+    negative_ttl=getattr(settings, 'TENANT_CACHE_NEGATIVE_TTL', 30),
+)
+
+
+def tenant_lookup(request):
+    """The ``(field, value)`` lookups to try for a request, in order"""
+    tenant_id = request.META.get('HTTP_X_TENANT_ID')
+    if tenant_id:
+        return [('id', tenant_id)]
+
+    host = request.get_host().split(':')[0]
+    lookups = [('domain', host)]
+    if '.' in host:
+        lookups.append(('subdomain', host.split('.')[0]))
+    return lookups
+
+
+def resolve_tenant(request):
+    """Resolve the active tenant from the X-Tenant-ID header, custom domain or subdomain"""
+    tenant = None
+    for field, value in tenant_lookup(request):
+        tenant = tenant_cache.get_by_id(value) if field == 'id' else tenant_cache.get(field, value)
+        if tenant is not None:
+            break
+
+    if tenant is not None and tenant.is_active:
+        return tenant
+    return None
+
+
+async def aresolve_tenant(request):
+    """Async ``resolve_tenant()``, for async views"""
+    tenant = None
+    for field, value in tenant_lookup(request):
+        tenant = await (tenant_cache.aget_by_id(value) if field == 'id' else tenant_cache.aget(field, value))
+        if tenant is not None:
+            break
+
+    if tenant is not None and tenant.is_active:
+        return tenant
+    return None
@@ -0,0 +1,1105 @@
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import ClaimsJWTAuthentication
+from .benchmarking import SEED_SUBDOMAIN_PREFIX
+from .checkout import claim_orders, place_order, take_stock
+from .importer import import_products
+from .management.commands.run_benchmark import SCENARIOS
+from .models import (
+    DailySales, DailyStatusCount, IdempotencyKey, Order, OrderItem, OutboxEvent, Product, ProductTombstone,
+    StockReservation, StockReservationItem, Tenant, User,
+)
+from .query_budget import QueryBudgetExceeded
+from .renderers import FastJSONRenderer
+from .reservations import release, release_expired, reserve
+from .search import search_products
+from .serializers import ProductSerializer
+from .tenancy import resolve_tenant, tenant_cache
+from .views import OrderViewSet
+from . import catalog_cache, metrics, outbox, routers, sharding, sync, throttling
+
+PASSWORD = 'Str0ng!pass'
+
+
+class StoreMixin:
+    """A tenant with an owner, a customer and some stock"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        tenant_cache.clear()
+        throttling.local_buckets.clear()
+
+        self.tenant = Tenant.objects.create(
+            name='acme', store_name='Acme', contact_email='shop@acme.test', contact_phone='0', subdomain='acme',
+        )
+        self.owner = self.create_user('owner', 'store_owner')
+        self.customer = self.create_user('customer', 'customer')
+        self.products = [
+            Product.objects.create(
+                tenant=self.tenant, name=f'Product {number}', description='', price=Decimal('9.99'),
+                stock=100, category='things', created_by=self.owner,
+            )
+            for number in range(3)
+        ]
+
+    def create_user(self, username, role):
+        return User.objects.create_user(
+            username=username, password=PASSWORD, tenant=self.tenant, role=role, first_name=username,
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        response = client.post('/api/auth/login/', {'username': user.username, 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return client
+
+    def place_orders(self, count):
+        for _ in range(count):
+            place_order(
+                tenant_id=self.tenant.id, customer_id=self.customer.id, shipping_address='1 Test Road',
+                items=[{'product_id': product.id, 'quantity': 1} for product in self.products],
+            )
+
+
+class TenantCacheTests(StoreMixin, TestCase):
+    def resolve(self, tenant_id):
+        return resolve_tenant(RequestFactory().get('/', HTTP_X_TENANT_ID=str(tenant_id)))
+
+    def test_cached(self):
+        self.assertEqual(self.resolve(self.tenant.id), self.tenant)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve(self.tenant.id), self.tenant)
+
+    def test_returns_copies(self):
+        self.resolve(self.tenant.id).store_name = 'changed'
+        self.assertEqual(self.resolve(self.tenant.id).store_name, 'Acme')
+
+    def test_save_invalidates(self):
+        self.resolve(self.tenant.id)
+        self.tenant.store_name = 'Acme Two'
+        self.tenant.save()
+        self.assertEqual(self.resolve(self.tenant.id).store_name, 'Acme Two')
+
+    def test_deactivation_invalidates(self):
+        self.resolve(self.tenant.id)
+        self.tenant.is_active = False
+        self.tenant.save()
+        self.assertIsNone(self.resolve(self.tenant.id))
+
+    def test_unknown_tenant_cached_until_a_tenant_is_saved(self):
+        missing = self.tenant.id + 1
+        self.assertIsNone(self.resolve(missing))
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.resolve(missing))
+
+        tenant = Tenant.objects.create(
+            id=missing, name='other', store_name='Other', contact_email='shop@other.test', contact_phone='0',
+            subdomain='other',
+        )
+        self.assertEqual(self.resolve(missing), tenant)
+
+    def test_bad_header_skips_database(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.resolve('1 OR 1=1'))
+
+
+class ClaimsAuthenticationTests(StoreMixin, TestCase):
+    def authenticate(self, user):
+        token = AccessToken.for_user(user)
+        for name, value in (('tenant_id', user.tenant_id), ('role', user.role), ('username', user.username)):
+            token[name] = value
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return ClaimsJWTAuthentication().authenticate(request)
+
+    def test_user_from_claims(self):
+        self.authenticate(self.customer)
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate(self.customer)
+            self.assertEqual((user.id, user.role, user.tenant_id), (self.customer.id, 'customer', self.tenant.id))
+        # anything else loads the row
+        self.assertEqual(user.email, self.customer.email)
+
+    def test_rejected_after_change(self):
+        changes = {
+            'role': lambda user: setattr(user, 'role', 'staff'),
+            'deactivated': lambda user: setattr(user, 'is_active', False),
+        }
+        for name, change in changes.items():
+            with self.subTest(name):
+                user = self.create_user(name, 'customer')
+                client = self.client_for(user)
+                self.assertEqual(client.get('/api/orders/').status_code, 200)
+                change(user)
+                user.save()
+                self.assertEqual(client.get('/api/orders/').status_code, 401)
+
+    def test_rejected_after_delete(self):
+        user = self.create_user('leaving', 'customer')
+        client = self.client_for(user)
+        self.assertEqual(client.get('/api/orders/').status_code, 200)
+        user.delete()
+        self.assertEqual(client.get('/api/orders/').status_code, 401)
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class OrderQueryBudgetTests(StoreMixin, TestCase):
+    def test_list_within_budget(self):
+        self.place_orders(5)
+        response = self.client_for(self.owner).get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_my_orders_within_budget(self):
+        self.place_orders(5)
+        response = self.client_for(self.customer).get('/api/orders/my_orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_claim_within_budget(self):
+        self.place_orders(3)
+        staff = self.create_user('staff', 'staff')
+        response = self.client_for(staff).post('/api/orders/claim/', {'count': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['claimed'], 2)
+
+        oldest = Order.objects.order_by('created_at', 'id')[:2]
+        self.assertEqual([order['id'] for order in response.data['orders']], [order.id for order in oldest])
+        for order in response.data['orders']:
+            self.assertEqual(order['items_count'], 3)
+            self.assertEqual(order['customer_name'], self.customer.get_full_name())
+            self.assertEqual(order['status'], 'pending')
+        self.assertEqual(Order.objects.filter(assigned_staff=staff).count(), 2)
+
+    def test_over_budget_raises(self):
+        self.place_orders(1)
+        client = self.client_for(self.owner)
+        budgets = {**OrderViewSet.query_budgets, 'list': 1}
+        with mock.patch.object(OrderViewSet, 'query_budgets', budgets), self.assertRaises(QueryBudgetExceeded):
+            client.get('/api/orders/')
+
+    def test_create_over_stale_idempotency_claim_within_budget(self):
+        client = self.client_for(self.customer)
+        # a claim left behind by a request that crashed
+        stale = IdempotencyKey.objects.create(
+            tenant=self.tenant, user=self.customer, key='retry', fingerprint='',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        IdempotencyKey.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+        response = client.post(
+            '/api/orders/',
+            {'shipping_address': '1 Test Road', 'items': [{'product': self.products[0].id, 'quantity': 1}]},
+            format='json', HTTP_IDEMPOTENCY_KEY='retry',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+
+
+class IdempotencyTests(StoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.customer)
+        self.body = {'shipping_address': '1 Test Road', 'items': [{'product': self.products[0].id, 'quantity': 2}]}
+
+    def post(self, body, key='order-1'):
+        return self.client.post('/api/orders/', body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay(self):
+        first = self.post(self.body)
+        self.assertEqual(first.status_code, 201, first.content)
+        second = self.post(self.body)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 98)
+
+    def test_different_body(self):
+        self.assertEqual(self.post(self.body).status_code, 201)
+        response = self.post({**self.body, 'notes': 'leave at the door'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_in_flight(self):
+        IdempotencyKey.objects.create(
+            tenant=self.tenant, user=self.customer, key='order-1', fingerprint='',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        with mock.patch('store.idempotency.fingerprint', return_value=''):
+            response = self.post(self.body)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Order.objects.exists())
+
+    def test_keys_per_user(self):
+        self.assertEqual(self.post(self.body).status_code, 201)
+        self.client = self.client_for(self.create_user('other', 'customer'))
+        response = self.post(self.body)
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_validation_error_replayed(self):
+        body = {**self.body, 'items': []}
+        first = self.post(body)
+        self.assertEqual(first.status_code, 400)
+        second = self.post(body)
+        self.assertEqual(second.status_code, 400)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+
+    def test_server_error_frees_key(self):
+        with mock.patch('store.serializers.place_order', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.post(self.body)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post(self.body).status_code, 201)
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class ProductFieldsTests(StoreMixin, TestCase):
+    def test_list_with_fields(self):
+        response = self.client_for(self.customer).get('/api/products/', {'fields': 'id,name,created_by_username'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0], {
+            'id': self.products[-1].id, 'name': self.products[-1].name, 'created_by_username': 'owner',
+        })
+
+    def test_list_matches_detail(self):
+        client = self.client_for(self.customer)
+        row = client.get('/api/products/').data['results'][0]
+        self.assertEqual(row, client.get(f"/api/products/{row['id']}/").data)
+
+    def test_unknown_field(self):
+        client = self.client_for(self.customer)
+        for path in ('/api/products/', '/api/async/products/'):
+            response = client.get(path, {'fields': 'name,secret'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('fields', response.json())
+
+
+class CatalogCacheTests(StoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.customer)
+
+    def get(self, url='/api/products/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertInvalidates(self, change):
+        version = catalog_cache.get_version(self.tenant.id)
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(catalog_cache.get_version(self.tenant.id), version)
+        response = self.get()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        return response
+
+    def test_hit(self):
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        hit = self.get()
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit.json(), self.get().json())
+
+    def test_product_save(self):
+        product = self.products[0]
+
+        def rename():
+            product.name = 'Renamed'
+            product.save()
+
+        response = self.assertInvalidates(rename)
+        self.assertIn('Renamed', [row['name'] for row in response.json()['results']])
+
+    def test_product_delete(self):
+        response = self.assertInvalidates(self.products[0].delete)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_take_stock(self):
+        product = self.products[0]
+        response = self.assertInvalidates(
+            lambda: take_stock(self.tenant.id, {product.pk: 5}, {product.pk: product}),
+        )
+        stock = {row['id']: row['stock'] for row in response.json()['results']}
+        self.assertEqual(stock[product.pk], 95)
+
+    def test_other_tenant_untouched(self):
+        other = Tenant.objects.create(
+            name='other', store_name='Other', contact_email='shop@other.test', contact_phone='0', subdomain='other',
+        )
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(tenant=other, name='Elsewhere', description='', price=Decimal('1.00'), stock=1,
+                                   category='things')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+
+class AsyncViewTests(StoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.place_orders(2)
+        self.order = Order.objects.first()
+
+    def assertSameAsSync(self, client, path):
+        expected = client.get(f'/api{path}')
+        response = client.get(f'/api/async{path}')
+        self.assertEqual(response.status_code, expected.status_code)
+        data, expected_data = response.json(), expected.json()
+        if 'results' in expected_data:
+            # page links point at their own urls
+            data, expected_data = data['results'], expected_data['results']
+        self.assertEqual(data, expected_data)
+
+    def test_matches_sync(self):
+        client = self.client_for(self.customer)
+        paths = [
+            '/products/', '/products/?fields=id,name,available', '/products/?category=things',
+            f'/products/{self.products[0].pk}/', '/products/categories/',
+            '/orders/my_orders/', f'/orders/{self.order.pk}/',
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertSameAsSync(client, path)
+
+    def test_errors_match_sync(self):
+        client = self.client_for(self.create_user('other', 'customer'))
+        for path in (f'/orders/{self.order.pk}/', '/products/999999/'):
+            with self.subTest(path=path):
+                self.assertEqual(client.get(f'/api/async{path}').status_code, 404)
+                self.assertSameAsSync(client, path)
+
+        response = APIClient().get('/api/async/products/')
+        self.assertEqual(response.status_code, 401)
+
+
+class ProductSearchTests(StoreMixin, TestCase):
+    def test_matches_name_and_description_only(self):
+        self.assertCountEqual(search_products(self.tenant.id, 'product'), [product.id for product in self.products])
+        # the tenant's own index token
+        self.assertEqual(search_products(self.tenant.id, f't{self.tenant.id}'), [])
+
+    def test_stock_only_save_keeps_index(self):
+        client = self.client_for(self.owner)
+        product = self.products[0]
+        with mock.patch('store.signals.index_products') as index:
+            response = client.patch(f'/api/products/{product.id}/', {'stock': 5}, format='json')
+            self.assertEqual(response.status_code, 200)
+            index.assert_not_called()
+
+            response = client.patch(f'/api/products/{product.id}/', {'name': 'Renamed'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            index.assert_called_once()
+
+    def test_pages_through_ranked_results(self):
+        for number in range(117):
+            Product.objects.create(
+                tenant=self.tenant, name=f'Product extra {number}', description='', price=Decimal('1.00'),
+                stock=1, category='things', created_by=self.owner,
+            )
+        client = self.client_for(self.owner)
+
+        first = client.get('/api/products/', {'search': 'product'}).json()
+        second = client.get(first['next']).json()
+        self.assertEqual((len(first['results']), len(second['results'])), (50, 50))
+        self.assertIsNone(first['previous'])
+        # the search index gives up to SEARCH_MAX_RESULTS hits
+        self.assertIsNone(second['next'])
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 100)
+        self.assertEqual(client.get(second['previous']).json()['results'], first['results'])
+
+        keyset_cursor = client.get('/api/products/').json()['next']
+        response = client.get(f'{keyset_cursor}&search=product')
+        self.assertEqual(response.status_code, 404)
+
+
+def run_concurrently(func, count):
+    """Call ``func(number)`` from ``count`` threads at once; returns what each call returned or raised"""
+    barrier = threading.Barrier(count)
+
+    def run(number):
+        barrier.wait()
+        deadline = time.monotonic() + 10
+        try:
+            while True:
+                try:
+                    return func(number)
+                except OperationalError as exc:
+                    # SQLite locks whole tables, so colliding writers retry like a client would
+                    if 'locked' not in str(exc) or time.monotonic() > deadline:
+                        return exc
+                    time.sleep(random.uniform(0.001, 0.01))
+                except Exception as exc:
+                    return exc
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(count) as executor:
+        return list(executor.map(run, range(count)))
+
+
+class ConcurrentCheckoutTests(StoreMixin, TransactionTestCase):
+    def test_no_oversell(self):
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(stock=5)
+
+        results = run_concurrently(lambda _: place_order(
+            tenant_id=self.tenant.id, customer_id=self.customer.id, shipping_address='1 Test Road',
+            items=[{'product_id': product.id, 'quantity': 2}],
+        ), 8)
+
+        for result in results:
+            self.assertIsInstance(result, (Order, ValidationError))
+        self.assertEqual(Order.objects.count(), 2)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 1)
+        self.assertEqual(OrderItem.objects.filter(product=product).aggregate(sold=Sum('quantity'))['sold'], 4)
+
+
+class CheckoutTests(StoreMixin, TestCase):
+    def test_empty_order(self):
+        response = self.client_for(self.customer).post(
+            '/api/orders/', {'shipping_address': '1 Test Road', 'items': []}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.data)
+
+    def test_short_update_fails(self):
+        other = Tenant.objects.create(
+            name='other', store_name='Other', contact_email='shop@other.test', contact_phone='0', subdomain='other',
+        )
+        foreign = Product.objects.create(
+            tenant=other, name='Foreign', description='', price=Decimal('1.00'), stock=10, category='things',
+        )
+        # the guarded UPDATE skips another tenant's row even though it has the stock
+        with self.assertRaises(ValidationError):
+            take_stock(self.tenant.id, {foreign.id: 1}, {foreign.id: foreign})
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.stock, 10)
+
+
+class ConditionalListTests(StoreMixin, TestCase):
+    def test_delete_changes_list(self):
+        client = self.client_for(self.owner)
+        response = client.get('/api/products/')
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # not the newest, so the newest updated_at stays the same
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.delete(f'/api/products/{self.products[0].id}/').status_code, 204)
+        self.assertEqual(client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=http_date()).status_code, 200)
+
+
+class ProductTombstoneTests(StoreMixin, TestCase):
+    def test_tenant_queryset_delete(self):
+        Tenant.objects.filter(pk=self.tenant.pk).delete()
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(ProductTombstone.objects.exists())
+
+    def test_purge(self):
+        old, recent = [product.pk for product in self.products[:2]]
+        Product.objects.filter(pk__in=[old, recent]).delete()
+        ProductTombstone.objects.filter(product_id=old).update(
+            deleted_at=timezone.now() - timedelta(days=sync.TOMBSTONE_RETENTION_DAYS + 1),
+        )
+        call_command('purge_product_tombstones', stdout=io.StringIO())
+        self.assertEqual(list(ProductTombstone.objects.values_list('product_id', flat=True)), [recent])
+
+    def test_cursor_older_than_retention(self):
+        deleted = self.products[0].pk
+        Product.objects.filter(pk=deleted).delete()
+        ProductTombstone.objects.update(deleted_at=timezone.now() - timedelta(minutes=1))
+        client = self.client_for(self.owner)
+
+        response = client.get('/api/products/changes/')
+        self.assertEqual(response.data['deleted'], [deleted])
+        cursor = response.data['cursor']
+        self.assertEqual(client.get('/api/products/changes/', {'since': cursor}).status_code, 200)
+
+        later = timezone.now() + timedelta(days=sync.TOMBSTONE_RETENTION_DAYS, minutes=1)
+        with mock.patch('store.sync.timezone.now', return_value=later):
+            response = client.get('/api/products/changes/', {'since': cursor})
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.data['code'], 'resync')
+
+
+class ProductImportTests(StoreMixin, TestCase):
+    def test_missing_optional_columns_are_kept(self):
+        Product.objects.filter(pk=self.products[0].pk).update(
+            sku='SKU-1', image_url='https://img.test/1.png', is_active=False,
+        )
+        lines = [
+            'sku,name,description,price,stock,category\n',
+            'SKU-1,Renamed,New description,5.00,7,things\n',
+            'SKU-2,Added,Brand new,1.00,1,things\n',
+        ]
+        report = import_products(self.tenant.id, lines)
+        self.assertEqual((report.created, report.updated, report.failed), (1, 1, 0))
+
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual((product.name, product.stock), ('Renamed', 7))
+        self.assertEqual((product.image_url, product.is_active), ('https://img.test/1.png', False))
+        self.assertTrue(Product.objects.get(sku='SKU-2').is_active)
+
+
+class OrderExportTests(StoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.place_orders(2)
+        old, self.recent = Order.objects.order_by('id')
+        Order.objects.filter(pk=old.pk).update(status='shipped', created_at=timezone.now() - timedelta(days=3))
+        self.owner_client = self.client_for(self.owner)
+
+    def export(self, export_format, **params):
+        response = self.owner_client.get('/api/orders/export/', {'export_format': export_format, **params})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_formats_match(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('csv'))))
+        orders = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(len(orders), 2)
+
+        flattened = [
+            {**{key: str(value) for key, value in order.items() if key != 'items'},
+             **{key: str(value) for key, value in item.items()}}
+            for order in orders for item in order['items']
+        ]
+        self.assertEqual(rows, flattened)
+        self.assertTrue(rows[0]['created_at'].endswith('Z'))
+
+    def test_filters(self):
+        shipped = [json.loads(line)['id'] for line in self.export('ndjson', status='shipped').splitlines()]
+        self.assertNotIn(self.recent.id, shipped)
+        self.assertEqual(len(shipped), 1)
+
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        rows = list(csv.DictReader(io.StringIO(self.export('csv', created_after=since))))
+        self.assertEqual({row['id'] for row in rows}, {str(self.recent.id)})
+
+
+@mock.patch('store.routers.REPLICAS', ['replica'])
+class ReplicaRoutingTests(StoreMixin, TestCase):
+    def request(self, method, user):
+        return getattr(RequestFactory(), method)(
+            '/api/orders/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}',
+        )
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(routers.replica_for(self.request('get', self.customer)), 'replica')
+        self.assertIsNone(routers.replica_for(RequestFactory().get('/api/orders/')))
+        self.assertIsNone(routers.replica_for(self.request('post', self.customer)))
+
+    def test_pinned_after_write(self):
+        routers.pin_to_primary(self.request('post', self.customer))
+        # a different token for the same user, as after a refresh
+        self.assertIsNone(routers.replica_for(self.request('get', self.customer)))
+        self.assertEqual(routers.replica_for(self.request('get', self.owner)), 'replica')
+
+    def test_invalid_token_reads_primary(self):
+        request = RequestFactory().get('/api/orders/', HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertIsNone(routers.replica_for(request))
+
+    def test_token_validated_once(self):
+        client = self.client_for(self.customer)
+        validate = JWTAuthentication.get_validated_token
+        with mock.patch.object(
+            JWTAuthentication, 'get_validated_token', autospec=True, side_effect=validate,
+        ) as validated:
+            response = client.post('/api/orders/', {
+                'shipping_address': '1 Test Road', 'items': [{'product': self.products[0].id, 'quantity': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        # routing pinned the client after the write, and DRF reused the token it checked
+        self.assertEqual(validated.call_count, 1)
+        self.assertIsNone(routers.replica_for(self.request('get', self.customer)))
+
+
+@mock.patch('store.sharding.SHARDS', ['test_shard'])
+class ShardingTests(StoreMixin, TransactionTestCase):
+    databases = {'default', 'test_shard'}
+
+    def test_routing(self):
+        sharding.set_shard(self.tenant.id, 'test_shard')
+        self.assertEqual(sharding.database_for(self.tenant.id), 'test_shard')
+        with sharding.tenant_context(self.tenant.id):
+            self.assertEqual(Product.objects.all().db, 'test_shard')
+            self.assertEqual(Tenant.objects.all().db, 'default')
+        with sharding.tenant_context(None):
+            self.assertEqual(Product.objects.all().db, 'default')
+            # saves follow the row's tenant, whatever the context
+            self.assertEqual(routers.TenantShardRouter().db_for_write(Product, instance=self.products[0]), 'test_shard')
+
+    def test_frozen_tenant_rejects_writes(self):
+        client = self.client_for(self.owner)
+        sharding.set_shard(self.tenant.id, 'default', read_only=True)
+        with self.assertRaises(sharding.TenantMoving):
+            Product.objects.filter(pk=self.products[0].pk).first().save()
+        response = client.patch(f'/api/products/{self.products[0].id}/', {'stock': 1}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(client.get(f'/api/products/{self.products[0].id}/').status_code, 200)
+
+    def test_move_tenant(self):
+        self.place_orders(2)
+        client = self.client_for(self.owner)
+        call_command('init_shard', 'test_shard', '--id-start', '1000000', stdout=io.StringIO())
+        before = {
+            model: set(model.objects.filter(**{path: self.tenant.id}).values_list('pk', flat=True))
+            for model, path in sharding.SHARDED_MODELS
+        }
+        late = []
+
+        def log(message):
+            if message == f'copied 2 {Order._meta.verbose_name_plural}':
+                # written after orders were copied, so the final delta has to bring it over
+                late.append(place_order(
+                    tenant_id=self.tenant.id, customer_id=self.customer.id, shipping_address='1 Test Road',
+                    items=[{'product_id': self.products[0].id, 'quantity': 1}],
+                ))
+            elif message.startswith('frozen'):
+                with self.assertRaises(sharding.TenantMoving):
+                    Product.objects.get(pk=self.products[1].pk).save()
+
+        sharding.move_tenant(self.tenant.id, 'test_shard', settle=0, log=log)
+
+        self.assertEqual(sharding.get_shard(self.tenant.id), ('test_shard', False))
+        moved_orders = set(Order.objects.using('test_shard').values_list('pk', flat=True))
+        self.assertEqual(moved_orders, before[Order] | {late[0].pk})
+        for model, path in sharding.SHARDED_MODELS:
+            rows = model.objects.filter(**{path: self.tenant.id})
+            self.assertFalse(rows.using('default').exists(), model)
+            self.assertLessEqual(before[model], set(rows.using('test_shard').values_list('pk', flat=True)), model)
+        self.assertEqual(Product.objects.using('test_shard').get(pk=self.products[0].pk).stock, 97)
+        self.assertTrue(Tenant.objects.using('default').filter(pk=self.tenant.pk).exists())
+
+        response = client.get('/api/orders/')
+        self.assertEqual(len(response.data['results']), 3)
+        # new rows on the shard get ids from its own range
+        order = place_order(
+            tenant_id=self.tenant.id, customer_id=self.customer.id, shipping_address='1 Test Road',
+            items=[{'product_id': self.products[2].id, 'quantity': 1}],
+        )
+        self.assertEqual(order._state.db, 'test_shard')
+        self.assertGreaterEqual(order.pk, 1000000)
+
+    def test_username_checked_on_tenant_shard(self):
+        other = Tenant.objects.create(
+            name='other', store_name='Other', contact_email='shop@other.test', contact_phone='0', subdomain='other',
+        )
+        sharding.move_tenant(other.id, 'test_shard', settle=0, log=lambda message: None)
+        data = {
+            'username': 'taken', 'email': 'taken@other.test', 'password': PASSWORD, 'password2': PASSWORD,
+            'role': 'customer', 'tenant_id': other.id,
+        }
+        self.assertEqual(APIClient().post('/api/auth/register/', data, format='json').status_code, 201)
+        self.assertTrue(User.objects.using('test_shard').filter(username='taken').exists())
+
+        response = APIClient().post('/api/auth/register/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('username', response.data)
+
+
+class OrderRollupTests(StoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.place_orders(2)
+        self.order = Order.objects.earliest('id')
+        self.owner_client = self.client_for(self.owner)
+
+    def sales(self):
+        return DailySales.objects.values_list('orders', 'items').get()
+
+    def test_patch_cannot_change_status(self):
+        changes = [('status', 'cancelled', 'update_status'), ('assigned_staff', self.owner.id, 'assign_staff')]
+        for field, value, action in changes:
+            response = self.owner_client.patch(f'/api/orders/{self.order.id}/', {field: value}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(action, response.data[field][0])
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.assigned_staff_id), ('pending', None))
+        self.assertEqual(self.sales(), (2, 6))
+
+        response = self.owner_client.patch(f'/api/orders/{self.order.id}/', {'notes': 'Leave at the door'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_updates_rollups(self):
+        self.assertEqual(self.owner_client.delete(f'/api/orders/{self.order.id}/').status_code, 204)
+        self.assertEqual(self.sales(), (1, 3))
+        self.assertEqual(DailyStatusCount.objects.get(status='pending').count, 1)
+        self.assertTrue(OutboxEvent.objects.filter(topic='order.deleted').exists())
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class BulkOrderTests(StoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.place_orders(3)
+        self.orders = list(Order.objects.order_by('id'))
+        self.staff = self.create_user('staff', 'staff')
+        OutboxEvent.objects.all().delete()
+
+    def results(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return {result['id']: result['result'] for result in response.data['results']}
+
+    def test_status(self):
+        first, second, third = self.orders
+        Order.objects.filter(pk=second.pk).update(status='shipped')
+        response = self.client_for(self.owner).post('/api/orders/bulk_update_status/', {
+            'order_ids': [first.pk, second.pk, third.pk, 999999], 'status': 'shipped',
+        }, format='json')
+
+        self.assertEqual(self.results(response), {
+            first.pk: 'updated', second.pk: 'unchanged', third.pk: 'updated', 999999: 'not_found',
+        })
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(Order.objects.filter(status='shipped').count(), 3)
+        events = OutboxEvent.objects.filter(topic='order.status_changed')
+        self.assertCountEqual([event.payload['order_id'] for event in events], [first.pk, third.pk])
+        self.assertEqual(DailyStatusCount.objects.get(status='shipped').count, 2)
+
+    def test_staff_only_change_their_orders(self):
+        first, second, _ = self.orders
+        Order.objects.filter(pk=first.pk).update(assigned_staff=self.staff)
+        response = self.client_for(self.staff).post('/api/orders/bulk_update_status/', {
+            'order_ids': [first.pk, second.pk], 'status': 'processing',
+        }, format='json')
+        self.assertEqual(self.results(response), {first.pk: 'updated', second.pk: 'not_found'})
+        self.assertEqual(Order.objects.get(pk=second.pk).status, 'pending')
+
+    def test_assign_staff(self):
+        first, second, _ = self.orders
+        Order.objects.filter(pk=first.pk).update(assigned_staff=self.staff)
+        response = self.client_for(self.owner).post('/api/orders/bulk_assign_staff/', {
+            'order_ids': [first.pk, second.pk], 'staff_id': self.staff.id,
+        }, format='json')
+        self.assertEqual(self.results(response), {first.pk: 'unchanged', second.pk: 'updated'})
+        self.assertEqual(Order.objects.filter(assigned_staff=self.staff).count(), 2)
+        self.assertEqual(OutboxEvent.objects.filter(topic='order.staff_assigned').count(), 1)
+
+    def test_rejected(self):
+        owner = self.client_for(self.owner)
+        order_id = self.orders[0].pk
+        cases = [
+            (self.client_for(self.customer), 'bulk_update_status', {'order_ids': [order_id], 'status': 'shipped'}, 403),
+            (self.client_for(self.staff), 'bulk_assign_staff', {'order_ids': [order_id], 'staff_id': self.staff.id}, 403),
+            (owner, 'bulk_update_status', {'order_ids': [], 'status': 'shipped'}, 400),
+            (owner, 'bulk_update_status', {'order_ids': ['x'], 'status': 'shipped'}, 400),
+            (owner, 'bulk_update_status', {'order_ids': [order_id], 'status': 'lost'}, 400),
+            (owner, 'bulk_assign_staff', {'order_ids': [order_id], 'staff_id': self.customer.id}, 404),
+        ]
+        for client, action, body, expected in cases:
+            with self.subTest(action=action, body=body):
+                response = client.post(f'/api/orders/{action}/', body, format='json')
+                self.assertEqual(response.status_code, expected)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class OutboxTests(StoreMixin, TestCase):
+    def test_published_with_the_order(self):
+        self.place_orders(1)
+        order = Order.objects.get()
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.topic, 'order.created')
+        self.assertEqual(event.payload['order_id'], order.pk)
+        self.assertEqual(event.payload['total_amount'], str(order.total_amount))
+
+    def test_nothing_published_for_a_failed_order(self):
+        with self.assertRaises(ValidationError):
+            place_order(
+                tenant_id=self.tenant.id, customer_id=self.customer.id, shipping_address='1 Test Road',
+                items=[{'product_id': self.products[0].id, 'quantity': 1000}],
+            )
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_delivered_and_deleted(self):
+        self.place_orders(2)
+        handler = mock.Mock()
+        with mock.patch('store.outbox.handlers_for', return_value=[handler]):
+            self.assertEqual(outbox.process_batch(), (2, 0))
+        self.assertEqual([call.args[0].topic for call in handler.call_args_list], ['order.created'] * 2)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_retried_with_backoff(self):
+        self.place_orders(1)
+        handler = mock.Mock(side_effect=RuntimeError('endpoint down'))
+        with mock.patch('store.outbox.handlers_for', return_value=[handler]):
+            with self.assertLogs('store.outbox', 'WARNING'):
+                self.assertEqual(outbox.process_batch(), (0, 1))
+            event = OutboxEvent.objects.get()
+            self.assertEqual(event.attempts, 1)
+            self.assertIn('endpoint down', event.last_error)
+            self.assertGreater(event.available_at, timezone.now())
+            # not due yet
+            self.assertEqual(outbox.process_batch(), (0, 0))
+
+            OutboxEvent.objects.update(available_at=timezone.now())
+            handler.side_effect = None
+            self.assertEqual(outbox.process_batch(), (1, 0))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    @mock.patch('store.outbox.MAX_ATTEMPTS', 2)
+    def test_dead_after_max_attempts(self):
+        self.place_orders(1)
+        with mock.patch('store.outbox.handlers_for', return_value=[mock.Mock(side_effect=RuntimeError)]):
+            for _ in range(2):
+                OutboxEvent.objects.update(available_at=timezone.now())
+                with self.assertLogs('store.outbox', 'WARNING'):
+                    outbox.process_batch()
+            event = OutboxEvent.objects.get()
+            self.assertTrue(event.dead)
+            self.assertEqual(event.attempts, 2)
+
+            OutboxEvent.objects.update(available_at=timezone.now())
+            self.assertEqual(outbox.process_batch(), (0, 0))
+
+
+class ConcurrentClaimTests(StoreMixin, TransactionTestCase):
+    def test_orders_claimed_once(self):
+        self.place_orders(10)
+        staff = [self.create_user(f'staff{number}', 'staff') for number in range(6)]
+
+        results = run_concurrently(lambda number: claim_orders(staff[number], 3), len(staff))
+
+        for result in results:
+            self.assertIsInstance(result, list)
+        claimed = [order.pk for result in results for order in result]
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(len(claimed), 10)
+        for member, result in zip(staff, results):
+            self.assertCountEqual(
+                Order.objects.filter(assigned_staff=member).values_list('pk', flat=True), [order.pk for order in result],
+            )
+
+
+class ReservationTests(StoreMixin, TransactionTestCase):
+    def reserve(self, quantity):
+        return reserve(
+            tenant_id=self.tenant.id, customer_id=self.customer.id,
+            items=[{'product_id': self.products[0].id, 'quantity': quantity}],
+        )
+
+    def test_short_update_fails(self):
+        # as if a concurrent checkout took the stock and then gave it back before the re-read
+        with mock.patch('django.db.models.query.QuerySet.update', return_value=0), \
+                self.assertRaises(ValidationError):
+            self.reserve(1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_no_over_reserve(self):
+        Product.objects.filter(pk=self.products[0].pk).update(stock=5)
+
+        results = run_concurrently(lambda _: self.reserve(2), 8)
+
+        for result in results:
+            self.assertIsInstance(result, (StockReservation, ValidationError))
+        held = StockReservationItem.objects.aggregate(held=Sum('quantity'))['held']
+        self.assertEqual(held, 4)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).reserved, 4)
+
+    def test_available_follows_reservations(self):
+        client = self.client_for(self.customer)
+        product_id = self.products[0].pk
+
+        def available(url):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            results = response.data['results'] if 'results' in response.data else [response.data]
+            return next(product['available'] for product in results if product['id'] == product_id)
+
+        urls = [
+            '/api/products/', '/api/products/?fields=id,available',
+            f'/api/products/{product_id}/', f'/api/products/{product_id}/?fields=id,available',
+        ]
+        for url in urls:
+            self.assertEqual(available(url), 100)
+
+        reservation = self.reserve(30)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(available(url), 70)
+
+        release(reservation)
+        for url in urls:
+            self.assertEqual(available(url), 100)
+
+        StockReservation.objects.filter(pk=self.reserve(40).pk).update(expires_at=timezone.now())
+        self.assertEqual(available(urls[0]), 60)
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(available(urls[0]), 100)
+
+
+@mock.patch('store.throttling.RATES', {'register': {'client': '100/min', 'tenant': '2/min'}})
+class ThrottlingTests(StoreMixin, TestCase):
+    def request(self, tenant):
+        request = RequestFactory().post('/api/auth/register/')
+        request.user, request.tenant = AnonymousUser(), tenant
+        return request
+
+    def test_no_shared_bucket_without_tenant(self):
+        for number in range(5):
+            throttling.check(self.request(None), 'register', f'10.0.0.{number}')
+
+    def test_tenant_bucket(self):
+        for number in range(2):
+            throttling.check(self.request(self.tenant), 'register', f'10.0.0.{number}')
+        with self.assertRaises(Throttled):
+            throttling.check(self.request(self.tenant), 'register', '10.0.0.9')
+
+    def register(self, number, **headers):
+        return APIClient().post('/api/auth/register/', {
+            'username': f'new{number}', 'password': 'Xk2!pQ9#vL', 'password2': 'Xk2!pQ9#vL',
+            'tenant_id': self.tenant.id, 'role': 'customer',
+        }, format='json', **headers)
+
+    def test_register_charges_body_tenant(self):
+        for number in range(2):
+            self.assertEqual(self.register(number, REMOTE_ADDR=f'10.0.0.{number}').status_code, 201)
+        self.assertEqual(self.register(2, REMOTE_ADDR='10.0.0.2').status_code, 429)
+
+    @mock.patch('store.throttling.RATES', {'register': {'client': '2/min'}})
+    def test_forwarded_for_ignored_without_proxies(self):
+        for number in range(2):
+            self.assertEqual(self.register(number, HTTP_X_FORWARDED_FOR=f'10.0.0.{number}').status_code, 201)
+        self.assertEqual(self.register(2, HTTP_X_FORWARDED_FOR='10.0.0.2').status_code, 429)
+
+
+@mock.patch('store.metrics.TOKEN', 'scrape-token')
+class MetricsTests(StoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+
+    def scrape(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_request_recorded(self):
+        client = self.client_for(self.customer)
+        for _ in range(2):
+            self.assertEqual(client.get('/api/products/').status_code, 200)
+
+        samples = self.scrape()
+        labels = f'{{route="product-list",method="GET",status="200",tenant="{self.tenant.id}"}}'
+        self.assertEqual(samples[f'http_request_duration_seconds_count{labels}'], 2)
+        self.assertEqual(samples[f'http_request_duration_seconds_bucket{labels[:-1]},le="+Inf"}}'], 2)
+        self.assertGreater(samples[f'http_request_db_queries_total{labels}'], 0)
+        self.assertGreater(samples[f'http_response_bytes_total{labels}'], 0)
+        self.assertEqual(samples['catalog_cache_requests_total{result="hit"}'], catalog_cache.stats.hits)
+
+    def test_access(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with mock.patch('store.metrics.TOKEN', None):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_profile(self):
+        client = self.client_for(self.customer)
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch('store.metrics.PROFILE_TOKEN', 'profile-token'), \
+                mock.patch('store.metrics.PROFILE_DIR', directory), \
+                self.assertLogs('store.metrics', 'INFO'):
+            self.assertFalse(client.get('/api/products/', HTTP_X_PROFILE='wrong').has_header('X-Profile-File'))
+            response = client.get('/api/products/', HTTP_X_PROFILE='profile-token')
+            self.assertTrue(os.path.exists(os.path.join(directory, response['X-Profile-File'])))
+
+
+class BenchmarkCommandTests(TestCase):
+    def seed(self, *args):
+        call_command(
+            'seed_benchmark', *args, tenants=2, products=20, customers=4, orders=10, stdout=io.StringIO(),
+        )
+
+    def test_seed_and_run(self):
+        self.seed()
+        tenants = Tenant.objects.filter(subdomain__startswith=SEED_SUBDOMAIN_PREFIX)
+        self.assertEqual(tenants.count(), 2)
+        largest = tenants.order_by('id').first()
+        self.assertEqual(Product.objects.filter(tenant=largest).count(), 20)
+        self.assertEqual(Order.objects.filter(tenant=largest).count(), 10)
+
+        with tempfile.TemporaryDirectory() as directory, mock.patch('store.throttling.RATES', {}):
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'run_benchmark', iterations=3, login_iterations=1, warmup=1, output=output, stdout=io.StringIO(),
+            )
+            with open(output) as results_file:
+                report = json.load(results_file)
+
+            out = io.StringIO()
+            call_command('run_benchmark', iterations=3, login_iterations=1, warmup=0, compare=output, stdout=out)
+            self.assertIn(f'compared with {output}', out.getvalue())
+
+        self.assertEqual(report['tenants'], 2)
+        self.assertEqual(set(report['scenarios']), set(SCENARIOS))
+        for name, result in report['scenarios'].items():
+            with self.subTest(name):
+                self.assertEqual(result['errors'], 0)
+                self.assertEqual(result['calls'], 1 if name == 'login' else 3)
+                self.assertIsNotNone(result['queries_per_request'])
+        self.assertGreater(report['scenarios']['order_create']['queries_per_request'], 0)
+
+    def test_flush(self):
+        self.seed()
+        self.seed('--flush')
+        self.assertEqual(Tenant.objects.filter(subdomain__startswith=SEED_SUBDOMAIN_PREFIX).count(), 2)
+
+
+class FastJSONRendererTests(StoreMixin, TestCase):
+    def assertSameJSON(self, data):
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_serialized_products(self):
+        self.products[0].name = 'line\u2028break \u00e9'
+        self.assertSameJSON({'results': ProductSerializer(self.products, many=True).data})
+
+    def test_values_orjson_writes_differently(self):
+        for value in (2 ** 53 + 1, 2 ** 64, -2 ** 70, 1e16, 0.1, Decimal('9.99'), {1: 'a'}, timezone.now()):
+            with self.subTest(value=value):
+                self.assertSameJSON({'results': [{'value': value}]})
+
+    def test_nan_raises(self):
+        for value in (float('nan'), float('inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                FastJSONRenderer().render({'value': [value]})
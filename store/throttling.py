@@ -0,0 +1,221 @@
+"""
+Token-bucket rate limiting and load shedding.
+
+Every request takes a token from two buckets of its route class (scope):
+one for the client (user, or IP address when anonymous) and one for the
+whole tenant, so neither a single scraper nor a tenant's combined traffic
+can take over the shared workers. Buckets live in process memory, which
+costs no I/O. With ``THROTTLE_CACHE_ALIAS`` set they are also kept in that
+shared cache, so the limits hold across processes (approximately: reads
+and writes of a bucket are not atomic). The IP address is ``REMOTE_ADDR``;
+``X-Forwarded-For`` is only believed when DRF's ``NUM_PROXIES`` says how
+many proxies in front of the server add to it.
+
+When the queue latency measured by ``QueueTimeMiddleware`` (from the
+proxy's ``X-Request-Start`` header) averages above
+``THROTTLE_SHED_QUEUE_MS``, low-priority scopes are turned away with a 503
+until it recovers, so checkout and order traffic keep their workers.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# scope: {'client': rate, 'tenant': rate}, rates like '60/min'; a bucket holds
+# one period's worth of tokens and refills at the rate
+RATES = getattr(settings, 'THROTTLE_RATES', {})
+
+# scopes shed first when the server is overloaded
+SHED_SCOPES = set(getattr(settings, 'THROTTLE_SHED_SCOPES', ['search', 'register', 'export', 'analytics']))
+
+# average queue latency above which shedding starts; None turns shedding off
+SHED_QUEUE_MS = getattr(settings, 'THROTTLE_SHED_QUEUE_MS', None)
+
+# weight of the newest sample in the queue latency average
+QUEUE_EWMA_ALPHA = getattr(settings, 'THROTTLE_QUEUE_EWMA_ALPHA', 0.2)
+
+CACHE_ALIAS = getattr(settings, 'THROTTLE_CACHE_ALIAS', None)
+
+LOCAL_MAX_BUCKETS = getattr(settings, 'THROTTLE_LOCAL_MAX_BUCKETS', 10000)
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+class Overloaded(exceptions.APIException):
+    status_code = 503
+    default_detail = 'The server is busy. Please retry shortly.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait):
+        super().__init__()
+        # picked up by DRF's exception handler as Retry-After
+        self.wait = wait
+
+
+def parse_rate(rate):
+    """'60/min' -> (60 tokens, 1 token/second)"""
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period]
+
+
+class LocalBuckets:
+    """Token buckets in process memory, least recently used dropped first"""
+
+    def __init__(self, max_buckets=LOCAL_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, refill, now):
+        """Take a token; returns 0, or the seconds until one is available"""
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            wait = 0 if tokens >= 1 else (1 - tokens) / refill
+            self.buckets[key] = (tokens - 1 if not wait else tokens, now)
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBuckets:
+    """Token buckets in a shared cache, for limits across processes"""
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, capacity, refill, now):
+        key = 'throttle:' + key
+        tokens, updated = self.cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        wait = 0 if tokens >= 1 else (1 - tokens) / refill
+        self.cache.set(key, (tokens - 1 if not wait else tokens, now), math.ceil(capacity / refill) + 1)
+        return wait
+
+
+local_buckets = LocalBuckets()
+shared_buckets = CacheBuckets(CACHE_ALIAS) if CACHE_ALIAS else None
+
+
+class QueueLatency:
+    """Moving average of how long requests waited for a worker, per process"""
+
+    def __init__(self, alpha=QUEUE_EWMA_ALPHA):
+        self.alpha = alpha
+        self.average_ms = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, queue_ms):
+        with self.lock:
+            self.average_ms += self.alpha * (max(queue_ms, 0.0) - self.average_ms)
+
+    def overloaded(self):
+        return SHED_QUEUE_MS is not None and self.average_ms > SHED_QUEUE_MS
+
+
+queue_latency = QueueLatency()
+
+
+def request_start_ms(header):
+    """
+    Milliseconds since the epoch from an ``X-Request-Start`` header, which
+    proxies send as ``t=<seconds>``, milliseconds or microseconds.
+    """
+    value = header[2:] if header.startswith('t=') else header
+    try:
+        start = float(value)
+    except ValueError:
+        return None
+    if start > 1e14:
+        return start / 1000
+    if start > 1e11:
+        return start
+    return start * 1000
+
+
+def take(key, rate, now):
+    capacity, refill = parse_rate(rate)
+    wait = local_buckets.take(key, capacity, refill, now)
+    # an empty local bucket already means no; only ask the shared cache otherwise
+    if not wait and shared_buckets is not None:
+        wait = shared_buckets.take(key, capacity, refill, now)
+    return wait
+
+
+def check(request, scope, ident, tenant_id=None):
+    """
+    Take ``scope`` tokens for this request's client (``ident``) and tenant.
+    ``tenant_id`` is charged instead of the request's own tenant, for
+    anonymous requests that name theirs in the body, such as registration.
+    Raises ``Throttled`` (429) or ``Overloaded`` (503), both with a wait.
+    """
+    if scope in SHED_SCOPES and queue_latency.overloaded():
+        raise Overloaded(wait=5)
+
+    rates = RATES.get(scope)
+    if not rates:
+        return
+
+    user = request.user
+    if user and user.is_authenticated:
+        request_tenant_id, client = user.tenant_id, f'u{user.id}'
+    else:
+        tenant = getattr(request, 'tenant', None)
+        request_tenant_id, client = getattr(tenant, 'id', None), f'ip{ident}'
+    if tenant_id is None:
+        tenant_id = request_tenant_id
+
+    now = time.time()
+    waits = []
+    if rates.get('client'):
+        # not keyed by a body's tenant_id, which the client could vary to get fresh buckets
+        waits.append(take(f'{scope}:{request_tenant_id}:{client}', rates['client'], now))
+    # requests with no tenant (login, registration) would all share one bucket
+    if rates.get('tenant') and tenant_id is not None:
+        waits.append(take(f'{scope}:{tenant_id}', rates['tenant'], now))
+
+    wait = max(waits, default=0)
+    if wait:
+        raise exceptions.Throttled(wait=math.ceil(wait))
+
+
+def scope_for(request, view):
+    """The view's ``get_throttle_scope()`` or ``throttle_scope``, else 'read' or 'write'"""
+    if hasattr(view, 'get_throttle_scope'):
+        scope = view.get_throttle_scope()
+    else:
+        scope = getattr(view, 'throttle_scope', None)
+    if scope:
+        return scope
+    return 'read' if request.method in SAFE_METHODS else 'write'
+
+
+class TenantRateThrottle(BaseThrottle):
+    """
+    Applies ``check`` to every DRF view; over the limit raises straight
+    away, with Retry-After. Views can name the tenant to charge with
+    ``get_throttle_tenant_id()``.
+    """
+
+    def allow_request(self, request, view):
+        tenant_id = view.get_throttle_tenant_id() if hasattr(view, 'get_throttle_tenant_id') else None
+        check(request, scope_for(request, view), self.get_ident(request), tenant_id)
+        return True
+
+    def get_ident(self, request):
+        # DRF's get_ident trusts any X-Forwarded-For unless NUM_PROXIES is set
+        if api_settings.NUM_PROXIES is None:
+            return request.META.get('REMOTE_ADDR')
+        return super().get_ident(request)
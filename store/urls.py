@@ -1,21 +1,29 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    CustomTokenObtainPairView, UserRegistrationView,
-    TenantViewSet, ProductViewSet, OrderViewSet
+    CustomTokenObtainPairView, CustomTokenRefreshView, UserRegistrationView,
+    TenantViewSet, ProductViewSet, OrderViewSet, StockReservationViewSet
 )
-from rest_framework_simplejwt.views import TokenRefreshView
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'tenants', TenantViewSet, basename='tenant')
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'reservations', StockReservationViewSet, basename='reservation')
 
 urlpatterns = [
     # auth
     path('auth/register/', UserRegistrationView.as_view(), name='register'),
     path('auth/login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('auth/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
+
+    # async read paths, served natively under ASGI (uvicorn)
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/categories/', async_views.product_categories, name='async-product-categories'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/orders/my_orders/', async_views.my_orders, name='async-order-my-orders'),
+    path('async/orders/<int:pk>/', async_views.order_detail, name='async-order-detail'),
     
     path('', include(router.urls)),
 ]
\ No newline at end of file
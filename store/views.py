@@ -1,16 +1,29 @@
 
-from rest_framework import viewsets, status, generics
+from rest_framework import viewsets, status, generics, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from django.db.models import Q
-from .models import Tenant, User, Product, Order
+from django.db import router
+from django.db.models import Q, Case, When, IntegerField, Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Greatest, Trim
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from .models import Tenant, User, Product, Order, OrderItem, StockReservation
 from .serializers import (
     TenantSerializer, UserRegistrationSerializer, UserSerializer,
-    ProductSerializer, OrderSerializer, OrderListSerializer
+    ProductSerializer, OrderSerializer, OrderListSerializer, ClaimedOrderSerializer,
+    StockReservationSerializer, ReservationCheckoutSerializer
 )
+from .search import search_products
+from . import analytics, catalog_cache, checkout, conditional, reservations, sync
+from .importer import decode_lines, import_products
+from .exporter import EXPORTERS
+from .query_budget import QueryBudgetMixin
+from .idempotency import idempotent
 from .permissions import (
     IsTenantUser, IsStoreOwner, IsStoreOwnerOrStaff, 
     IsStaffOrReadOnly, CanManageOrder
@@ -46,12 +59,25 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_scope = 'auth'
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    throttle_scope = 'auth'
 
 #  user 
 class UserRegistrationView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = [AllowAny]
     serializer_class = UserRegistrationSerializer
+    throttle_scope = 'register'
+
+    def get_throttle_tenant_id(self):
+        # anonymous, so the tenant signed up to only comes in the body
+        try:
+            return int(self.request.data.get('tenant_id'))
+        except (AttributeError, TypeError, ValueError):
+            return None
 
 # tenant
 class TenantViewSet(viewsets.ModelViewSet):
@@ -61,77 +87,345 @@ class TenantViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         if not self.request.user.is_superuser:
-            return Tenant.objects.filter(id=self.request.user.tenant.id)
+            return Tenant.objects.filter(id=self.request.user.tenant_id)
         return Tenant.objects.all()
 
+def filter_products(tenant_id, params, search_ids=None):
+    """
+    A tenant's products filtered by ``?category``, ``?is_active`` and
+    ``?search``. ``search_ids`` is the search index's answer for ``?search``,
+    or None when the database has no index.
+    """
+    queryset = Product.objects.filter(tenant_id=tenant_id)
+    
+    category = params.get('category', None)
+    if category:
+        queryset = queryset.filter(category=category)
+    
+    is_active = params.get('is_active', None)
+    if is_active is not None:
+        queryset = queryset.filter(is_active=is_active.lower() == 'true')
+    
+    search = params.get('search', None)
+    if search:
+        if search_ids is None:
+            # no search index on this database
+            queryset = queryset.filter(
+                Q(name__icontains=search) | Q(description__icontains=search)
+            )
+        elif not search_ids:
+            queryset = queryset.none()
+        else:
+            # keep the index's relevance order
+            rank = Case(
+                *[When(pk=pk, then=position) for position, pk in enumerate(search_ids)],
+                output_field=IntegerField(),
+            )
+            queryset = queryset.filter(pk__in=search_ids).annotate(search_rank=rank).order_by('search_rank')
+    
+    return queryset
+
+
+def product_fields(params):
+    """``?fields=`` as ProductSerializer field names, or None for all of them"""
+    return ProductSerializer.parse_fields(params.get('fields'))
+
+
+def product_columns(fields):
+    """The ``.values()`` columns ``fields`` read, plus the ones pagination needs"""
+    names = fields or ProductSerializer.Meta.fields
+    return list(dict.fromkeys(['id', 'created_at', *(ProductSerializer.column_for(name) for name in names)]))
+
+
+def product_values(queryset, fields):
+    """``.values()`` rows with the columns ``fields`` read, available computed by the database"""
+    columns = product_columns(fields)
+    if 'available' not in columns:
+        return queryset.values(*columns)
+    columns.remove('available')
+    return queryset.values(*columns, available=Greatest(F('stock') - F('reserved'), 0))
+
+
+def trim_products(queryset, fields):
+    """Load only the columns ``fields`` read, with the creator in the same query"""
+    if fields is None:
+        return queryset.select_related('created_by')
+    columns = product_columns(fields)
+    if 'created_by__username' in columns:
+        queryset = queryset.select_related('created_by')
+        columns.append('created_by')
+    if 'available' in columns:
+        columns.remove('available')
+        columns += ['stock', 'reserved']
+    return queryset.only(*columns)
+
+
+def scope_orders(user, params):
+    """Orders ``user`` may see, filtered by ``?status``, with no eager loading"""
+    queryset = Order.objects.filter(tenant_id=user.tenant_id)
+    
+    if user.role == 'customer':
+        queryset = queryset.filter(customer_id=user.id)
+    elif user.role == 'staff':
+        queryset = queryset.filter(
+            Q(assigned_staff_id=user.id) | Q(status='pending')
+        )
+
+    status_param = params.get('status', None)
+    if status_param:
+        queryset = queryset.filter(status=status_param)
+    
+    return queryset
+
+
+def parse_order_ids(data):
+    """The de-duplicated ``order_ids`` list of a bulk request, or None if it is invalid"""
+    order_ids = data.get('order_ids')
+    if not isinstance(order_ids, list) or not 1 <= len(order_ids) <= checkout.MAX_BULK_ORDERS:
+        return None
+    try:
+        return list(dict.fromkeys(int(order_id) for order_id in order_ids))
+    except (TypeError, ValueError):
+        return None
+
+
+def bulk_response(results):
+    return Response({
+        'updated': sum(1 for result in results if result['result'] == 'updated'),
+        'results': results,
+    })
+
+
 # product
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated, IsTenantUser, IsStaffOrReadOnly]
 
+    # cache misses, auth and tenant lookups included; ?search adds the index lookup
+    query_budgets = {
+        'list': 5,
+        'retrieve': 4,
+    }
+
+    def get_throttle_scope(self):
+        if self.action == 'list' and self.request.query_params.get('search'):
+            return 'search'
+        return None
+
+    def requested_fields(self):
+        """``?fields=`` on reads; writes always return every field"""
+        if self.action not in ('list', 'retrieve'):
+            return None
+        if not hasattr(self, '_fields'):
+            self._fields = product_fields(self.request.query_params)
+        return self._fields
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
     # different query or filters
     def get_queryset(self):
+        tenant_id = self.request.user.tenant_id
+        if not hasattr(self, '_search_ids'):
+            # validators and the page both filter; ask the search index once
+            search = self.request.query_params.get('search', None)
+            self._search_ids = search_products(tenant_id, search) if search else None
+        queryset = filter_products(tenant_id, self.request.query_params, self._search_ids)
+        if self.action == 'list':
+            # list pages read .values() instead
+            return queryset
+        return trim_products(queryset, self.requested_fields())
 
-        tenant = self.request.user.tenant
-        queryset = Product.objects.filter(tenant=tenant)
-        
-        category = self.request.query_params.get('category', None)
-        if category:
-            queryset = queryset.filter(category=category)
-        
-        is_active = self.request.query_params.get('is_active', None)
-        if is_active is not None:
-            queryset = queryset.filter(is_active=is_active.lower() == 'true')
-        
-        search = self.request.query_params.get('search', None)
-        if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | Q(description__icontains=search)
+    def list(self, request, *args, **kwargs):
+        # parsed up front, so a bad ?fields= is a 400 before any query
+        fields = self.requested_fields()
+
+        def validators():
+            return conditional.list_validators(
+                self.filter_queryset(self.get_queryset()),
+                'product-list', request.user.tenant_id, conditional.request_params(request),
             )
-        
-        return queryset
+
+        def render():
+            # plain dicts from .values(): no model instances for a page of products
+            queryset = product_values(self.filter_queryset(self.get_queryset()), fields)
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(self.get_serializer().represent_values(page))
+
+        return catalog_cache.cached_response(request, 'product-list', render, validators=validators)
+
+    def retrieve(self, request, *args, **kwargs):
+        self.requested_fields()
+
+        def validators():
+            return conditional.object_validators(
+                self.get_queryset(), kwargs['pk'], 'product-detail', request.user.tenant_id,
+            )
+
+        return catalog_cache.cached_response(
+            request, 'product-detail', lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs),
+            validators=validators, **kwargs
+        )
 
     @action(detail=False, methods=['get'])
     def categories(self, request):
         """Get all product categories"""
-        tenant = request.user.tenant
-        categories = Product.objects.filter(tenant=tenant).values_list('category', flat=True).distinct()
-        return Response({'categories': list(categories)})
+        def render():
+            tenant_id = request.user.tenant_id
+            categories = Product.objects.filter(tenant_id=tenant_id).values_list('category', flat=True).distinct()
+            return Response({'categories': list(categories)})
+
+        return catalog_cache.cached_response(request, 'product-categories', render)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Products created, updated or deleted since ?since=<cursor>, for catalog sync"""
+        try:
+            limit = min(int(request.query_params.get('limit', sync.SYNC_PAGE_SIZE)), sync.SYNC_MAX_PAGE_SIZE)
+        except ValueError:
+            limit = sync.SYNC_PAGE_SIZE
+
+        try:
+            products, deleted, cursor, has_more = sync.changes_since(
+                request.user.tenant_id,
+                request.query_params.get('since'),
+                limit=max(limit, 1),
+                queryset=Product.objects.select_related('created_by'),
+            )
+        except sync.ExpiredCursor:
+            # deletes older than the tombstone retention are gone, so the client has to start over
+            return Response(
+                {'error': 'Cursor expired, sync again without since', 'code': 'resync'},
+                status=status.HTTP_410_GONE
+            )
+        except sync.InvalidCursor:
+            return Response(
+                {'error': 'Invalid cursor'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'changes': ProductSerializer(products, many=True).data,
+            'deleted': deleted,
+            'cursor': cursor,
+            'has_more': has_more,
+        })
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Upsert products by SKU from CSV or NDJSON, sent either as a multipart
+        ``file`` upload or as a raw text/csv or application/x-ndjson body
+        """
+        content_type = request.content_type.split(';')[0].strip()
+        if content_type in ('text/csv', 'application/x-ndjson'):
+            source = request.stream or []
+            file_format = 'csv' if content_type == 'text/csv' else 'ndjson'
+        else:
+            source = request.FILES.get('file')
+            if source is None:
+                return Response(
+                    {'error': 'Upload a CSV or NDJSON file as "file"'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            name = source.name.lower()
+            file_format = 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+        report = import_products(
+            request.user.tenant_id,
+            decode_lines(source),
+            file_format=file_format,
+            user_id=request.user.id,
+        )
+        return Response(report.as_dict())
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Catalog cache hit/miss counters for this process (superusers only)"""
+        if not request.user.is_superuser:
+            return Response(
+                {'error': 'Only superusers can view cache stats'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(catalog_cache.stats.snapshot())
 
 # orders
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsTenantUser, CanManageOrder]
 
+    # auth and tenant lookups included, so cold caches still fit
+    query_budgets = {
+        'list': 4,
+        'my_orders': 4,
+        'retrieve': 6,
+        # measured: 13 without an Idempotency-Key, 19 with a new one (claim,
+        # savepoints and stored response), 23 when taking over a stale claim
+        'create': 23,
+        'analytics': 6,
+        'claim': 6,
+        'bulk_update_status': 12,
+        'bulk_assign_staff': 8,
+    }
+
     def get_serializer_class(self):
         if self.action == 'list':
             return OrderListSerializer
         return OrderSerializer
 
+    def get_throttle_scope(self):
+        # heavy reads get their own, smaller buckets
+        if self.action in ('export', 'analytics'):
+            return self.action
+        return None
+
     # query and filters
     def get_queryset(self):
-        user = self.request.user
-        tenant = user.tenant
-        
-        queryset = Order.objects.filter(tenant=tenant).select_related(
+        queryset = self.get_scoped_queryset()
+        if self.action == 'list':
+            return queryset.select_related('customer').annotate(items_count=Count('items'))
+        return queryset.select_related(
             'customer', 'assigned_staff'
         ).prefetch_related('items__product')
-        
-        if user.role == 'customer':
-            queryset = queryset.filter(customer=user)
-        elif user.role == 'staff':
-            queryset = queryset.filter(
-                Q(assigned_staff=user) | Q(status='pending')
-            )
 
-        status_param = self.request.query_params.get('status', None)
-        if status_param:
-            queryset = queryset.filter(status=status_param)
-        
-        return queryset
+    def get_scoped_queryset(self):
+        """Orders this user may see, with the request's filters but no eager loading"""
+        return scope_orders(self.request.user, self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = conditional.list_validators(
+            self.get_scoped_queryset(), 'order-list', request.user.id, conditional.request_params(request),
+        )
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        return conditional.set_validators(response, etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        # the scoped queryset already limits reads to what CanManageOrder allows
+        etag, last_modified = conditional.object_validators(
+            self.get_scoped_queryset(), kwargs['pk'], 'order-detail', request.user.id,
+        )
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        response = super().retrieve(request, *args, **kwargs)
+        return conditional.set_validators(response, etag, last_modified)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        # retries sending the same Idempotency-Key get the first response back
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save()
 
+    def perform_destroy(self, instance):
+        checkout.delete_order(instance)
+
     @action(detail=True, methods=['post'])
     def assign_staff(self, request, pk=None):
         """Assign staff to an order (store owner only)"""
@@ -147,11 +441,10 @@ class OrderViewSet(viewsets.ModelViewSet):
         try:
             staff = User.objects.get(
                 id=staff_id, 
-                tenant=request.user.tenant, 
+                tenant_id=request.user.tenant_id, 
                 role='staff'
             )
-            order.assigned_staff = staff
-            order.save()
+            checkout.assign_staff(order, staff)
             
             serializer = self.get_serializer(order)
             return Response(serializer.data)
@@ -161,6 +454,39 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+    @action(detail=False, methods=['post'])
+    def claim(self, request):
+        """Claim the oldest unassigned pending orders (staff only). Body: count (default 1)"""
+        if request.user.role != 'staff':
+            return Response(
+                {'error': 'Only staff can claim orders'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            count = int(request.data.get('count', 1))
+        except (TypeError, ValueError):
+            count = 0
+        if not 1 <= count <= checkout.MAX_CLAIM:
+            return Response(
+                {'error': f'count must be between 1 and {checkout.MAX_CLAIM}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # the UPDATE returns everything the list serializer shows, so the claimed orders aren't read again
+        orders = checkout.claim_orders(request.user, count, annotations={
+            'items_count': Coalesce(Subquery(
+                OrderItem.objects.filter(order=OuterRef('pk')).values('order').annotate(n=Count('pk')).values('n')
+            ), 0),
+            'customer_name': Subquery(User.objects.filter(pk=OuterRef('customer_id')).annotate(
+                full_name=Trim(Concat('first_name', Value(' '), 'last_name'))
+            ).values('full_name')),
+        })
+        return Response({
+            'claimed': len(orders),
+            'orders': ClaimedOrderSerializer(orders, many=True).data,
+        })
+
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
         """Update order status"""
@@ -173,19 +499,230 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        order.status = new_status
-        order.save()
+        checkout.change_status(order, new_status)
         
         serializer = self.get_serializer(order)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def bulk_update_status(self, request):
+        """Set the status of many orders at once. Body: order_ids, status"""
+        if request.user.role not in ('store_owner', 'staff'):
+            return Response(
+                {'error': 'Only store owners and staff can update orders'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        order_ids = parse_order_ids(request.data)
+        if order_ids is None:
+            return Response(
+                {'error': f'order_ids must be a list of 1 to {checkout.MAX_BULK_ORDERS} order ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        new_status = request.data.get('status')
+        if new_status not in dict(Order.STATUS_CHOICES):
+            return Response(
+                {'error': 'Invalid status'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return bulk_response(checkout.bulk_change_status(request.user, order_ids, new_status))
+
+    @action(detail=False, methods=['post'])
+    def bulk_assign_staff(self, request):
+        """Assign one staff member to many orders (store owner only). Body: order_ids, staff_id"""
+        if request.user.role != 'store_owner':
+            return Response(
+                {'error': 'Only store owners can assign staff'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        order_ids = parse_order_ids(request.data)
+        if order_ids is None:
+            return Response(
+                {'error': f'order_ids must be a list of 1 to {checkout.MAX_BULK_ORDERS} order ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            staff = User.objects.get(
+                id=request.data.get('staff_id'),
+                tenant_id=request.user.tenant_id,
+                role='staff'
+            )
+        except (User.DoesNotExist, TypeError, ValueError):
+            return Response(
+                {'error': 'Staff member not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return bulk_response(checkout.bulk_assign_staff(request.user, order_ids, staff))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the tenant's orders as CSV or NDJSON (store owner only).
+        Filters: created_after, created_before (date or datetime), status.
+        """
+        if request.user.role != 'store_owner':
+            return Response(
+                {'error': 'Only store owners can export orders'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORTERS:
+            return Response(
+                {'error': 'export_format must be csv or ndjson'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # the body streams after the middleware has returned, so choose the database now
+        queryset = Order.objects.using(router.db_for_read(Order)).filter(tenant_id=request.user.tenant_id)
+        for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                parsed = parse_datetime(value) or parse_date(value)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                return Response(
+                    {'error': f'Invalid {param}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if not isinstance(parsed, datetime):
+                parsed = datetime.combine(parsed, time.min)
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            queryset = queryset.filter(**{lookup: parsed})
+
+        status_param = request.query_params.get('status')
+        if status_param:
+            queryset = queryset.filter(status=status_param)
+
+        exporter, content_type = EXPORTERS[export_format]
+        response = StreamingHttpResponse(
+            exporter(queryset.order_by('created_at', 'id')),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Sales per day, orders per status and top products from the rollup
+        tables (store owner only). Query: start, end (dates, last 30 days by
+        default), top.
+        """
+        if request.user.role != 'store_owner':
+            return Response(
+                {'error': 'Only store owners can view analytics'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        today = timezone.localdate()
+        dates = {}
+        for param, default in (('end', today), ('start', None)):
+            value = request.query_params.get(param)
+            try:
+                dates[param] = parse_date(value) if value else default
+            except ValueError:
+                dates[param] = None
+            if value and dates[param] is None:
+                return Response(
+                    {'error': f'Invalid {param}, expected YYYY-MM-DD'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        end = dates['end']
+        start = dates['start'] or end - timedelta(days=29)
+
+        if start > end or (end - start).days >= analytics.MAX_RANGE_DAYS:
+            return Response(
+                {'error': f'start must be on or before end and at most {analytics.MAX_RANGE_DAYS} days apart'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            top = min(max(int(request.query_params.get('top', 10)), 1), 100)
+        except ValueError:
+            top = 10
+
+        return Response(analytics.summary(request.user.tenant_id, start, end, top=top))
+
     @action(detail=False, methods=['get'])
     def my_orders(self, request):
         """Get current user's orders"""
         queryset = Order.objects.filter(
-            tenant=request.user.tenant,
-            customer=request.user
-        ).order_by('-created_at')
+            tenant_id=request.user.tenant_id,
+            customer_id=request.user.id
+        )
+
+        etag, last_modified = conditional.list_validators(
+            queryset, 'my-orders', request.user.id, conditional.request_params(request),
+        )
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        queryset = queryset.select_related('customer').annotate(items_count=Count('items')).order_by('-created_at')
         
-        serializer = OrderListSerializer(queryset, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = OrderListSerializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = OrderListSerializer(queryset, many=True)
+            response = Response(serializer.data)
+        return conditional.set_validators(response, etag, last_modified)
+
+# stock reservations
+class StockReservationViewSet(QueryBudgetMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                              mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Hold stock while a customer checks out: create a reservation, then
+    convert it into an order before it expires, or delete it to give the
+    stock back.
+    """
+    serializer_class = StockReservationSerializer
+    permission_classes = [IsAuthenticated, IsTenantUser]
+
+    query_budgets = {
+        'create': 9,
+        'retrieve': 5,
+        'destroy': 11,
+        'convert': 22,
+    }
+
+    def get_queryset(self):
+        queryset = StockReservation.objects.filter(
+            tenant_id=self.request.user.tenant_id,
+            customer_id=self.request.user.id
+        )
+        # only responses show product names
+        if self.action == 'retrieve':
+            return queryset.prefetch_related('items__product')
+        return queryset.prefetch_related('items')
+
+    def destroy(self, request, *args, **kwargs):
+        """Release the reservation's stock now"""
+        if not reservations.release(self.get_object()):
+            return Response(
+                {'error': 'Reservation not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def convert(self, request, pk=None):
+        """Place an order for the reserved items. Body: shipping_address, notes"""
+        reservation = self.get_object()
+        serializer = ReservationCheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        order = reservations.convert(reservation, **serializer.validated_data)
+        return Response(
+            OrderSerializer(order, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED
+        )